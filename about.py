@@ -84,9 +84,11 @@ class AboutDialog(wx.Dialog):
         self.gridSizer.Add((10, 0), 1, wx.EXPAND)
         
     def OnCodeboxLinkClick(self,event):
+        import webbrowser
         webbrowser.open(CODEBOX_URL)
     
     def OnDonateLinkClick(self,event):
+        import webbrowser
         webbrowser.open(DONATE_URL)
         
     def OnOkClick(self, event):
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+"""
+The AutoScale class chooses the scale of the graph (the rate, in kB/sec, that reaches the top) from
+the largest value currently visible. The maximum is kept up to date with a SlidingMax as values
+arrive and scroll off the graph, so nothing needs to be scanned again. The scale is rounded up to
+1, 2 or 5 times a power of ten, and only comes down again once the largest value is well below the
+current scale, so the graph doesn't have to be redrawn every time the maximum changes a little.
+"""
+
+from stats import SlidingMax
+
+STEPS = [1, 2, 5]       # scales are one of these multiplied by a power of ten
+MIN_SCALE = 10          # kB/sec, the scale never goes lower than this
+SHRINK_THRESHOLD = 0.3  # the scale is only reduced when the largest value is less than this fraction of it
+
+def RoundScale(kb):
+  # Return the smallest scale that is at least 'kb'
+    power = 1
+    while True:
+        for step in STEPS:
+            if step * power >= kb:
+                return max(MIN_SCALE, step * power)
+        power *= 10
+
+class AutoScale:
+    def __init__(self, bytesPerK):
+        self.bytesPerK = bytesPerK
+        self.max   = SlidingMax()
+        self.scale = None
+
+    def Clear(self):
+      # Forget the values, but keep the current scale until there are some new ones
+        self.max.Clear()
+
+    def Add(self, ts, value):
+        self.max.Add(ts, value)
+
+    def Update(self, oldest):
+      # Drop the values from before time 'oldest', and return True if the scale has changed
+        self.max.DropBefore(oldest)
+        kb = float(self.max.Max()) / self.bytesPerK
+        target = RoundScale(kb)
+        if self.scale == None or target > self.scale or (target < self.scale and kb < self.scale * SHRINK_THRESHOLD):
+            changed = target != self.scale
+            self.scale = target
+            return changed
+        return False
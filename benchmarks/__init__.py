@@ -0,0 +1,9 @@
+"""
+Benchmarks for the hot paths of the BitMeter OS desktop client. Run them from the top-level
+directory of the client, for example:
+
+    python -m benchmarks.gendb bench.db --duration 30d
+    python -m benchmarks.run --db bench.db --output results.json
+
+The rendering benchmarks need wx and a display, on a headless Linux box use 'xvfb-run'.
+"""
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+"""
+Generates a synthetic BitMeter OS database, with 'config' and 'data' tables laid out like the
+real thing and one row of data per second. Traffic follows a daily cycle with random bursts,
+and the same seed always produces the same data, so benchmark results can be compared.
+"""
+
+import sys
+import os
+import math
+import random
+import sqlite3
+import argparse
+
+DURATIONS = {'1h' : 3600, '1d' : 86400, '1w' : 7 * 86400, '30d' : 30 * 86400, '1y' : 365 * 86400}
+
+# All generated data ends at this time, rather than 'now', so that every run sees the same rows
+END_TS = 1700000000
+
+def GenerateRows(start, end, seed):
+  # Generate (ts,dl,ul) rows, busier during the day than at night, with occasional downloads of a few minutes
+    rnd = random.Random(seed)
+    burstEnd  = 0
+    burstRate = 0
+    for ts in range(start, end):
+        daily = 0.5 - 0.5 * math.cos(2 * math.pi * (ts % 86400) / 86400)
+        if ts >= burstEnd and rnd.random() < 0.001:
+            burstEnd  = ts + rnd.randint(10, 300)
+            burstRate = rnd.randint(200000, 2000000)
+        
+        dl = int(rnd.expovariate(1.0) * 20000 * daily)
+        ul = int(rnd.expovariate(1.0) * 5000 * daily)
+        if ts < burstEnd:
+            dl += burstRate
+            ul += burstRate // 20
+        yield (ts, dl, ul)
+
+def Generate(path, seconds, end=END_TS, seed=0):
+  # Create a new database at 'path' holding 'seconds' worth of data, ending at time 'end'
+    if os.path.exists(path):
+        os.remove(path)
+    
+    cn = sqlite3.connect(path)
+    cn.execute('create table config (key text, value text)')
+    cn.execute('create table data (ts integer, dr integer, dl integer, ul integer, ad text)')
+    cn.execute('create index idx_ts on data (ts)')
+    cn.execute("insert into config (key,value) values ('web.port','2605')")
+    
+    rows = ((ts, 1, dl, ul, 'eth0') for ts, dl, ul in GenerateRows(end - seconds, end, seed))
+    cn.executemany('insert into data (ts,dr,dl,ul,ad) values (?,?,?,?,?)', rows)
+    cn.commit()
+    cn.close()
+
+def ParseDuration(value):
+    if value in DURATIONS:
+        return DURATIONS[value]
+    elif value.isdigit():
+        return int(value)
+    raise argparse.ArgumentTypeError('Duration should be a number of seconds or one of ' + ', '.join(sorted(DURATIONS.keys())))
+
+def Main(args):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.gendb', description='Generate a synthetic BitMeter OS database')
+    parser.add_argument('path')
+    parser.add_argument('--duration', type=ParseDuration, default=DURATIONS['1d'], help='1h, 1d, 1w, 30d, 1y or a number of seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    opts = parser.parse_args(args)
+    
+    Generate(opts.path, opts.duration, seed=opts.seed)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(Main(sys.argv[1:]))
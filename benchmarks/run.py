@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+"""
+Runs the benchmarks against a synthetic database (see gendb.py) and saves the timings as JSON,
+so that the results from different commits can be compared with --compare. The rendering
+benchmarks draw onto an off-screen wx.MemoryDC, they are skipped if wx can't be imported.
+"""
+
+import sys
+import os
+import json
+import time
+import timeit
+import platform
+import argparse
+import subprocess
+
+from db import Db
+from samples import SampleBuffer
+from benchmarks import gendb
+import graph
+
+WIDTHS = [150, 1000, 4000]
+HEIGHT = 85
+SCALE  = 1000 * 1024
+TARGET_TIME = 0.2 # each timing run repeats the benchmark until it has taken at least this many seconds
+
+def Time(fn, repeat):
+  # Return the best and median times taken by a single call to 'fn'
+    number = 1
+    while True:
+        elapsed = timeit.timeit(fn, number=number)
+        if elapsed >= TARGET_TIME or number >= 1000000:
+            break
+        number *= 10
+
+    times = sorted(timeit.repeat(fn, number=number, repeat=repeat))
+    return {'best' : times[0] / number, 'median' : times[len(times) // 2] / number, 'calls' : number * repeat}
+
+def LoadBuffer(db, width, end):
+    buf = SampleBuffer(width + 1)
+    buf.Extend(db.GetData(end - width, end)[1])
+    return buf
+
+def BenchDb(dbPath, end, repeat, results):
+    db = Db(dbPath, 'bench.', readOnly=True)
+    for width in WIDTHS:
+        results['Db.GetData width=%d' % width] = Time(lambda: db.GetData(end - width, end), repeat)
+
+        def Tick():
+          # A normal timer tick, where one new row has arrived since the last one
+            db.lastTs = end - 2
+            db.dataVersion = None
+            db.GetNewData(end - width)
+        results['Db.GetNewData width=%d' % width] = Time(Tick, repeat)
+
+    def Unchanged():
+      # A timer tick where the BitMeter OS service hasn't written anything since the last one
+        db.lastTs = end - 1
+        db.GetNewData(end - WIDTHS[0])
+    Unchanged()
+    results['Db.GetNewData unchanged'] = Time(Unchanged, repeat)
+
+    for bucket in [60, 3600]:
+        def Zoomed():
+            db.ResetDelta()
+            db.GetNewBuckets(end - WIDTHS[0] * bucket, bucket)
+        results['Db.GetNewBuckets width=%d bucket=%d' % (WIDTHS[0], bucket)] = Time(Zoomed, repeat)
+
+def BenchPrefs(dbPath, repeat, results):
+    db = Db(dbPath, 'bench.')
+    prefs = {'dlcolour' : '(255,0,0)', 'ulcolour' : '(0,255,0)', 'olcolour' : '(255,255,0)', 'bgcolour' : '(255,255,255)',
+             'size' : '(150,85)', 'position' : '(100,100)', 'scale' : '1000', 'opacity' : '70', 'float' : 'True', 'clickthru' : 'False'}
+    db.SavePrefs(prefs)
+
+    results['Db.GetPrefs'] = Time(db.GetPrefs, repeat)
+
+    counter = [0]
+    def Save():
+      # Change one value each time, as happens when the window is moved
+        counter[0] += 1
+        db.SavePrefs({'position' : '(%d,100)' % counter[0]})
+    results['Db.SavePrefs'] = Time(Save, repeat)
+
+def BenchGeometry(dbPath, end, repeat, results):
+    db = Db(dbPath, 'bench.', readOnly=True)
+    for width in WIDTHS:
+        buf = LoadBuffer(db, width, end)
+        spans = buf.Spans()
+        results['graph.GetLinesPython width=%d' % width] = Time(lambda: graph.GetLinesPython(buf, spans, end, HEIGHT, SCALE), repeat)
+        if graph.GetNumpy() != None:
+            results['graph.GetLinesNumpy width=%d' % width] = Time(lambda: graph.GetLinesNumpy(buf, spans, end, HEIGHT, SCALE), repeat)
+
+def BenchRender(dbPath, end, repeat, results):
+    try:
+        import wx
+    except ImportError:
+        sys.stderr.write('wx is not available, skipping the rendering benchmarks\n')
+        return
+
+    app = wx.App(False)
+    db = Db(dbPath, 'bench.', readOnly=True)
+    pens = (wx.Pen(wx.Colour(255,255,0), 1), wx.Pen(wx.Colour(255,0,0), 1), wx.Pen(wx.Colour(0,255,0), 1))
+    for width in WIDTHS:
+        buf = LoadBuffer(db, width, end)
+        bitmap = wx.EmptyBitmap(width, HEIGHT)
+        dc = wx.MemoryDC(bitmap)
+        dc.SetBackground(wx.Brush(wx.Colour(255,255,255)))
+
+        def Draw():
+          # The same work that MyFrame.InitBuffer does for a full redraw
+            dc.Clear()
+            graph.DrawColumns(dc, buf, buf.Spans(), end, HEIGHT, SCALE, 1, pens)
+        results['DrawLines width=%d' % width] = Time(Draw, repeat)
+        dc.SelectObject(wx.NullBitmap)
+    app.Destroy()
+
+def GetCommit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD']).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def Compare(baselinePath, results):
+    baseline = json.load(open(baselinePath))['results']
+    for name in sorted(results.keys()):
+        if name in baseline:
+            before = baseline[name]['median']
+            after  = results[name]['median']
+            print('%-45s %10.6f %10.6f %6.2fx' % (name, before, after, before / after))
+
+def Main(args):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description='Benchmark the BitMeter OS desktop client')
+    parser.add_argument('--db', default='bench.db', help='synthetic database to use, it is generated if it does not exist')
+    parser.add_argument('--duration', type=gendb.ParseDuration, default=gendb.DURATIONS['1d'], help='amount of data to generate')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default=None, help='save the results to this JSON file')
+    parser.add_argument('--compare', default=None, help='compare the results with an earlier JSON file')
+    opts = parser.parse_args(args)
+
+    if not os.path.exists(opts.db):
+        gendb.Generate(opts.db, opts.duration)
+    end = gendb.END_TS
+
+    results = {}
+    BenchDb(opts.db, end, opts.repeat, results)
+    BenchPrefs(opts.db, opts.repeat, results)
+    BenchGeometry(opts.db, end, opts.repeat, results)
+    BenchRender(opts.db, end, opts.repeat, results)
+
+    for name in sorted(results.keys()):
+        print('%-45s %10.6f sec' % (name, results[name]['median']))
+
+    if opts.output:
+        report = {'commit' : GetCommit(), 'time' : int(time.time()), 'python' : platform.python_version(),
+                  'platform' : platform.platform(), 'results' : results}
+        with open(opts.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if opts.compare:
+        Compare(opts.compare, results)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(Main(sys.argv[1:]))
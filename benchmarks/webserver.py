@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""
+A stand-in for the BitMeter OS web interface, serving data recorded in a BitMeter OS database
+(or one made by gendb.py) so that sources.HttpSource can be tried out without a real server.
+The recorded data is replayed as if it were happening now: it is shifted forward in time so that
+the first half of it is in the past when the server starts, and the rest is served as the time
+it represents comes round. As with BitMeter OS, '/monitor?ts=<seconds>' returns the values recorded in
+the last 'ts' seconds, with each 'ts' given as the number of seconds before now. Run with:
+
+    python -m benchmarks.webserver bench.db --port 2605
+"""
+
+import sys
+import time
+import json
+import sqlite3
+import argparse
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+
+MAX_ROWS = 100000 # the most rows returned by a single request
+
+class MonitorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # so that connections are kept alive
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/monitor':
+            self.send_error(404)
+            return
+
+        seconds = int(parse_qs(url.query).get('ts', ['0'])[0])
+        now = int(time.time())
+        offset = self.server.offset
+        cn = sqlite3.connect(self.server.dbPath)
+        rows = cn.execute('select ts,dl,ul from data where ts >= ? and ts < ? order by ts limit ?',
+                          (now - seconds - offset, now - offset, MAX_ROWS)).fetchall()
+        cn.close()
+
+        body = json.dumps([{'ts' : now - (ts + offset), 'dl' : dl, 'ul' : ul} for ts, dl, ul in rows]).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+class MonitorServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, dbPath, verbose=False):
+        HTTPServer.__init__(self, address, MonitorHandler)
+        self.dbPath  = dbPath
+        self.verbose = verbose
+        cn = sqlite3.connect(dbPath)
+        oldest, newest = cn.execute('select min(ts),max(ts) from data').fetchone()
+        cn.close()
+        self.offset = int(time.time()) - ((oldest or 0) + (newest or 0)) // 2
+
+def Main(args):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.webserver', description='Serve recorded BitMeter OS data over HTTP')
+    parser.add_argument('db')
+    parser.add_argument('--port', type=int, default=2605)
+    parser.add_argument('--verbose', action='store_true')
+    opts = parser.parse_args(args)
+
+    server = MonitorServer(('localhost', opts.port), opts.db, opts.verbose)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(Main(sys.argv[1:]))
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+
+"""
+The BitmapPool class looks after the off-screen bitmaps that the graph is drawn on. Bitmaps are
+allocated a little larger than they need to be, so when the window is resized by a small amount
+the existing ones can be used again instead of allocating new ones. Only the top-left part of
+each bitmap, the size of the graph, is drawn on.
+"""
+
+import wx
+
+HEADROOM = 64 # bitmap sizes are rounded up to the next multiple of this many pixels
+
+def RoundUp(n):
+    return max(1, (n + HEADROOM - 1) // HEADROOM * HEADROOM)
+
+class BitmapPool:
+    def __init__(self, count):
+        self.count   = count
+        self.bitmaps = []
+        self.width   = 0
+        self.height  = 0
+
+    def Get(self, width, height):
+      # Return a list of 'count' bitmaps that are at least width x height. If the ones we have are too small, or
+      # much bigger than they need to be (so the window has shrunk a lot), then new ones are allocated.
+        if width > self.width or height > self.height or RoundUp(width) * RoundUp(height) * 4 < self.width * self.height:
+            self.width  = RoundUp(width)
+            self.height = RoundUp(height)
+            self.bitmaps = [wx.EmptyBitmap(self.width, self.height) for i in range(self.count)]
+        return list(self.bitmaps)
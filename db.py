@@ -5,16 +5,105 @@ The Db class manages access to the local BitMeter OS database, and provides
 convenience methods for retrieving bandwidth data and reading/writing user
 preference values. User preferences are stored in the 'config' table, names
 are prefixed to distinguish them from configuration values used by other clients. 
+
+Bandwidth data is read through Db objects opened with readOnly=True, whose connections are
+tuned for frequent small queries against a database that the BitMeter OS service is
+writing to every second.
 """
 
 import sqlite3
+import os
+import sys
+
+BUSY_TIMEOUT = 2.0               # seconds to wait for the BitMeter OS service to release its lock
+MMAP_SIZE    = 64 * 1024 * 1024  # bytes of the database file to memory-map (read-only connections)
+CACHE_SIZE   = -8192             # negative values are in KiB, so this is an 8MB page cache
+
+# The number of rows fetched from sqlite at a time by IterData
+CHUNK_SIZE = 1000
+
+# Statements are always run with the same text so that sqlite3 can re-use them from its cache
+DATA_SQL   = 'select ts,dl,ul from data where ts >= ? order by ts'
+BUCKET_SQL = 'select ts / ? * ?,sum(dl),sum(ul),max(dl),max(ul) from data where ts >= ? group by ts / ? order by 1'
+RANGE_SQL        = 'select ts,dl,ul from data where ts >= ? and ts < ? order by ts'
+RANGE_BUCKET_SQL = 'select ts / ? * ?,sum(dl),sum(ul),max(dl),max(ul) from data where ts >= ? and ts < ? group by ts / ? order by 1'
+
+# Changes each time another connection commits to the database, older versions of sqlite don't support it
+VERSION_SQL = 'pragma data_version'
+MAX_TS_SQL  = 'select max(ts) from data'
+
+def GetDefaultPaths():
+  # Return a list of BitMeter OS database locations. This is normally just the local database, but a list of paths
+  # (separated with ':' or ';' depending on the platform) can be given in the BITMETER_DB environment variable.
+    dbPaths = os.getenv('BITMETER_DB')
+    if dbPaths:
+        return [dbPath for dbPath in dbPaths.split(os.pathsep) if dbPath]
+    elif sys.platform == 'win32':
+        return ["/Documents and Settings/All Users/Application Data/BitMeterOS/bitmeter.db"]
+    elif sys.platform == 'darwin':
+        return ["/Library/Application Support/BitMeter/bitmeter.db"]
+    elif sys.platform.startswith('linux'):
+        return ["/var/lib/bitmeter/bitmeter.db"]
+    else:
+        return [None]
+
+def GetDefaultPath():
+  # Return the location of the main BitMeter OS database, where the user preferences are stored
+    return GetDefaultPaths()[0]
 
 class Db:
-    def __init__(self, dbPath, prefsPrefix):
-        self.cn             = sqlite3.connect(dbPath)
+    def __init__(self, dbPath, prefsPrefix, readOnly=False):
+        self.dbPath         = dbPath
+        self.readOnly       = readOnly
         self.prefsPrefix    = prefsPrefix
         self.prefsPrefixLen = len(self.prefsPrefix)
+        self.lastTs         = None
+        self.dataVersion    = None
+        
+        if readOnly:
+            self.cn = self.ConnectReadOnly()
+        else:
+            self.cn = sqlite3.connect(dbPath, timeout=BUSY_TIMEOUT)
+        
+    def ConnectReadOnly(self):
+      # Readers may be passed between threads (see sources.MultiSource) but are never used by two at once.
+      # urllib is imported here rather than at the top, because urllib.request is slow to import.
+        try:
+            from urllib import pathname2url
+        except ImportError:
+            from urllib.request import pathname2url
+        uri = 'file:' + pathname2url(self.dbPath) + '?mode=ro'
+        try:
+            cn = sqlite3.connect(uri, timeout=BUSY_TIMEOUT, uri=True, check_same_thread=False)
+        except TypeError:
+          # This version of sqlite3 doesn't understand URIs (Python 2), query_only will still stop us writing anything,
+          # but sqlite would create a missing file, so we fail in the same way as opening it with mode=ro does
+            if not os.path.exists(self.dbPath):
+                raise sqlite3.OperationalError('unable to open database file')
+            cn = sqlite3.connect(self.dbPath, timeout=BUSY_TIMEOUT, check_same_thread=False)
         
+        cn.execute('pragma query_only=1')
+        cn.execute('pragma mmap_size=%d' % MMAP_SIZE)
+        cn.execute('pragma cache_size=%d' % CACHE_SIZE)
+        return cn
+        
+    def Close(self):
+        self.cn.close()
+        
+    def CreateConfigTable(self):
+      # Used when we are storing preferences in a new database of our own
+        with self.cn:
+            self.cn.execute('create table if not exists config (key text, value text)')
+        
+    def UsesDataIndex(self):
+      # Check that sqlite will find recent rows in the 'data' table with an index search, rather than scanning the whole table
+        plan = self.cn.execute('explain query plan ' + DATA_SQL, (0,)).fetchall()
+        for row in plan:
+            detail = row[-1].upper()
+            if detail.startswith('SCAN') and 'USING' not in detail:
+                return False
+        return True
+
     def GetConfigValue(self, name, default=None):
       # Return a global (ie not specific to this client) config value
         result = self.cn.cursor().execute("select value from config where key=?", (name,)).fetchone()
@@ -26,7 +115,7 @@ class Db:
     def GetPrefs(self):
       # Return a dictionary containing all the user preference values stored for this application
         c = self.cn.cursor()
-        c.execute("select key,value from config where key like '" + self.prefsPrefix + "%'")
+        c.execute("select key,value from config where key like ?", (self.prefsPrefix + '%',))
         
         prefs={}
         for row in c:
@@ -37,30 +126,20 @@ class Db:
         return prefs
 
     def SavePrefs(self, vals):
-      # Store the user preference values contained in the vals dictionary in the database
-        preModPrefs = self.GetPrefs()
+      # Store the user preference values contained in the vals dictionary in the database. Existing rows are
+      # updated and missing ones inserted, all in a single transaction.
+        rows = [(self.prefsPrefix + k, v) for k, v in vals.items()]
         
-        c = self.cn.cursor()
-        for k,v in vals.iteritems():
-            keyWithPrefix = self.prefsPrefix + k
-            originalValue = preModPrefs.get(k)
-            if originalValue == None:
-              # This is a new value, so insert a new row
-                t = (keyWithPrefix,v,)
-                c.execute("insert into config (key,value) values (?,?)", t)
-            elif originalValue != v:
-              # This is an existing value that has been changed, update the appropriate row
-                t = (v,keyWithPrefix,)
-                c.execute("update config set value=? where key=?", t)
-                
-        self.cn.commit()        
-        c.close()
+        with self.cn:
+            self.cn.executemany("update config set value=? where key=?", [(v, k) for k, v in rows])
+            self.cn.executemany("insert into config (key,value) select ?,? where not exists (select 1 from config where key=?)",
+                                [(k, v, k) for k, v in rows])
                     
     def GetData(self, t, now):
       # Return a list of lists, representing recent bandwidth data.
       # All data appearing on or after time 't' will be returned
         c = self.cn.cursor()
-        c.execute('select ts,dl,ul from data where ts >=' + str(t) + ' order by ts')
+        c.execute(DATA_SQL, (t,))
         
         data=[]
         nowData = [0,0]
@@ -75,3 +154,92 @@ class Db:
         
         return [nowData, data]
 
+    def HasChanged(self):
+      # Return False if nothing has been written to the database since the last call, this is much cheaper than
+      # looking for new rows. If 'pragma data_version' isn't supported we compare the newest timestamp instead.
+        row = self.cn.execute(VERSION_SQL).fetchone()
+        if row == None:
+            row = self.cn.execute(MAX_TS_SQL).fetchone()
+        
+        changed = row[0] != self.dataVersion
+        self.dataVersion = row[0]
+        return changed
+
+    def ResetDelta(self):
+      # Forget the position reached by GetNewData, the next call will return the whole window again
+        self.lastTs = None
+        self.dataVersion = None
+
+    def GetDelta(self):
+      # Return the position reached by GetNewData/GetNewBuckets, so that it can be restored later with SetDelta
+        return self.lastTs
+
+    def SetDelta(self, delta):
+        self.lastTs = delta
+        self.dataVersion = None
+
+    def GetNewData(self, t):
+      # Return a list of the rows that have appeared since the previous call to this method. If there
+      # was no previous call (or it was too long ago) then all the data on or after time 't' is returned.
+        if self.lastTs == None or self.lastTs < t:
+            start = t
+        else:
+            start = self.lastTs + 1
+
+        if not self.HasChanged():
+          # The BitMeter OS service hasn't written anything since last time
+            return []
+
+        c = self.cn.cursor()
+        c.execute(DATA_SQL, (start,))
+        rows = c.fetchall()
+        c.close()
+
+        if rows:
+            self.lastTs = rows[-1][0]
+
+        return rows
+
+    def GetNewBuckets(self, t, bucket):
+      # As GetNewData, but the rows are grouped into buckets of 'bucket' seconds by sqlite. Each row returned is
+      # (bucket start,dl total,ul total,dl max,ul max). The newest bucket may still be filling up, so it is
+      # returned again by the next call.
+        start = t // bucket * bucket
+        if self.lastTs != None and self.lastTs >= start:
+            start = self.lastTs
+
+        if not self.HasChanged():
+            return []
+
+        c = self.cn.cursor()
+        c.execute(BUCKET_SQL, (bucket, bucket, start, bucket))
+        rows = c.fetchall()
+        c.close()
+
+        if rows:
+            self.lastTs = rows[-1][0]
+
+        return rows
+
+    def GetRange(self, t0, t1, bucket=None):
+      # As IterData, but returns a list, so the Db can be used as a data source for history.py
+        return list(self.IterData(t0, t1, bucket))
+
+    def IterData(self, t0, t1, bucket=None, chunkSize=CHUNK_SIZE):
+      # Generate the rows with timestamps from t0 up to (but not including) t1, optionally grouped into buckets as
+      # for GetNewBuckets. Rows are fetched a chunk at a time, so any amount of data can be read without using lots of memory.
+        c = self.cn.cursor()
+        if bucket:
+            c.execute(RANGE_BUCKET_SQL, (bucket, bucket, t0, t1, bucket))
+        else:
+            c.execute(RANGE_SQL, (t0, t1))
+        
+        try:
+            while True:
+                rows = c.fetchmany(chunkSize)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            c.close()
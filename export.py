@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""
+Exports bandwidth data from the BitMeter OS database as CSV or JSON lines, without starting
+the GUI (this module doesn't import wx). Rows are streamed from the database a chunk at a time
+and written out as they arrive, so large exports run in a constant amount of memory. Run with:
+
+    python main.py export --from 2024-01-01 --to 2024-02-01 --format csv --bucket 3600
+"""
+
+import io
+import os
+import sys
+import time
+import csv
+import json
+import argparse
+import gettext
+from db import Db, GetDefaultPath
+
+_=gettext.gettext
+
+TIME_FORMATS = ['%Y-%m-%d', '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S']
+
+def ParseTime(value):
+  # Accept either a unix timestamp or a local date/time in one of the TIME_FORMATS
+    if value.isdigit():
+        return int(value)
+    for fmt in TIME_FORMATS:
+        try:
+            return int(time.mktime(time.strptime(value, fmt)))
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(_('Unrecognised date/time') + ': ' + value)
+
+def GetColumns(bucket):
+  # When rows are grouped into buckets, dl/ul are the totals for the bucket and the maximum per-second values are added
+    if bucket:
+        return ['ts', 'dl', 'ul', 'dl_max', 'ul_max']
+    else:
+        return ['ts', 'dl', 'ul']
+
+def WriteCsv(rows, columns, out):
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+def WriteJsonLines(rows, columns, out):
+    count = 0
+    for row in rows:
+        out.write(json.dumps(dict(zip(columns, row))))
+        out.write('\n')
+        count += 1
+    return count
+
+WRITERS = {'csv' : WriteCsv, 'jsonl' : WriteJsonLines}
+
+def OpenOutput(path):
+  # csv writes its own '\r\n' line endings, so they mustn't be translated again (which gives '\r\r\n' on Windows).
+  # Python 2 needs a binary file for that, and Python 3 a text file opened with newline=''.
+    if path == None:
+        if hasattr(sys.stdout, 'reconfigure'):
+            sys.stdout.reconfigure(newline='')
+        return sys.stdout
+    elif sys.version_info[0] < 3:
+        return open(path, 'wb')
+    else:
+        return io.open(path, 'w', newline='')
+
+def Main(args):
+    parser = argparse.ArgumentParser(prog='main.py export', description=_('Export BitMeter OS bandwidth data'))
+    parser.add_argument('--db', default=GetDefaultPath(), help=_('path of the BitMeter OS database'))
+    parser.add_argument('--from', dest='start', type=ParseTime, default=0, help=_('export data on or after this time'))
+    parser.add_argument('--to', dest='end', type=ParseTime, default=None, help=_('export data before this time'))
+    parser.add_argument('--format', choices=sorted(WRITERS.keys()), default='csv')
+    parser.add_argument('--bucket', type=int, default=None, help=_('group the data into buckets of this many seconds'))
+    parser.add_argument('--output', default=None, help=_('file to write to, by default the data is written to stdout'))
+    parser.add_argument('--stats', action='store_true', help=_('report the number of rows written, and how quickly'))
+    opts = parser.parse_args(args)
+
+    if opts.end == None:
+        opts.end = int(time.time()) + 1
+    if opts.bucket != None and opts.bucket < 1:
+        parser.error(_('--bucket must be at least 1'))
+    if not opts.db or not os.path.exists(opts.db):
+        parser.error(_('Database file not found') + ': ' + str(opts.db))
+
+    db = Db(opts.db, '', readOnly=True)
+    rows = db.IterData(opts.start, opts.end, opts.bucket)
+
+    out = OpenOutput(opts.output)
+
+    startTime = time.time()
+    try:
+        count = WRITERS[opts.format](rows, GetColumns(opts.bucket), out)
+    finally:
+        if opts.output:
+            out.close()
+    elapsed = time.time() - startTime
+
+    if opts.stats:
+        sys.stderr.write(_('%d rows in %.2f seconds (%d rows/sec)') % (count, elapsed, count / max(elapsed, 0.001)) + '\n')
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(Main(sys.argv[1:]))
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+
+"""
+Helpers for the files that the client writes for itself or for other programs to read.
+"""
+
+import os
+
+def WriteAtomically(path, data):
+  # Write 'data' (bytes, or text which is encoded as UTF-8) to a temporary file and then rename it, so that a crash part
+  # way through can't leave a broken file, and anything reading the file never sees half of it
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'wb') as f:
+        f.write(data)
+    if hasattr(os, 'replace'):
+        os.replace(tmpPath, path)
+    else:
+      # Python 2 can't rename over an existing file on Windows
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmpPath, path)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+"""
+Works out the lines that make up the bandwidth graph. Each second of data is drawn as a vertical
+column, the 'overlap' colour from the bottom of the graph up to the smaller of the dl/ul values,
+and then the dl or ul colour above that. When the graph is zoomed out each column covers a
+'bucket' of several seconds, and 'now' is the end of the newest bucket. The lines are returned
+in lists, so that they can be drawn with a few calls to DrawLineList rather than a separate
+DrawLine for each one. NumPy is used to do the calculations if it is installed, if not we fall
+back to a plain Python loop. Both produce exactly the same lines.
+"""
+
+import metrics
+
+# NumPy takes a while to import, so it isn't imported until the first time the lines are worked out (see GetNumpy)
+numpy = None
+numpyChecked = False
+
+def GetNumpy():
+  # Return the numpy module, or None if it isn't installed
+    global numpy, numpyChecked
+    if not numpyChecked:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+        numpyChecked = True
+    return numpy
+
+def GetLines(buf, spans, now, height, maxBytes, bucket=1):
+  # Return lists of overlap, download and upload lines for the values in the SampleBuffer 'buf' found
+  # in the given index ranges. 'maxBytes' is the value that reaches the top of the graph.
+    if GetNumpy() != None:
+        return GetLinesNumpy(buf, spans, now, height, maxBytes, bucket)
+    else:
+        return GetLinesPython(buf, spans, now, height, maxBytes, bucket)
+
+def GetLinesPython(buf, spans, now, height, maxBytes, bucket=1):
+    olLines, dlLines, ulLines = [], [], []
+    tsCol, dlCol, ulCol = buf.ts, buf.dl, buf.ul
+
+    for start, end in spans:
+        for i in range(start, end):
+            dl = dlCol[i]
+            ul = ulCol[i]
+
+            x = (now - tsCol[i]) // bucket - 1
+            yDl = height - dl * height // maxBytes
+            yUl = height - ul * height // maxBytes
+
+            if dl < ul:
+                olLines.append((x, height, x, yDl))
+                ulLines.append((x, yDl, x, yUl))
+            else:
+                olLines.append((x, height, x, yUl))
+                dlLines.append((x, yUl, x, yDl))
+
+    return olLines, dlLines, ulLines
+
+def GetLinesNumpy(buf, spans, now, height, maxBytes, bucket=1):
+    if not spans:
+        return [], [], []
+    numpy = GetNumpy()
+
+  # These are views onto the SampleBuffer arrays, nothing is copied until we concatenate the spans
+    dtype = numpy.dtype(buf.ts.typecode)
+    tsCol = numpy.frombuffer(buf.ts, dtype)
+    dlCol = numpy.frombuffer(buf.dl, dtype)
+    ulCol = numpy.frombuffer(buf.ul, dtype)
+
+  # The arithmetic is done in 64 bits, the arrays may only be 32 bits ('l' on Windows) and dl * height can overflow that
+    ts = numpy.concatenate([tsCol[start:end] for start, end in spans]).astype(numpy.int64)
+    dl = numpy.concatenate([dlCol[start:end] for start, end in spans]).astype(numpy.int64)
+    ul = numpy.concatenate([ulCol[start:end] for start, end in spans]).astype(numpy.int64)
+
+    x   = (now - ts) // bucket - 1
+    y0  = numpy.empty_like(x)
+    y0.fill(height)
+    yDl = height - dl * height // maxBytes
+    yUl = height - ul * height // maxBytes
+
+    ulOnTop = dl < ul
+    dlOnTop = ~ulOnTop
+
+    olLines = numpy.column_stack((x, y0, x, numpy.where(ulOnTop, yDl, yUl)))
+    ulLines = numpy.column_stack((x[ulOnTop], yDl[ulOnTop], x[ulOnTop], yUl[ulOnTop]))
+    dlLines = numpy.column_stack((x[dlOnTop], yUl[dlOnTop], x[dlOnTop], yDl[dlOnTop]))
+
+    return olLines.tolist(), dlLines.tolist(), ulLines.tolist()
+
+def GetPeakColour(colour, background):
+  # Peak values are drawn in a paler version of the colour, half way between it and the background. Colours are (r,g,b) tuples.
+    return tuple([(c + bg) // 2 for c, bg in zip(colour, background)])
+
+def DrawGraph(dc, seriesList, now, height, maxBytes, bucket, pens, peakPens, since=None):
+  # Draw the values in a list of samples.Series, optionally only those on or after time 'since'. If there are
+  # several then each one gets an equal strip of the graph, one above the other. This is used both for the graph
+  # on the screen and by sparkline.py, 'dc' can be a wx.DC or anything else with the same drawing methods.
+    h = height // len(seriesList)
+    for i, series in enumerate(seriesList):
+        if since == None:
+            spans = series.data.Spans()
+        else:
+            spans = series.data.SpansSince(since)
+
+        dc.SetDeviceOrigin(0, i * h)
+        if bucket > 1:
+          # Draw the peak values first, the averages will be drawn over the bottom part of each column
+            DrawColumns(dc, series.peaks, spans, now, h, maxBytes, bucket, peakPens)
+        DrawColumns(dc, series.data, spans, now, h, maxBytes, bucket, pens)
+    dc.SetDeviceOrigin(0, 0)
+
+def DrawColumns(dc, buf, spans, now, height, maxBytes, bucket, pens):
+  # Draw the columns for the given values onto 'dc', 'pens' holds the overlap, download and upload pens
+    with metrics.Timer('graph.GetLines'):
+        olLines, dlLines, ulLines = GetLines(buf, spans, now, height, maxBytes, bucket)
+    dc.DrawLineList(olLines, pens[0])
+    dc.DrawLineList(dlLines, pens[1])
+    dc.DrawLineList(ulLines, pens[2])
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+"""
+Lets the user scroll the graph back through history. The history view is made up of tiles that are
+TILE_WIDTH columns wide, read on a background thread and drawn once onto bitmaps that are kept in an
+LRU cache, so panning is mostly a matter of blitting tiles that have already been drawn.
+"""
+
+import sqlite3
+import threading
+from collections import OrderedDict
+from samples import Series
+from hub import Stack
+import metrics
+import graph
+
+TILE_WIDTH       = 128 # columns in each tile
+CACHE_TILES      = 64  # the most tiles kept in each cache
+PREFETCH         = 2   # tiles either side of the visible ones that are read ahead of time
+REFRESH_INTERVAL = 5   # seconds between reads of a tile that hadn't finished when it was read
+LATE_SECONDS     = 2   # a tile is only finished once it ended this long ago, in case some of its data arrives late
+
+class LruCache:
+  # A dictionary holding at most 'size' items, when it is full the one that was used least recently is dropped
+    def __init__(self, size):
+        self.size  = size
+        self.items = OrderedDict()
+
+    def __len__(self):
+        return len(self.items)
+
+    def Get(self, key):
+        value = self.items.pop(key, None)
+        if value != None:
+            self.items[key] = value
+        return value
+
+    def Put(self, key, value):
+        self.items.pop(key, None)
+        self.items[key] = value
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+    def Discard(self, predicate):
+      # Remove every item whose key matches
+        for key in [key for key in self.items if predicate(key)]:
+            del self.items[key]
+
+class TileLoader(threading.Thread):
+  # Reads the rows for tiles on a background thread and calls 'notify' when there are some to be collected with Take. Only the
+  # latest list of wanted tiles is kept, so when the user pans quickly the ones they have already scrolled past aren't read.
+    def __init__(self, openSource, clock, notify):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.openSource = openSource
+        self.clock      = clock
+        self.notify     = notify
+        self.condition  = threading.Condition()
+        self.wanted     = []
+        self.loading    = None
+        self.loaded     = []
+        self.stopped    = False
+
+    def Request(self, wanted):
+      # Replace the list of (start,bucket) tiles to read, the first ones are read first
+        with self.condition:
+            done = [key for key, rows, fetched in self.loaded]
+            self.wanted = [key for key in wanted if key != self.loading and key not in done]
+            self.condition.notify()
+
+    def Take(self):
+      # Return a list of ((start,bucket), rows, time read) for the tiles read since the last call
+        with self.condition:
+            loaded, self.loaded = self.loaded, []
+            return loaded
+
+    def Stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    def run(self):
+        source = None
+        while True:
+            with self.condition:
+                while not self.wanted and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    break
+                self.loading = self.wanted.pop(0)
+
+            start, bucket = self.loading
+            try:
+                if source == None:
+                    source = self.openSource()
+                fetched = int(self.clock())
+                rows = source.GetRange(start, start + TILE_WIDTH * bucket, bucket if bucket > 1 else None)
+            except (sqlite3.Error, EnvironmentError):
+              # The database may be locked by the BitMeter OS service, the tile will be asked for again when it is next drawn
+                rows = None
+
+            with self.condition:
+                if rows != None:
+                    self.loaded.append((self.loading, rows, fetched))
+                self.loading = None
+                stopped = self.stopped
+            if rows != None and not stopped:
+                self.notify()
+
+        if source:
+            source.Close()
+
+class History:
+  # The tiles for one graph window. 'openSource' and 'hosts' are as for the Hub, and 'notify' is called (on the loader
+  # thread) when new rows have arrived, the window should then call Collect on the UI thread. The rows are cached by
+  # (start, bucket size) and the bitmaps by (start, bucket size, height, style), where the style is the scale, the
+  # colours and whether the hosts are stacked. So when the style changes the tiles are drawn again without re-reading them.
+    def __init__(self, openSource, hosts, clock, notify):
+        self.hosts  = hosts
+        self.rows   = LruCache(CACHE_TILES)
+        self.tiles  = LruCache(CACHE_TILES)
+        self.style  = None
+        self.loader = TileLoader(openSource, clock, notify)
+        self.loader.start()
+
+    def Stop(self):
+        self.loader.Stop()
+
+    def SetStyle(self, maxBytes, colours, stacked, pens, peakPens):
+      # Called whenever the scale or colours might have changed. 'colours' is a tuple of the (r,g,b) overlap, download,
+      # upload and background colours. Only if something has really changed are the old bitmaps thrown away.
+        style = (maxBytes, colours, bool(stacked))
+        self.pens     = pens
+        self.peakPens = peakPens
+        if style != self.style:
+            self.style = style
+            self.tiles.Discard(lambda key: key[3] != style)
+
+    def Collect(self):
+      # Store the rows that have been read, returns True if there were any. The bitmaps drawn from the old rows are thrown away.
+        loaded = self.loader.Take()
+        for key, rows, fetched in loaded:
+            self.rows.Put(key, (rows, fetched))
+            self.tiles.Discard(lambda tileKey: tileKey[:2] == key)
+        return bool(loaded)
+
+    def Draw(self, dc, end, width, height, bucket, now):
+      # Blit the tiles for a graph 'width' columns wide with its left-hand edge at time 'end' onto 'dc', which has already
+      # been cleared to the background colour. Any tiles we don't have yet, and the ones either side, are asked for.
+      # wx is imported here and in DrawTile rather than at the top, so the caches can be used without a display
+        import wx
+        tileSpan = TILE_WIDTH * bucket
+        newest = (end - 1) // tileSpan
+        oldest = (end - width * bucket) // tileSpan
+
+        tileDc = wx.MemoryDC()
+        for index in range(newest, oldest - 1, -1):
+            start = index * tileSpan
+            bitmap = self.GetTile(start, bucket, height)
+            if bitmap != None:
+                tileDc.SelectObject(bitmap)
+                dc.Blit((end - start - tileSpan) // bucket, 0, TILE_WIDTH, height, tileDc, 0, 0)
+        tileDc.SelectObject(wx.NullBitmap)
+
+      # The visible tiles are read first, newest first, and then the ones either side
+        indexes = list(range(newest, oldest - 1, -1))
+        for i in range(1, PREFETCH + 1):
+            indexes += [oldest - i, newest + i]
+        wanted = [(index * tileSpan, bucket) for index in indexes if index * tileSpan <= now]
+        self.loader.Request([key for key in wanted if self.NeedsRead(key, now)])
+
+    def NeedsRead(self, key, now):
+      # A tile needs reading if we don't have its rows, or it hadn't finished when it was read and that was a while ago
+        start, bucket = key
+        loaded = self.rows.Get(key)
+        if loaded == None:
+            return True
+        rows, fetched = loaded
+        return fetched < start + TILE_WIDTH * bucket + LATE_SECONDS and now - fetched >= REFRESH_INTERVAL
+
+    def GetTile(self, start, bucket, height):
+      # Return the bitmap for a tile, drawing it if necessary, or None if its rows haven't been read yet
+        key = (start, bucket, height, self.style)
+        bitmap = self.tiles.Get(key)
+        if bitmap == None:
+            loaded = self.rows.Get((start, bucket))
+            if loaded == None:
+                return None
+            bitmap = self.DrawTile(start, bucket, height, loaded[0], loaded[1])
+            self.tiles.Put(key, bitmap)
+        return bitmap
+
+    def DrawTile(self, start, bucket, height, rows, fetched):
+      # Draw a tile in the same way as the graph window draws the live graph, with the newest column on the left.
+      # With several hosts the rows are tagged with the host index, as they are for the hub.
+        import wx
+        maxBytes, colours, stacked = self.style
+        if self.hosts > 1 and stacked:
+            rows = Stack(rows)
+        if self.hosts > 1 and not stacked:
+            seriesList = [Series(TILE_WIDTH + 1) for host in range(self.hosts)]
+        else:
+            seriesList = [Series(TILE_WIDTH + 1)]
+
+        for row in rows:
+            series = seriesList[row[-1] if len(seriesList) > 1 else 0]
+            if bucket == 1:
+                series.data.Append(row[0], row[1], row[2])
+            else:
+                series.AddBuckets([row], fetched, bucket)
+
+        with metrics.Timer('history.DrawTile'):
+            bitmap = wx.EmptyBitmap(TILE_WIDTH, height)
+            dc = wx.MemoryDC(bitmap)
+            dc.SetBackground(wx.Brush(wx.Colour(*colours[3])))
+            dc.Clear()
+            graph.DrawGraph(dc, seriesList, start + TILE_WIDTH * bucket, height, maxBytes, bucket, self.pens, self.peakPens)
+            dc.SelectObject(wx.NullBitmap)
+        return bitmap
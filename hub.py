@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+
+"""
+The Hub reads new bandwidth data on a background thread and shares it between all the open graph
+windows, so each extra graph only adds the cost of drawing it. Each window subscribes to the hub
+and gets a HubView with its own width, zoom level and choice of stacking the hosts together.
+"""
+
+import sys
+import threading
+import traceback
+import time
+import heapq
+import bisect
+import sqlite3
+import metrics
+from sources import MakeBuckets, AddRows
+
+TICK_OFFSET=0.25 # seconds after each whole second that the hub wakes up, by then the service has written the previous second
+STORE_SLACK=60 # old rows are only dropped from the store once there are this many seconds of them, so we don't do it every tick
+
+def MakeHostBuckets(rows, bucket, hosts):
+  # As sources.MakeBuckets, but when there are several hosts each one gets its own buckets, tagged with the host index
+    if hosts == 1:
+        return MakeBuckets(rows, bucket)
+
+    rowsByHost = [[] for host in range(hosts)]
+    for row in rows:
+        rowsByHost[row[-1]].append(row[:-1])
+    tagged = [[row + (host,) for row in MakeBuckets(hostRows, bucket)] for host, hostRows in enumerate(rowsByHost)]
+    return list(heapq.merge(*tagged))
+
+def Stack(rows):
+  # Add together the tagged rows for the same time from all the hosts, as MultiSource does when it is combining them
+    stacked = []
+    for row in rows:
+        row = row[:-1]
+        if stacked and stacked[-1][0] == row[0]:
+            stacked[-1] = AddRows(stacked[-1], row)
+        else:
+            stacked.append(row)
+    return stacked
+
+def GetCutoff(start, bucket):
+  # The store holds every second on or after 'start', so it holds all of the buckets that start on or after this time
+    return -(-start // bucket) * bucket
+
+class TickScheduler:
+  # Wakes up at 'offset' seconds past each multiple of 'interval' in real time, rather than 'interval' after the last tick
+  # finished, so the hub doesn't drift against the BitMeter OS service writing a row each second or look just before the
+  # newest row has been written. Ticks that were missed (say the computer was asleep) are counted, and the next tick
+  # catches up with everything since the last one in a single query.
+    def __init__(self, interval, offset):
+        self.interval = interval
+        self.offset   = offset % interval
+        self.due      = None
+        self.missed   = 0
+
+    def Reset(self):
+      # The next tick is the first one after now, none are counted as missed
+        self.due = None
+
+    def GetNext(self, now):
+        due = (now - self.offset) // self.interval * self.interval + self.offset
+        return due + self.interval if due <= now else due
+
+    def Wait(self, event):
+      # Sleep until the next tick or until 'event' is set, returns the number of ticks that were missed
+        now = time.time()
+        if self.due == None:
+            self.due = self.GetNext(now)
+            missed = 0
+        else:
+            self.due += self.interval
+            missed = 0
+            if self.due <= now:
+              # We were too busy or asleep, skip to the next tick and carry on from there
+                missed = int((now - self.due) // self.interval) + 1
+                self.due = self.GetNext(now)
+        self.missed += missed
+
+        event.wait(max(0, self.due - time.time()))
+        metrics.Record('hub.tickLateness', max(0, time.time() - self.due))
+        return missed
+
+class HubView:
+  # One graph window's subscription to the Hub. All the attributes are protected by the hub's lock. The hub calls 'notify'
+  # when there is something to collect with Take, and if the window falls behind the new rows are added to the ones
+  # already waiting without another notification.
+    def __init__(self, hub, notify):
+        self.hub        = hub
+        self.notify     = notify
+        self.width      = 0
+        self.zoom       = 1
+        self.stacked    = False
+        self.active     = True
+        self.reload     = True # the next delivery must contain everything on the graph, not just what is new
+        self.lastBucket = None # the start of the newest bucket that has been delivered, when zoomed out
+        self.pending    = None
+        self.ticks      = 0    # the number of times new data has been delivered
+        self.dropped    = 0    # ...and the number of those that were added to data the window hadn't collected yet
+
+    def SetView(self, width, zoom=1):
+      # Called from the UI thread when the graph changes size or zoom level
+        self.hub.UpdateView(self, width=width, zoom=zoom)
+
+    def SetStacked(self, stacked):
+      # Called from the UI thread to choose between a single graph for all the hosts and one each
+        self.hub.UpdateView(self, stacked=stacked)
+
+    def SetActive(self, active):
+      # Called from the UI thread when the graph is hidden or shown
+        self.hub.UpdateView(self, active=active)
+
+    def Take(self):
+      # Called from the UI thread to collect the (now, zoom, rows, reloaded) tuple that is waiting, if any
+        with self.hub.lock:
+            result, self.pending = self.pending, None
+        return result
+
+    def Stop(self):
+      # Unsubscribe, and discard anything that hasn't been collected yet
+        self.hub.Unsubscribe(self)
+        self.Take()
+
+class Hub(threading.Thread):
+  # Each tick makes a single query for the per-second rows that have arrived since the last one, and adds them to the
+  # store, which holds every second that any of the graphs can show at one second per column. Each tick takes the time
+  # once from 'clock' (normally time.time, but it runs faster when replaying, see replay.py) and everything delivered
+  # for it uses that time. While all the graphs are hidden the hub sleeps, and then catches up with a single query.
+    def __init__(self, openSource, hosts=1, interval=1.0, clock=time.time, offset=TICK_OFFSET):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.openSource  = openSource # called on the hub thread, with several hosts the source must tag each row with its host index
+        self.hosts       = hosts
+        self.interval    = interval
+        self.clock       = clock
+        self.scheduler   = TickScheduler(interval, offset)
+        self.lock        = threading.Lock()
+        self.stopEvent   = threading.Event()
+        self.wakeEvent   = threading.Event()
+        self.views       = []
+        self.store       = []   # the per-second rows in timestamp order, (ts,dl,ul) or (ts,dl,ul,host)
+        self.storeStart  = None # the store holds every row on or after this time
+        self.buckets     = {}   # bucket size -> bucket rows for the buckets older than those in the store, in timestamp order
+        self.bucketStart = {}   # bucket size -> the time of the oldest bucket that we have
+        self.lastPoll    = None
+        self.delta       = None # the position that the data source has reached, see sources.py
+        self.reload      = True
+        self.source      = None # the data source and the second one used for older buckets, opened on the hub thread
+        self.loader      = None
+        self.lastError   = None
+
+    def Subscribe(self, notify):
+        view = HubView(self, notify)
+        with self.lock:
+            self.views.append(view)
+        return view
+
+    def Unsubscribe(self, view):
+        with self.lock:
+            if view in self.views:
+                self.views.remove(view)
+
+    def Stop(self):
+        self.stopEvent.set()
+        self.wakeEvent.set()
+        self.join(self.interval * 2)
+
+    def UpdateView(self, view, width=None, zoom=None, stacked=None, active=None):
+      # A view that needs more data than it had, or has missed some while it was hidden, gets everything again. If the
+      # store already has it (as it usually does for a graph showing individual seconds) then it is delivered straight away.
+        with self.lock:
+            if width != None:
+                view.reload = view.reload or width > view.width
+                view.width = width
+            if zoom != None:
+                view.reload = view.reload or zoom != view.zoom
+                view.zoom = zoom
+            if stacked != None and stacked != view.stacked:
+              # Anything waiting has the wrong number of graphs
+                view.reload = True
+                view.stacked = stacked
+                view.pending = None
+            if active != None:
+                view.reload = view.reload or (active and not view.active)
+                view.active = active
+
+            notify = False
+            if view.reload and view.active and view.width and view.zoom == 1 and self.lastPoll != None and \
+               self.storeStart != None and self.storeStart <= self.lastPoll - view.width:
+                notify = self.Deliver(view, self.lastPoll, [])
+        self.wakeEvent.set()
+        if notify:
+            view.notify()
+
+    def Restore(self, now, start, delta, columns):
+      # Fill the store from a snapshot, before the thread is started. 'columns' has a (ts list, dl list, ul list) tuple for each host.
+        rows = []
+        for host, (ts, dl, ul) in enumerate(columns):
+            if self.hosts == 1:
+                rows.extend(zip(ts, dl, ul))
+            else:
+                rows.extend(zip(ts, dl, ul, [host] * len(ts)))
+        rows.sort()
+        with self.lock:
+            self.store      = rows
+            self.storeStart = start
+            self.lastPoll   = now
+            self.delta      = delta
+            self.reload     = False
+
+    def GetSnapshot(self):
+      # Return (now, start, delta, columns) describing the store, in the form that Restore accepts, or None if it is empty
+        with self.lock:
+            if self.lastPoll == None or self.storeStart == None or self.delta == None:
+                return None
+            rows = list(self.store)
+            now, start, delta = self.lastPoll, self.storeStart, self.delta
+
+        columns = [([], [], []) for host in range(self.hosts)]
+        for row in rows:
+            ts, dl, ul = columns[row[3] if self.hosts > 1 else 0]
+            ts.append(row[0])
+            dl.append(row[1])
+            ul.append(row[2])
+        return now, start, delta, columns
+
+    def run(self):
+        while not self.stopEvent.is_set():
+            try:
+                self.Poll()
+                self.lastError = None
+            except Exception:
+              # Something went wrong that we didn't expect, report it and start again next time rather than stopping every graph
+                self.ReportError()
+                self.CloseSources()
+                with self.lock:
+                    self.reload = True
+
+            self.scheduler.Wait(self.stopEvent)
+            if self.WaitUntilActive():
+                self.scheduler.Reset()
+
+        self.CloseSources()
+
+    def Poll(self):
+      # Read whatever has arrived since the last tick and deliver it to the views
+        if self.source == None:
+            self.source = self.openSource()
+            with self.lock:
+                if self.delta != None:
+                    self.source.SetDelta(self.delta)
+
+        now = int(self.clock())
+        with self.lock:
+          # However long it has been since the last tick we just catch up, unless nothing in the store is needed any
+          # more, or it doesn't go back far enough, or the clock has gone backwards
+            need = self.GetStoreNeed(now)
+            reload = self.reload or self.lastPoll == None or now < self.lastPoll or need > self.lastPoll or \
+                     self.storeStart == None or need < self.storeStart
+            self.reload = False
+
+        try:
+            with metrics.Timer('hub.query'):
+                if reload:
+                    self.source.ResetDelta()
+                    rows = self.source.GetNewData(need)
+                else:
+                  # Everything since the last tick, including any seconds before 'need' that the older buckets still need
+                    rows = self.source.GetNewData(min(need, self.storeStart))
+                delta = self.source.GetDelta()
+        except (sqlite3.Error, EnvironmentError):
+          # The database may be locked by the BitMeter OS service, we'll try again next time
+            with self.lock:
+                self.reload = self.reload or reload
+            return
+
+        with self.lock:
+            self.AddToStore(now, need, rows, reload, delta)
+            loads = self.GetBucketLoads(now)
+
+      # Older buckets for zoomed out graphs are read on a separate connection, so the delta position isn't disturbed
+        loaded = {}
+        for bucket, start in loads:
+            try:
+                if self.loader == None:
+                    self.loader = self.openSource()
+                with metrics.Timer('hub.loadBuckets'):
+                    self.loader.ResetDelta()
+                    loaded[bucket] = (start, self.loader.GetNewBuckets(start, bucket))
+            except (sqlite3.Error, EnvironmentError):
+                pass
+
+        with self.lock:
+            for bucket, (start, buckets) in loaded.items():
+                cutoff = GetCutoff(self.storeStart, bucket)
+                self.buckets[bucket] = [row for row in buckets if row[0] < cutoff]
+                self.bucketStart[bucket] = start // bucket * bucket
+            notify = [view for view in self.views if view.active and self.Deliver(view, now, rows)]
+
+        if not self.stopEvent.is_set():
+            for view in notify:
+                view.notify()
+
+    def ReportError(self):
+      # Write the error to stderr, unless it is the same one as last time
+        error = traceback.format_exc()
+        if error != self.lastError:
+            sys.stderr.write('Error reading bandwidth data:\n' + error)
+        self.lastError = error
+
+    def CloseSources(self):
+        for source in (self.source, self.loader):
+            if source:
+                try:
+                    source.Close()
+                except Exception:
+                    pass
+        self.source = None
+        self.loader = None
+
+    def WaitUntilActive(self):
+      # Sleep while all the graphs are hidden, returns True if we had to wait
+        waited = False
+        while True:
+            with self.lock:
+                if [view for view in self.views if view.active] or self.stopEvent.is_set():
+                    return waited
+                self.wakeEvent.clear()
+            self.wakeEvent.wait()
+            waited = True
+
+    def GetStoreNeed(self, now):
+      # Return the earliest time that the store must hold: everything on a graph showing individual seconds, and the
+      # newest two buckets of one that is zoomed out (the older of them may still get some late rows).
+        need = now
+        for view in self.views:
+            if view.zoom == 1:
+                need = min(need, now - view.width)
+            else:
+                need = min(need, now // view.zoom * view.zoom - view.zoom)
+        return need
+
+    def AddToStore(self, now, need, rows, reload, delta):
+        self.lastPoll = now
+        self.delta    = delta
+        if reload:
+          # Start again, everything that was read before (including the older buckets) will be read again
+            self.store       = list(rows)
+            self.storeStart  = need
+            self.buckets     = {}
+            self.bucketStart = {}
+            for view in self.views:
+                view.reload = True
+            return
+
+        if not self.store or not rows or rows[0][0] >= self.store[-1][0]:
+            self.store.extend(rows)
+        else:
+          # Some of the hosts are behind the others
+            for row in rows:
+                bisect.insort(self.store, row)
+
+        if need - self.storeStart > STORE_SLACK:
+            self.TrimStore(now, need)
+
+    def TrimStore(self, now, need):
+      # Drop the rows before 'need' from the store, first adding any complete buckets they make up to the older buckets.
+      # Zoomed out graphs need data from further back than the store holds, so the older buckets are read once for each
+      # zoom level in use (on a second connection, see Poll) and then kept up to date from here.
+        for bucket in self.buckets:
+            oldCutoff = GetCutoff(self.storeStart, bucket)
+            newCutoff = GetCutoff(need, bucket)
+            if newCutoff > oldCutoff:
+                i = bisect.bisect_left(self.store, (oldCutoff,))
+                j = bisect.bisect_left(self.store, (newCutoff,))
+                self.buckets[bucket].extend(MakeHostBuckets(self.store[i:j], bucket, self.hosts))
+
+        del self.store[:bisect.bisect_left(self.store, (need,))]
+        self.storeStart = need
+
+      # ...and drop the older buckets that are off the left-hand side of every graph using them
+        for bucket in list(self.buckets.keys()):
+            views = [view for view in self.views if view.zoom == bucket]
+            if not views:
+                del self.buckets[bucket]
+                del self.bucketStart[bucket]
+                continue
+            start = min([now - view.width * bucket for view in views]) // bucket * bucket
+            if start > self.bucketStart[bucket]:
+                del self.buckets[bucket][:bisect.bisect_left(self.buckets[bucket], (start,))]
+                self.bucketStart[bucket] = start
+
+    def GetBucketLoads(self, now):
+      # Return a (bucket size, start time) pair for each zoom level where a graph needs older buckets than we have
+        loads = {}
+        for view in self.views:
+            if view.zoom > 1 and view.reload and view.active:
+                start = (now - view.width * view.zoom) // view.zoom * view.zoom
+                if self.bucketStart.get(view.zoom, start + 1) > start:
+                    loads[view.zoom] = min(start, loads.get(view.zoom, start))
+        return list(loads.items())
+
+    def GetViewRows(self, view, now, rows):
+      # Work out the rows (or buckets) to deliver to a view, 'rows' are the ones just added to the store. The newest buckets
+      # always come from the store and the older ones from before its start, so nothing is counted twice. With several hosts
+      # the rows are tagged with the host index, and views that want a single graph get them added together.
+        if view.zoom == 1:
+            if view.reload:
+                rows = self.store[bisect.bisect_left(self.store, (now - view.width,)):]
+        else:
+            bucket = view.zoom
+            cutoff = GetCutoff(self.storeStart, bucket)
+            if view.reload:
+                start = (now - view.width * bucket) // bucket * bucket
+                older = self.buckets.get(bucket, [])
+                rows = older[bisect.bisect_left(older, (start,)):]
+            else:
+              # As Db.GetNewBuckets, the newest bucket we sent last time is sent again because it was still filling up
+                start = max(view.lastBucket, cutoff) if view.lastBucket != None else cutoff
+                rows = []
+            rows = rows + MakeHostBuckets(self.store[bisect.bisect_left(self.store, (max(start, cutoff),)):], bucket, self.hosts)
+            if rows:
+                view.lastBucket = rows[-1][0]
+
+        if view.stacked and self.hosts > 1:
+            rows = Stack(rows)
+        return rows
+
+    def Deliver(self, view, now, rows):
+      # Called with the lock held, returns True if the view needs to be told that there is something to collect
+        if view.zoom > 1 and view.reload and (self.bucketStart.get(view.zoom) == None or
+                                              self.bucketStart[view.zoom] > (now - view.width * view.zoom) // view.zoom * view.zoom):
+          # The older buckets couldn't be read, try again next time
+            return False
+
+        reload = view.reload
+        rows = self.GetViewRows(view, now, rows)
+        view.reload = False
+
+        notify = view.pending == None
+        view.ticks += 1
+        if not notify:
+            view.dropped += 1
+        if notify or reload:
+            view.pending = (now, view.zoom, rows, reload)
+        else:
+          # The window hasn't collected the last lot yet, so add these rows onto them
+            prevNow, prevZoom, prevRows, prevReload = view.pending
+            view.pending = (now, view.zoom, prevRows + rows, prevReload)
+        return notify
@@ -5,34 +5,119 @@ This is the main module of the BitMeter OS desktop client
 """
 
 import time
-import wx
 import sys
+
+STARTUP_TIME = time.time()
+
+if __name__ == '__main__' and sys.argv[1:2] == ['export']:
+  # Exporting data doesn't need a GUI, so handle it before importing wx
+    import export
+    sys.exit(export.Main(sys.argv[2:]))
+
+if __name__ == '__main__' and sys.argv[1:2] == ['sparkline']:
+  # Neither does drawing images of the graph, although it will use wx if it is available
+    import sparkline
+    sys.exit(sparkline.Main(sys.argv[2:]))
+
+import wx
 import os
 import os.path
-import gettext
-import string
-import webbrowser
-from prefs import Prefs
-from about import AboutDialog
-from db import Db
-from options import OptionsDialog
+import functools
+from prefs import Prefs, GetSchema, PREFS_PREFIX
+from db import Db, GetDefaultPaths
+from samples import Series
+from stats import Stats, LABELS, TAGS, NOW, TOTAL, TODAY, MONTH
+import metrics
+import snapshot
+from sources import OpenSources, GetSourceUrls, IsUrl
+from hub import Hub, TICK_OFFSET
+from bitmaps import BitmapPool
+from autoscale import AutoScale
+import graph
 
 VERSION = "0.1.0"
 BYTES_PER_K=1024
-_=gettext.gettext
+PREFS_PATH=os.path.expanduser('~/.bitmeterclient.db') # only used if there is no local BitMeter OS database
+ROLLUPS_PATH=os.path.expanduser('~/.bitmeterclient-rollups.db') # daily/monthly totals, see rollups.py
+QUOTA_WARNING=0.9 # warn when this fraction of the monthly quota has been used
+METRICS_INTERVAL=60 # seconds between writes of the BITMETER_METRICS file
+SNAPSHOT_PATH=os.path.expanduser('~/.bitmeterclient.snapshot') # the data on the graphs when the client last ran, see snapshot.py
+SNAPSHOT_INTERVAL=60 # seconds between saves of the snapshot, it is also saved when the client exits
+LATE_SECONDS=2 # the newest columns are redrawn for this many ticks, in case their data arrives late
+RESIZE_INTERVAL=16 # milliseconds, while the window is being resized it is updated no more often than this (about 60 times a second)
+HISTORY_STEP=0.25 # fraction of the graph width moved by each click of the mouse wheel when scrolling back through history
+HISTORY_FORMAT='%Y-%m-%d %H:%M:%S' # the time shown in the caption while scrolling back through history
+
+# The number of seconds covered by each column of the graph at each zoom level, with a short label for the caption
+ZOOM_LEVELS = [(1, ''), (10, '10s'), (60, '1m'), (600, '10m'), (3600, '1h')]
+
+def _(message):
+  # gettext is only imported the first time some text needs translating, this speeds up startup
+    import gettext
+    return gettext.gettext(message)
 
 class MyFrame(wx.Frame):
-    def __init__(self, parent, title, db, defaultPrefs, capabilities):
+    def __init__(self, parent, title, db, prefsSchema, capabilities, locations, feed=None, main=None, slot=0):
         wx.Frame.__init__(self, parent, -1, title, style= wx.NO_BORDER | wx.FRAME_NO_TASKBAR | wx.CLIP_CHILDREN )
         
         self.db=db
+        self.prefsSchema = prefsSchema
+        self.locations = locations
         self.capabilities = capabilities
-        self.data = []
+        
+      # When stress testing, the data comes from a replay.Feed instead of the databases in 'locations'
+        self.feed = feed
+        
+      # Extra graph windows share the data read by the main window's hub. Each has a 'slot' number, which
+      # keeps its preferences apart from those of the other windows. The main window keeps a list of them.
+        self.main = main
+        self.slot = slot
+        self.graphs = []
+        self.hub = main.hub if main else None
+        
+      # The rows currently visible on the graph, oldest first. New rows are appended as they arrive
+      # and old ones dropped from the front, so we only need to ask the database for the latest data.
+      # There is one Series for each graph, which is normally just one unless several hosts are being shown.
+        self.series = [Series()]
+        self.lastPoll = None
+        
+        self.snapshotSaved = time.time()
+        
+      # Running statistics for the caption and tooltip, these are only kept while the graph is showing individual seconds
+        self.stats = Stats(1)
+        self.tooltip = None
+        
+      # Used to choose the scale from the data on the graph, if the user has turned that on
+        self.autoScale = AutoScale(BYTES_PER_K)
+        
+      # Today's and this month's totals are kept up to date on another thread, for the local databases only
+        self.rollups = None
+        self.totals = main.totals if main else None
+        self.poller = None
+        self.stacked = None
+        self.visible = True
+        
+        self.zoomIndex = 0
+        self.zoom = 1
+        self.bufferTs = None
+        self.bufferSize = None
+        self.bitmaps = BitmapPool(2)
+        self.reInitBuffer = True
+        
+      # While the user is scrolling back through history, 'historyEnd' is the time at the left-hand edge of the graph
+      # and it is drawn from the tiles kept by 'history' (see history.py). Otherwise it is None and we show the live graph.
+        self.historyEnd = None
+        self.history = None
+        
+      # While the window is being resized the new size is applied by a timer, and the existing graph is stretched to fit
+        self.resizing = False
+        self.resizeTo = None
+        self.resizeTimer = None
         
         self.options = None
         self.about = None
         
-        self.prefs = Prefs(self.db, defaultPrefs)
+        self.prefs = Prefs(self.db, prefsSchema)
         
       # Don't allow the user to shrink the window below these dimensions
         self.minYSize = 30
@@ -44,6 +129,8 @@ class MyFrame(wx.Frame):
         self.panel.Bind(wx.EVT_LEFT_DOWN, self.OnPanelDown)
         self.panel.Bind(wx.EVT_LEFT_UP,   self.OnPanelUp)
         self.panel.Bind(wx.EVT_PAINT,     self.OnPanelPaint)
+        self.panel.Bind(wx.EVT_MOUSEWHEEL, self.OnPanelWheel)
+        self.panel.Bind(wx.EVT_LEFT_DCLICK, self.OnPanelDClick)
         
       # This is the label below the graph showing numeric values
         self.label = wx.StaticText(self, -1, "-", style = wx.ST_NO_AUTORESIZE | wx.BORDER_SIMPLE | wx.ALIGN_CENTER)
@@ -59,17 +146,18 @@ class MyFrame(wx.Frame):
         box.Add(self.label, 0, flag = wx.EXPAND)
         
       # Restore the position of the graph from last time
-        self.SetPosition(self.prefs.GetObj('position'))
+        self.SetPosition(self.prefs.Get('position'))
         self.OnPrefsUpdated()
        
         self.SetSizer(box)
         self.Fit()
-        self.SetSize(self.prefs.GetObj('size'))
+        self.SetSize(self.prefs.Get('size'))
+        if self.feed and self.feed.size:
+            self.SetSize(self.feed.size)
         
-      # We update the graph each second with new data
-        self.timer = wx.Timer(self)
-        self.timer.Start(1000)
-        self.Bind(wx.EVT_TIMER, self.OnTimer)
+      # We update the graph each second with new data, which is read from the database on a background thread. If
+      # there is a snapshot from last time then the graph is drawn from that straight away, while we wait for the hub.
+        self.StartPoller(self.LoadSnapshot())
         
         self.InitBuffer()
         self.Bind(wx.EVT_IDLE, self.OnIdle)
@@ -81,13 +169,148 @@ class MyFrame(wx.Frame):
         else:
             self.modulePath = os.path.dirname(unicode(__file__, encoding))
 
+      # The tray icon and the menu aren't needed to draw the graph, so they are created once it is on the screen
+        self.popupmenu = None
+        self.trayIcon  = None
+        if not self.main:
+            wx.CallAfter(self.CreateTrayIcon)
+            wx.CallAfter(self.StartRollups)
+        
+      # Set BITMETER_STARTUP_TIMING to find out how long it takes before the first data appears on the graph
+        self.logFirstPaint = os.getenv('BITMETER_STARTUP_TIMING') != None
+        
+      # Set BITMETER_METRICS to the path of a file that the timing measurements will be written to every minute
+        self.metricsPath = os.getenv('BITMETER_METRICS') if not self.main else None
+        self.metricsWritten = time.time()
+        self.profiler = metrics.Profiler()
+        
+        self.Bind(wx.EVT_CONTEXT_MENU, self.OnShowPopup)
+        self.Bind(wx.EVT_CLOSE, self.OnClose)
+        self.Bind(wx.EVT_SHOW, self.OnShow)
+        self.Bind(wx.EVT_ICONIZE, self.OnIconize)
+        
+    def StartPoller(self, snap=None):
+      # Subscribe to the hub that reads the data on a background thread, starting it if this is the main window. When
+      # several databases are being monitored there is a separate graph for each one, unless the user has chosen to
+      # stack them together.
+        self.ResetSeries()
+        startHub = self.hub == None
+        if startHub:
+            self.hub = self.CreateHub()
+            if snap:
+                self.hub.Restore(snap.now, snap.start, snap.delta, snap.columns)
+        
+        self.poller = self.hub.Subscribe(lambda: wx.CallAfter(self.OnNewData))
+        self.poller.SetStacked(bool(self.stacked))
+        self.UpdateView()
+        self.poller.SetActive(self.visible)
+        if startHub:
+            self.hub.start()
+        
+    def CreateHub(self):
+        if self.feed:
+            return Hub(self.feed.OpenSource, 1, self.feed.interval, clock=self.feed.clock.Now, offset=0)
+        
+      # The hub keeps the rows from each host separate, and stacks them for the graphs that want it. Set BITMETER_TICK_OFFSET
+      # to change how long after each second it reads the new data, if the service takes longer to write it.
+        openSource = functools.partial(OpenSources, self.locations, self.db.prefsPrefix, False)
+        return Hub(openSource, len(self.locations), offset=float(os.getenv('BITMETER_TICK_OFFSET', TICK_OFFSET)))
+        
+    def ResetSeries(self):
+        if self.stacked:
+            self.series = [Series()]
+        else:
+            self.series = [Series() for location in self.locations]
+        self.reInitBuffer = True
+        
+    def LoadSnapshot(self):
+      # Return the snapshot saved last time, unless it was for different data sources or is too old to show anything
+        if self.feed or self.main:
+            return None
+        snap = snapshot.Load(SNAPSHOT_PATH)
+        if snap == None:
+            return None
+        if list(snap.locations) != list(self.locations) or len(snap.columns) != len(self.locations):
+            return None
+        if not 0 <= int(time.time()) - snap.now < self.GetSize().width:
+            return None
+        return snap
+        
+    @metrics.Timed('frame.SaveSnapshot')
+    def SaveSnapshot(self):
+      # Save the data held by the hub, which includes everything on the graphs showing individual seconds
+        if self.feed or self.main:
+            return
+        hubSnapshot = self.hub.GetSnapshot()
+        if hubSnapshot:
+            now, start, delta, columns = hubSnapshot
+            try:
+                snapshot.Save(SNAPSHOT_PATH, snapshot.Snapshot(list(self.locations), now, start, delta, columns))
+            except EnvironmentError:
+              # Not worth bothering the user about, we'll just have to read everything from the database next time
+                pass
+        self.snapshotSaved = time.time()
+        
+    def UpdateView(self):
+      # Tell the hub how much data the graph needs
+        self.viewWidth = self.GetSize().width
+        self.poller.SetView(self.viewWidth, self.zoom)
+        self.stats.SetWindow(self.viewWidth)
+        
+    def CreateTrayIcon(self):
+        if not self:
+          # The window was closed before this call was processed
+            return
         iconPath = os.path.join(self.modulePath, "resources", "bitmeter.ico")
         icon = wx.Icon(iconPath, wx.BITMAP_TYPE_ICO)  
-
-      # The menu can be accessed from the main graph, and from the tray icon
+        self.trayIcon = TrayIcon(self, icon)
+        
+    def StartRollups(self):
+        dbPaths = [location for location in self.locations if not IsUrl(location)]
+        if not self or not dbPaths or self.feed:
+            return
+      # Imported here, the totals aren't needed until after the graph has been drawn
+        from rollups import RollupThread
+        self.rollups = RollupThread(ROLLUPS_PATH, dbPaths, lambda: wx.CallAfter(self.OnNewTotals))
+        self.rollups.start()
+        
+    def OnNewTotals(self):
+      # Called on the UI thread when the rollups have been updated, the caption picks up the new totals on the next tick
+        if not self:
+            return
+        self.totals = self.rollups.Take()
+        for window in self.graphs:
+            window.totals = self.totals
+        if self.trayIcon and self.totals:
+            lines = ["BitMeter OS"]
+            for name, label in ((TODAY, _('Today')), (MONTH, _('This month'))):
+                dl, ul = self.totals[name]
+                lines.append(label + ": " + self.FormatStat(name, dl, ul))
+            warning = self.GetQuotaWarning()
+            if warning:
+                lines.append(warning)
+            self.trayIcon.SetToolTip("\n".join(lines))
+        
+    def GetQuotaWarning(self):
+      # Return a message if most of the monthly quota (in MB, for downloads and uploads together) has been used
+        quota = self.prefs.Get('quota') * 1000000
+        if not quota or not self.totals:
+            return None
+        used = float(sum(self.totals[MONTH])) / quota
+        if used >= QUOTA_WARNING:
+            return _('Monthly quota used') + ": %d%%" % (used * 100)
+        return None
+        
+    def GetPopupMenu(self):
+      # The menu can be accessed from the main graph, and from the tray icon. It is built the first time it is needed.
+        if self.popupmenu != None:
+            return self.popupmenu
+        if self.main:
+            return self.GetGraphMenu()
+            
         self.popupmenu = wx.Menu()
-        self.trayIcon = TrayIcon(self, self.popupmenu, icon);
         self.showHideMain = self.popupmenu.Append(-1, _("Hide Graph"))
+        self.UpdateShowHideLabel()
         self.Bind(wx.EVT_MENU, self.ToggleGraph)
         self.trayIcon.Bind(wx.EVT_MENU, self.ToggleGraph)
         
@@ -95,15 +318,26 @@ class MyFrame(wx.Frame):
         options = self.popupmenu.Append(-1, _("Options"))
         self.Bind(wx.EVT_MENU, self.OnMenuOptions, options)
         self.trayIcon.Bind(wx.EVT_MENU, self.OnMenuOptions, options)
+        
+      # Menu item to open another graph window, for example to show a longer period zoomed out
+        newGraph = self.popupmenu.Append(-1, _("New Graph"))
+        self.Bind(wx.EVT_MENU, self.OnMenuNewGraph, newGraph)
+        self.trayIcon.Bind(wx.EVT_MENU, self.OnMenuNewGraph, newGraph)
+      
+      # Menu items to show the timing measurements, and to start/stop the profiler
+        performance = self.popupmenu.Append(-1, _("Performance"))
+        self.Bind(wx.EVT_MENU, self.OnMenuPerformance, performance)
+        self.trayIcon.Bind(wx.EVT_MENU, self.OnMenuPerformance, performance)
+        
+        self.profileItem = self.popupmenu.Append(-1, _("Start Profiling"))
+        self.Bind(wx.EVT_MENU, self.OnMenuProfile, self.profileItem)
+        self.trayIcon.Bind(wx.EVT_MENU, self.OnMenuProfile, self.profileItem)
       
       # Menu item to open the Web Interface
         webInterface = self.popupmenu.Append(-1, _("Web Interface"))
         self.Bind(wx.EVT_MENU, self.OnMenuWebInterface, webInterface)
         self.trayIcon.Bind(wx.EVT_MENU, self.OnMenuWebInterface, webInterface)
         
-      # Need this to build the web interface url
-        self.webPort = self.db.GetConfigValue('web.port', 2605)
-
       # Menu item to open the About dialog
         about = self.popupmenu.Append(-1, _("About"))
         self.Bind(wx.EVT_MENU, self.OnMenuAbout, about)
@@ -116,12 +350,42 @@ class MyFrame(wx.Frame):
         self.Bind(wx.EVT_MENU, self.OnMenuExit, exit)
         self.trayIcon.Bind(wx.EVT_MENU, self.OnMenuExit, exit)
         
-        self.Bind(wx.EVT_CONTEXT_MENU, self.OnShowPopup)
-        self.Bind(wx.EVT_CLOSE, self.OnClose)
+        return self.popupmenu
+        
+    def GetGraphMenu(self):
+      # The menu for an extra graph window, which only has the items that apply to it
+        self.popupmenu = wx.Menu()
+        options = self.popupmenu.Append(-1, _("Options"))
+        self.Bind(wx.EVT_MENU, self.OnMenuOptions, options)
+        newGraph = self.popupmenu.Append(-1, _("New Graph"))
+        self.Bind(wx.EVT_MENU, self.OnMenuNewGraph, newGraph)
+        self.popupmenu.AppendSeparator()
+        close = self.popupmenu.Append(-1, _("Close Graph"))
+        self.Bind(wx.EVT_MENU, self.OnMenuCloseGraph, close)
+        return self.popupmenu
         
     def ToggleGraph(self, event):
       # Show/Hide the graph
         self.Show(not self.IsShown())
+        self.UpdateShowHideLabel()
+        
+    def OnShow(self, event):
+        event.Skip()
+        self.SetVisible(event.GetShow() and not self.IsIconized())
+        
+    def OnIconize(self, event):
+        event.Skip()
+        self.SetVisible(self.IsShown() and not event.Iconized())
+        
+    def SetVisible(self, visible):
+      # Stop polling while the graph is hidden or minimised, it catches up when the graph is shown again
+        self.visible = visible
+        if self.poller:
+            self.poller.SetActive(visible)
+        
+    def UpdateShowHideLabel(self):
+        if self.popupmenu == None:
+            return
         if self.IsShown():
             self.showHideMain.SetText( _('Hide Graph'))
         else:
@@ -131,22 +395,67 @@ class MyFrame(wx.Frame):
       # This value gets displayed below the main graph
         return "DL: %.2f UL: %.2f" % (float(dl)/1000, float(ul)/1000)
         
+    def FormatStat(self, name, dl, ul):
+      # Rates are shown in kB/sec like the caption, totals in MB
+        if name in (TOTAL, TODAY, MONTH):
+            return "DL: %.2f UL: %.2f MB" % (float(dl)/1000000, float(ul)/1000000)
+        else:
+            return self.FormatAmounts(dl, ul)
+        
     def OnShowPopup(self, event):
         pos = event.GetPosition()
         pos = self.panel.ScreenToClient(pos)
-        self.panel.PopupMenu(self.popupmenu, pos)
+        self.panel.PopupMenu(self.GetPopupMenu(), pos)
     
     def OnMenuWebInterface(self, event):
       # Open the web interface in the default browser
-        webbrowser.open("http://localhost:" + str(self.webPort))
+        import webbrowser
+        webPort = self.db.GetConfigValue('web.port', 2605)
+        webbrowser.open("http://localhost:" + str(webPort))
     
     def OnMenuAbout(self, event):
       # Open the About dialog
+        from about import AboutDialog
         self.about = AboutDialog(VERSION)
         self.about.ShowModal()
         self.about.Destroy()
         self.about = None
 
+    def OnMenuPerformance(self, event):
+        from performance import PerformanceDialog
+        dlg = PerformanceDialog()
+        dlg.ShowModal()
+        dlg.Destroy()
+        
+    def OnMenuProfile(self, event):
+      # Start profiling the UI thread, or stop and save the results in the user's home directory
+        if self.profiler.IsRunning():
+            path = os.path.expanduser(time.strftime('~/bitmeterclient-%Y%m%d-%H%M%S.pstats'))
+            self.profiler.Stop(path)
+            self.profileItem.SetText(_('Start Profiling'))
+            wx.MessageBox(_('Profile saved to') + ' ' + path, _('Profiling'))
+        else:
+            self.profiler.Start()
+            self.profileItem.SetText(_('Stop Profiling'))
+        
+    def OnMenuNewGraph(self, event):
+        (self.main or self).OpenGraph()
+        
+    def OpenGraph(self):
+      # Open an extra graph window fed by our hub. Its preferences are stored under a prefix of its own, using the
+      # lowest slot number that isn't in use, so a new window picks up the size, position and colours from last time.
+        used = [window.slot for window in self.graphs]
+        slot = 1
+        while slot in used:
+            slot += 1
+        db = Db(self.db.dbPath, self.db.prefsPrefix + 'graph%d.' % slot)
+        window = MyFrame(None, "", db, self.prefsSchema, self.capabilities, self.locations, self.feed, self, slot)
+        self.graphs.append(window)
+        window.Show(True)
+        
+    def OnMenuCloseGraph(self, event):
+        self.Close()
+        
     def OnMenuExit(self,event):
       # Close all open windows
         if self.options:
@@ -156,51 +465,106 @@ class MyFrame(wx.Frame):
         self.Close()
     
     def OnClose(self, event):
-      # Store the current size/position of the graph before exiting
-        self.prefs.SetObj('size', self.GetSize())
-        self.prefs.SetObj('position', self.GetPosition())
-        self.prefs.Save()
+      # Store the current size/position of the graph before exiting, unless it has been set up for stress testing
+        if not self.feed:
+            self.prefs.Set('size', self.GetSize())
+            self.prefs.Set('position', self.GetPosition())
+            self.prefs.Save()
         
-        self.trayIcon.RemoveIcon()  
-        self.trayIcon.Destroy()  
+        self.poller.Stop()
+        if self.history:
+            self.history.Stop()
+        if self.main:
+          # An extra graph window, the hub carries on for the others
+            self.main.graphs.remove(self)
+            self.db.Close()
+            self.Destroy()
+            return
+        
+        for window in list(self.graphs):
+            window.Close()
+        self.hub.Stop()
+        if self.feed:
+            self.feed.Report(self.poller, self.viewWidth, final=True)
+        self.SaveSnapshot()
+        if self.metricsPath:
+            metrics.WriteFile(self.metricsPath)
+        if self.rollups:
+            self.rollups.Stop()
+        if self.trayIcon:
+            self.trayIcon.RemoveIcon()  
+            self.trayIcon.Destroy()  
         self.Destroy()
 
     def OnPrefsUpdated(self):
       # Callback invoked from the Options dialog when the user clicks 'OK'
         if self.capabilities['opacity']:
-            self.SetTransparent(self.prefs.GetNum('opacity') * 2.55)
+            self.SetTransparent(self.prefs.Get('opacity') * 2.55)
             
-        self.SetBackgroundColour(self.prefs.GetCol('bgcolour')) 
+        self.SetBackgroundColour(self.prefs.Get('bgcolour')) 
+        
+        self.pens = (wx.Pen(self.prefs.Get('olcolour'), 1),
+                     wx.Pen(self.prefs.Get('dlcolour'), 1),
+                     wx.Pen(self.prefs.Get('ulcolour'), 1))
+        self.peakPens = (wx.Pen(self.GetPeakColour('olcolour'), 1),
+                         wx.Pen(self.GetPeakColour('dlcolour'), 1),
+                         wx.Pen(self.GetPeakColour('ulcolour'), 1))
+        self.scale = self.prefs.Get('scale')
+        if self.prefs.Get('autoscale'):
+            if self.autoScale.scale == None:
+                self.StartAutoScale()
+            if self.autoScale.scale != None:
+                self.scale = self.autoScale.scale
+        else:
+            self.autoScale.scale = None
+        
+        if self.capabilities['multihost'] and self.prefs.Get('stacked') != self.stacked:
+          # Switch between one graph for all the hosts and one each, the hub will send the rows again
+            self.stacked = self.prefs.Get('stacked')
+            if self.poller:
+                self.ResetSeries()
+                self.poller.SetStacked(self.stacked)
         
-        self.dlPen = wx.Pen(self.prefs.GetCol('dlcolour'), 1)
-        self.ulPen = wx.Pen(self.prefs.GetCol('ulcolour'), 1)
-        self.olPen = wx.Pen(self.prefs.GetCol('olcolour'), 1)
-        self.scale = self.prefs.GetNum('scale')
+      # The existing graph was drawn with the old colours/scale so it will have to be drawn again from scratch
+        self.reInitBuffer = True
+        self.UpdateHistoryStyle()
         
-        if not (self.prefs.GetObj('float') ^ (not self.HasFlag(wx.STAY_ON_TOP))):
+        if not (self.prefs.Get('float') ^ (not self.HasFlag(wx.STAY_ON_TOP))):
           # Set the 'Stay On Top' flag to the appropriate value
             self.ToggleWindowStyle(wx.STAY_ON_TOP)
         
         if self.capabilities['clickthru']:
           # Windows only, window passes all mouse clicks to whatever is underneath
-            if not (self.prefs.GetObj('clickthru') ^ (not self.HasFlag(wx.TRANSPARENT_WINDOW))):
+            if not (self.prefs.Get('clickthru') ^ (not self.HasFlag(wx.TRANSPARENT_WINDOW))):
                 self.ToggleWindowStyle(wx.TRANSPARENT_WINDOW)
         
+    def GetPeakColour(self, name):
+        col = self.prefs.Get(name)
+        bg  = self.prefs.Get('bgcolour')
+        return wx.Colour(*graph.GetPeakColour(col.Get(), bg.Get()))
+        
     def OnMenuOptions(self,event):
       # Open the Options dialog
+        from options import OptionsDialog
         self.options = OptionsDialog(self, self.prefs, self.capabilities, self.OnPrefsUpdated)
         self.options.ShowModal()
         self.options.Destroy()
         self.options = None
 
     def OnPanelDown(self, event):
-      # Mouse down over the graph means we want to drag the window
+      # Mouse down over the graph means we want to drag the window, or with Shift held down to scroll through history
         self._panelDownPos = event.GetPosition()
+        self._panelPanX = self._panelDownPos.x
         if not self.panel.HasCapture():
             self.panel.CaptureMouse()
 
     def OnPanelMove(self, event):
-        if event.Dragging() and event.LeftIsDown():
+        if event.Dragging() and event.LeftIsDown() and event.ShiftDown():
+          # The graph is being dragged, dragging it to the left shows older data
+            x = event.GetPosition().x
+            self.PanHistory(self._panelPanX - x)
+            self._panelPanX = x
+        elif event.Dragging() and event.LeftIsDown():
           # The window is being dragged            
             pos = event.GetPosition()
             displacement = self._panelDownPos - pos
@@ -211,6 +575,77 @@ class MyFrame(wx.Frame):
         if self.panel.HasCapture():
             self.panel.ReleaseMouse()
 
+    def OnPanelWheel(self, event):
+      # The mouse wheel zooms the graph in and out, changing how many seconds each column covers. With Shift held
+      # down (or a horizontal wheel) it scrolls back and forth through history instead.
+        horizontal = hasattr(event, 'GetWheelAxis') and event.GetWheelAxis() == wx.MOUSE_WHEEL_HORIZONTAL
+        if event.ShiftDown() or horizontal:
+            step = max(1, int(self.viewWidth * HISTORY_STEP))
+            if (event.GetWheelRotation() > 0) != horizontal:
+                self.PanHistory(step)
+            else:
+                self.PanHistory(-step)
+            return
+        
+        if event.GetWheelRotation() > 0:
+            zoomIndex = max(self.zoomIndex - 1, 0)
+        else:
+            zoomIndex = min(self.zoomIndex + 1, len(ZOOM_LEVELS) - 1)
+            
+        if zoomIndex != self.zoomIndex:
+            self.zoomIndex = zoomIndex
+            self.zoom = ZOOM_LEVELS[zoomIndex][0]
+            for series in self.series:
+                series.Clear()
+            self.reInitBuffer = True
+            self.UpdateView()
+            if self.historyEnd != None:
+                self.PanHistory(0)
+
+    def OnPanelDClick(self, event):
+      # Double-clicking the graph goes straight back to the live graph
+        if self.historyEnd != None:
+            self.PanHistory(-((self.GetGraphEnd(self.GetNow()) - self.historyEnd) // self.zoom))
+
+    def GetNow(self):
+        return self.lastPoll or int(self.hub.clock())
+        
+    def PanHistory(self, columns):
+      # Move the graph 'columns' columns back through history (or forwards if negative), going back to the live graph once
+      # we reach the present. The left-hand edge is kept at the end of a bucket, so the columns line up with the tiles.
+        liveEnd = self.GetGraphEnd(self.GetNow())
+        end = (self.historyEnd if self.historyEnd != None else liveEnd) - columns * self.zoom
+        end = -(-end // self.zoom) * self.zoom
+        if end >= liveEnd:
+            if self.historyEnd == None:
+                return
+            self.historyEnd = None
+        else:
+            self.historyEnd = end
+            if self.history == None:
+                from history import History
+                self.history = History(self.hub.openSource, self.hub.hosts, self.hub.clock, lambda: wx.CallAfter(self.OnHistoryData))
+                self.UpdateHistoryStyle()
+        
+        self.InitBuffer()
+        self.panel.Refresh(False)
+        if self.lastPoll != None:
+            self.UpdateCaption(self.lastPoll, liveEnd)
+        
+    def OnHistoryData(self):
+      # Called on the UI thread when the rows for some more history tiles have been read
+        if not self:
+            return
+        if self.history.Collect() and self.historyEnd != None:
+            self.InitBuffer()
+            self.panel.Refresh(False)
+        
+    def UpdateHistoryStyle(self):
+      # Tell the history tiles about the current scale and colours, so the ones drawn differently are thrown away
+        if self.history:
+            colours = tuple([self.prefs.Get(name).Get() for name in ('olcolour', 'dlcolour', 'ulcolour', 'bgcolour')])
+            self.history.SetStyle(self.scale * BYTES_PER_K, colours, self.stacked, self.pens, self.peakPens)
+
     def GetEventYInWindow(self, event):
       # Calculate the y-coordinate of a mouse click within the label, relative to the whole window
         return self.GetSize().height - self.label.GetSize().height + event.GetPosition().y
@@ -224,6 +659,7 @@ class MyFrame(wx.Frame):
         
         if not self.HasCapture():
             self.CaptureMouse()
+        self.resizing = True
                 
     def OnLabelMove(self,event):
       # Mouse move in the label means we should resize the window
@@ -237,136 +673,355 @@ class MyFrame(wx.Frame):
                 newYSize = self.minYSize
             if newXSize < self.minXSize:
                 newXSize = self.minXSize
-            self.SetSize(wx.Size(newXSize, newYSize))
-            self.reInitBuffer = True
+                
+          # There are usually many more mouse events than we can draw, so just remember the latest size until the timer fires
+            self.resizeTo = wx.Size(newXSize, newYSize)
+            if self.resizeTimer == None:
+                self.resizeTimer = wx.CallLater(RESIZE_INTERVAL, self.ApplyResize)
+
+    def ApplyResize(self):
+        self.resizeTimer = None
+        if not self:
+          # The window was closed before the timer fired
+            return
+        if self.resizeTo != None:
+            self.SetSize(self.resizeTo)
+            self.resizeTo = None
+            self.panel.Refresh(False)
 
     def OnLabelUp(self,event):
-      # Mouse up in the label means we want to stop resizing
+      # Mouse up in the label means we want to stop resizing, now the graph is drawn properly at its new size
         if self.HasCapture():
             self.ReleaseMouse()
+        if self.resizing:
+            if self.resizeTimer:
+                self.resizeTimer.Stop()
+            self.ApplyResize()
+            self.resizing = False
+            self.UpdateView()
+            self.reInitBuffer = True
     
+    @metrics.Timed('frame.OnPanelPaint')
     def OnPanelPaint(self, event):
       # Paint the graph with whatever is in our in-memory buffer
-        dc = wx.BufferedPaintDC(self.panel, self.buffer)
+        size = self.panel.GetSize()
+        if size == self.bufferSize:
+            dc = wx.BufferedPaintDC(self.panel, self.buffer)
+        else:
+          # The window is being resized, stretch the graph we have to fit until it can be drawn again
+            dc = wx.PaintDC(self.panel)
+            dc.SetUserScale(float(size.width) / self.bufferSize.width, float(size.height) / self.bufferSize.height)
+            srcDc = wx.MemoryDC(self.buffer)
+            dc.Blit(0, 0, self.bufferSize.width, self.bufferSize.height, srcDc, 0, 0)
+            srcDc.SelectObject(wx.NullBitmap)
+        
+        if self.feed and not self.main:
+          # Only the main window's frames are counted, as the ticks and dropped ticks reported with them are its own
+            self.feed.CountFrame()
+        if self.logFirstPaint and self.lastPoll != None:
+            self.logFirstPaint = False
+            sys.stderr.write("Time to first paint: %.3f seconds\n" % (time.time() - STARTUP_TIME))
 
     def OnIdle(self, event):
+        if not self.resizing and self.panel.GetSize() != self.bufferSize:
+            self.reInitBuffer = True
         if self.reInitBuffer:
           # We have new data to be displayed
             self.InitBuffer()
             self.Refresh(False)
 
+    @metrics.Timed('frame.InitBuffer')
     def InitBuffer(self):
-      # Draw the next graph to be displayed onto the in-memory buffer
+      # Draw the whole graph again in the in-memory buffer, this only happens when the size, scale or colours change.
+      # While scrolling back through history the graph is made up of the history tiles instead.
         size = self.panel.GetSize()
-        self.buffer = wx.EmptyBitmap(size.width, size.height)
+        self.buffer, self.spareBuffer = self.bitmaps.Get(size.width, size.height)
+        self.bufferSize  = size
+        self.bufferTs    = self.GetGraphEnd(self.lastPoll or int(time.time()))
         dc = wx.BufferedDC(None, self.buffer)
         dc.SetBackground(wx.Brush(self.GetBackgroundColour()))
         dc.Clear()
-        self.DrawLines(dc)
+        if self.historyEnd != None:
+            self.history.Draw(dc, self.historyEnd, size.width, size.height, self.zoom, self.GetNow())
+          # The live graph will have to be drawn from scratch when we go back to it
+            self.bufferTs = None
+        else:
+            self.DrawLines(dc, self.bufferTs)
         self.reInitBuffer = False    
         
-    def DrawLines(self, dc):
-      # Draw the graph using the current upload/download values
-        h = self.panel.GetSize().height
-        now = time.time()
-        ts = 0
+    def GetGraphEnd(self, now):
+      # Return the time at the left-hand edge of the graph. When zoomed out, this is the end of the bucket containing 'now'
+        if self.zoom == 1:
+            return now
+        else:
+            return (now // self.zoom + 1) * self.zoom
+        
+    @metrics.Timed('frame.ScrollBuffer')
+    def ScrollBuffer(self, now):
+      # Move the existing graph across by the number of columns since it was drawn, and just draw the new ones
+        width, height = self.bufferSize.width, self.bufferSize.height
+        shift  = (now - self.bufferTs) // self.zoom
+        redraw = shift + LATE_SECONDS
+        if shift < 0 or redraw >= width or (self.panel.GetSize() != self.bufferSize and not self.resizing):
+          # Nothing on the existing graph can be re-used
+            self.InitBuffer()
+            return
+        
+      # We can't safely blit a bitmap onto itself, so copy into the spare buffer and then swap them over
+        srcDc = wx.MemoryDC(self.buffer)
+        dc = wx.MemoryDC(self.spareBuffer)
+        dc.Blit(shift, 0, width - shift, height, srcDc, 0, 0)
+        srcDc.SelectObject(wx.NullBitmap)
+        
+        dc.SetPen(wx.TRANSPARENT_PEN)
+        dc.SetBrush(wx.Brush(self.GetBackgroundColour()))
+        dc.DrawRectangle(0, 0, redraw, height)
+        self.DrawLines(dc, now, now - redraw * self.zoom)
+        dc.SelectObject(wx.NullBitmap)
+        
+        self.buffer, self.spareBuffer = self.spareBuffer, self.buffer
+        self.bufferTs = now
 
-        for d in self.data:
-            ts = d[0]
-            dl = d[1]
-            ul = d[2]
+    @metrics.Timed('frame.DrawLines')
+    def DrawLines(self, dc, now, since=None):
+      # Draw the graph using the current upload/download values, optionally only those on or after time 'since'
+        graph.DrawGraph(dc, self.series, now, self.bufferSize.height, self.scale * BYTES_PER_K, self.zoom,
+                        self.pens, self.peakPens, since)
             
-            x = now - ts - 1
-            y0  = h
-            yDl = y0 - dl * h / (self.scale * BYTES_PER_K)
-            yUl = y0 - ul * h / (self.scale * BYTES_PER_K)
-            
-            if dl < ul:
-                dc.SetPen(self.olPen)
-                dc.DrawLine(x, y0, x, yDl)
-                dc.SetPen(self.ulPen)
-                dc.DrawLine(x, yDl, x, yUl)
-            else:
-                dc.SetPen(self.olPen)
-                dc.DrawLine(x, y0, x, yUl)
-                dc.SetPen(self.dlPen)
-                dc.DrawLine(x, yUl, x, yDl)
+    @metrics.Timed('frame.OnNewData')
+    def OnNewData(self):
+      # Called on the UI thread when the hub has new rows for us
+        if not self:
+          # The window was closed before this call was processed
+            return
+        
+        result = self.poller.Take()
+        if result == None:
+            return
+        now, zoom, rows, reloaded = result
+        if zoom != self.zoom:
+          # These rows were read before the zoom level changed, the hub will send the right ones shortly
+            return
+        width = self.viewWidth
+        
+        if reloaded:
+          # The hub has started again from scratch, so throw away what we had
+            for series in self.series:
+                series.Clear()
+            self.stats.Clear()
+            self.autoScale.Clear()
+            self.reInitBuffer = True
+        if zoom == 1:
+            self.stats.Extend(rows)
+        for series in self.series:
+            series.Resize(width + 1)
+        self.lastPoll = now
+        
+        end = self.GetGraphEnd(now)
+        if not rows and end == self.bufferTs and not self.reInitBuffer:
+          # Nothing has been written since the last tick and the graph hasn't moved, so there is nothing to redraw
+            return
+        oldest = end - width * zoom
+        self.AddRows(rows, now)
+        
+      # Throw away anything that has scrolled off the left-hand side of the graph
+        for series in self.series:
+            series.DropBefore(oldest)
+        if self.prefs.Get('autoscale'):
+            self.UpdateAutoScale(rows, oldest)
+
+      # Update the graph, only drawing the whole thing again if we have to. While scrolling back through history this
+      # just draws the tiles again, in case the newest one has been read again.
+        if self.reInitBuffer or self.historyEnd != None:
+            self.InitBuffer()
+        else:
+            self.ScrollBuffer(end)
+        self.panel.Refresh(False)
+        
+        self.UpdateCaption(now, end)
+        
+        if self.metricsPath and time.time() - self.metricsWritten >= METRICS_INTERVAL:
+            metrics.WriteFile(self.metricsPath)
+            self.metricsWritten = time.time()
+        if time.time() - self.snapshotSaved >= SNAPSHOT_INTERVAL:
+            self.SaveSnapshot()
+        if self.feed and not self.main:
+            self.feed.Report(self.poller, width)
+        
+    def GetStat(self, name, now):
+        if name in (TODAY, MONTH):
+            return self.totals[name] if self.totals else (0, 0)
+        return self.stats.Get(name, now)
+        
+    def UpdateCaption(self, now, end):
+      # The caption and tooltip show the totals for all the hosts. When zoomed out the caption shows the newest bucket,
+      # otherwise it shows whichever statistic the user has chosen, and the tooltip shows some more.
+        if self.zoom == 1:
+            name = self.prefs.Get('caption')
+            if name not in TAGS:
+                name = NOW
+            dl, ul = self.GetStat(name, now)
+            caption = self.FormatStat(name, dl, ul)
+            if TAGS[name]:
+                caption += " [" + _(TAGS[name]) + "]"
             
-    def OnTimer(self, event):
-      # Query the database to get the latest values
-        now = int(time.time())
-        results = self.db.GetData(now - self.GetSize().width, now)
+            lines = []
+            for stat, label, tag in LABELS:
+                if stat in self.prefs.Get('tooltip'):
+                    dl, ul = self.GetStat(stat, now)
+                    lines.append(_(label) + ": " + self.FormatStat(stat, dl, ul))
+            tooltip = "\n".join(lines)
+        else:
+            dl, ul = 0, 0
+            for series in self.series:
+                values = series.data.Find(end - self.zoom)
+                if values:
+                    dl += values[0]
+                    ul += values[1]
+            caption = self.FormatAmounts(dl, ul) + " [" + ZOOM_LEVELS[self.zoomIndex][1] + "]"
+            tooltip = ""
+        
+        if self.historyEnd != None:
+          # Show where we have scrolled back to rather than the latest values
+            caption = time.strftime(HISTORY_FORMAT, time.localtime(self.historyEnd)) + " [" + _("history") + "]"
+        
+        warning = self.GetQuotaWarning()
+        if warning:
+            caption = "! " + caption
+            tooltip = warning + ("\n" + tooltip if tooltip else "")
+        
+        if caption != self.label.GetLabel():
+            self.label.SetLabel(caption)
+        if tooltip != self.tooltip:
+            self.tooltip = tooltip
+            self.panel.SetToolTipString(tooltip)
+            self.label.SetToolTipString(tooltip)
 
-      # Store the results and set the flag indicating that the graph should be re-drawn
-        self.data = results[1]
-        self.reInitBuffer = True
-        self.panel.Refresh()
-        self.label.SetLabel(self.FormatAmounts(results[0][0], results[0][1]))
+    def StartAutoScale(self):
+      # Auto scaling has just been turned on, so find the largest value on the graph at the moment. Anything left over from
+      # the last time it was on is thrown away first, or those values would stop the scale from coming down.
+        self.autoScale.Clear()
+        if self.lastPoll == None:
+            return
+        values = []
+        for series in self.series:
+            buf = series.data if self.zoom == 1 else series.peaks
+            for start, end in buf.Spans():
+                for i in range(start, end):
+                    values.append((buf.ts[i], max(buf.dl[i], buf.ul[i])))
+        values.sort()
+        for ts, value in values:
+            self.autoScale.Add(ts, value)
+        self.autoScale.Update(self.GetGraphEnd(self.lastPoll) - self.viewWidth * self.zoom)
+        
+    def UpdateAutoScale(self, rows, oldest):
+      # Keep track of the largest value on the graph, when zoomed out this is the largest of the peaks
+        if self.zoom == 1:
+            for row in rows:
+                self.autoScale.Add(row[0], max(row[1], row[2]))
+        else:
+            for row in rows:
+                self.autoScale.Add(row[0], max(row[3], row[4]))
+                
+        if self.autoScale.Update(oldest):
+          # The whole graph needs drawing again at the new scale
+            self.scale = self.autoScale.scale
+            self.reInitBuffer = True
+            self.UpdateHistoryStyle()
+        
+    def AddRows(self, rows, now):
+      # Store the new rows in the right Series, when there are several they are tagged with the index of their host
+        if len(self.series) == 1:
+            rowsByHost = [rows]
+        else:
+            rowsByHost = [[] for series in self.series]
+            for row in rows:
+                rowsByHost[row[-1]].append(row)
+        
+        for series, hostRows in zip(self.series, rowsByHost):
+            if self.zoom == 1:
+                series.data.Extend(hostRows)
+            else:
+                series.AddBuckets(hostRows, now, self.zoom)
 
 class TrayIcon(wx.TaskBarIcon):  
-    def __init__(self, parent, menu, icon):  
+    def __init__(self, parent, icon):  
         wx.TaskBarIcon.__init__(self)  
         self.parentApp = parent  
-        self.menu = menu
         self.CreateMenu()
+        self.icon = icon
         self.SetIcon(icon, "BitMeter OS")  
         self.Bind(wx.EVT_TASKBAR_LEFT_UP, self.ShowHideGraph)  
 
+    def SetToolTip(self, text):
+        self.SetIcon(self.icon, text)
+        
     def ShowHideGraph(self, event):
         self.parentApp.Show(True)
         self.parentApp.Raise()
-        self.parentApp.showHideMain.SetText(_('Hide Graph'))
+        self.parentApp.UpdateShowHideLabel()
         
     def CreateMenu(self):  
         self.Bind(wx.EVT_TASKBAR_RIGHT_UP, self.ShowMenu)  
 
     def ShowMenu(self,event):  
-        self.PopupMenu(self.menu)  
+        self.PopupMenu(self.parentApp.GetPopupMenu())  
 
             
 class BitMeterApp(wx.App):
     def OnInit(self):
-        dbPath = os.getenv('BITMETER_DB')
+      # Data is read from local database files and/or the web interfaces of BitMeter OS on other machines
+        locations = GetSourceUrls()
+        if os.getenv('BITMETER_DB') or not locations:
+            locations = GetDefaultPaths() + locations
+        dbPaths = [location for location in locations if not IsUrl(location)]
+        
+      # ...unless we are replaying data or making it up (see replay.py), in which case we don't need BitMeter OS to be installed
+        feed = None
+        if sys.argv[1:2] in (['replay'], ['synthetic']):
+            import replay
+            feed = replay.ParseArgs(sys.argv[1:])
+            dbPaths = [dbPath for dbPath in dbPaths if dbPath and os.path.exists(dbPath)]
         
       # This holds flags indicating which display features are available on the current platform
         capabilities = {}
         
         if sys.platform == 'win32':
           # Windows
-            dbPath = dbPath or "/Documents and Settings/All Users/Application Data/BitMeterOS/bitmeter.db"
             capabilities['clickthru'] = True
             capabilities['opacity']   = True
             
         elif sys.platform == 'darwin':
           # Mac OSX
-            dbPath = dbPath or "/Library/Application Support/BitMeter/bitmeter.db"
             capabilities['clickthru'] = False
             capabilities['opacity']   = True
             
         elif sys.platform.startswith('linux'):
           # Linux
-            dbPath = dbPath or "/var/lib/bitmeter/bitmeter.db"
             capabilities['clickthru'] = False
             capabilities['opacity']   = False
         
-        if not os.path.exists(dbPath):
-            print (_('Database file not found') + ': ' + dbPath)
-            sys.exit(1)
-        
-      # Initial values for the user preferences
-        defaultPrefs = {}
-        defaultPrefs['dlcolour']  = '(255,0,0)'
-        defaultPrefs['ulcolour']  = '(0,255,0)'
-        defaultPrefs['olcolour']  = '(255,255,0)'
-        defaultPrefs['bgcolour']  = '(255,255,255)'
-        defaultPrefs['size']      = '(150,85)'
-        defaultPrefs['position']  = '(100,100)'
-        defaultPrefs['scale']     = '1000'
-        defaultPrefs['opacity']   = '70'
-        defaultPrefs['float']     = 'True'
-        defaultPrefs['clickthru'] = 'False'
-        
-        frame = MyFrame(None, "", Db(dbPath, 'client.py.'), defaultPrefs, capabilities)
+        for dbPath in dbPaths:
+            if not dbPath or not os.path.exists(dbPath):
+                print (_('Database file not found') + ': ' + str(dbPath))
+                sys.exit(1)
+        if feed:
+            locations = [feed.location]
+        capabilities['multihost'] = len(locations) > 1
+        
+      # The type and initial value of each of the user preferences
+        prefsSchema = GetSchema()
+        
+      # Preferences are stored in the first database, or in a file of our own if we only have web interfaces to read from
+        if dbPaths:
+            db = Db(dbPaths[0], PREFS_PREFIX)
+            if not db.UsesDataIndex():
+                print (_('Warning: the data table has no index on ts, the graph will be slow to update'))
+        else:
+            db = Db(PREFS_PATH, PREFS_PREFIX)
+            db.CreateConfigTable()
+        
+        frame = MyFrame(None, "", db, prefsSchema, capabilities, locations, feed)
         self.SetTopWindow(frame)
         frame.Show(True)
         
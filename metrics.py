@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""
+Timing measurements for the parts of the client that run every second, so that we can tell whether
+a slow graph is waiting for sqlite, working out the lines, or painting. Each named measurement is
+a Histogram of durations in logarithmically sized buckets, which costs the same to update however
+many times it has been recorded, and from which percentiles can be estimated. The histograms can
+be shown in the Performance dialog, or written to a file in the Prometheus text format. The
+Profiler class runs cProfile on the UI thread on demand.
+"""
+
+import math
+import time
+import threading
+from files import WriteAtomically
+
+BUCKETS_PER_OCTAVE = 4  # each bucket covers durations up to 2**(1/4) (about 1.19) times longer than the previous one
+MAX_BUCKET = 120        # durations are in microseconds, so this covers up to about 15 minutes
+PERCENTILES = [50, 95, 99]
+
+class Histogram:
+    def __init__(self, name):
+        self.name   = name
+        self.counts = [0] * (MAX_BUCKET + 1)
+        self.count  = 0
+        self.total  = 0.0
+        self.max    = 0.0
+        self.lock   = threading.Lock()
+
+    def Record(self, seconds):
+        us = seconds * 1000000
+        i = 0 if us < 1 else min(MAX_BUCKET, 1 + int(math.log(us, 2) * BUCKETS_PER_OCTAVE))
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def Percentile(self, p):
+      # Return an estimate, in seconds, of the duration that 'p' percent of the measurements were no longer than
+        with self.lock:
+            counts, count = list(self.counts), self.count
+        if count == 0:
+            return 0.0
+        rank = int(math.ceil(count * p / 100.0))
+        seen = 0
+        for i, n in enumerate(counts):
+            seen += n
+            if seen >= rank:
+                break
+        if i == 0:
+            return 0.0
+      # The upper end of the bucket, so we never claim that something was quicker than it was
+        return min(self.max, 2 ** (float(i) / BUCKETS_PER_OCTAVE) / 1000000)
+
+    def Mean(self):
+        return self.total / self.count if self.count else 0.0
+
+HISTOGRAMS = {}
+histogramsLock = threading.Lock()
+
+def GetHistogram(name):
+    histogram = HISTOGRAMS.get(name)
+    if histogram == None:
+        with histogramsLock:
+            histogram = HISTOGRAMS.setdefault(name, Histogram(name))
+    return histogram
+
+def Record(name, seconds):
+    GetHistogram(name).Record(seconds)
+
+class Timer:
+  # Use as 'with metrics.Timer(name):' to time a block of code
+    def __init__(self, name):
+        self.histogram = GetHistogram(name)
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.histogram.Record(time.time() - self.start)
+        return False
+
+def Timed(name):
+  # A decorator that times every call to a function or method
+    def Decorate(fn):
+        histogram = GetHistogram(name)
+        def Wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.Record(time.time() - start)
+        Wrapper.__name__ = fn.__name__
+        Wrapper.__doc__  = fn.__doc__
+        return Wrapper
+    return Decorate
+
+def GetSummary():
+  # Return a list of (name, count, mean, p50, p95, p99, max) tuples in name order, durations in seconds
+  # Other threads may be adding new histograms, so take a copy of the list first
+    with histogramsLock:
+        histograms = sorted(HISTOGRAMS.items())
+    summary = []
+    for name, histogram in histograms:
+        summary.append(tuple([name, histogram.count, histogram.Mean()] + [histogram.Percentile(p) for p in PERCENTILES] + [histogram.max]))
+    return summary
+
+def Format():
+  # Return the measurements in the Prometheus text format
+    lines = ['# TYPE bitmeter_duration_seconds summary']
+    for name, count, mean, p50, p95, p99, maxTime in GetSummary():
+        for p, value in zip(PERCENTILES, (p50, p95, p99)):
+            lines.append('bitmeter_duration_seconds{name="%s",quantile="%.2f"} %.6f' % (name, p / 100.0, value))
+        lines.append('bitmeter_duration_seconds_sum{name="%s"} %.6f' % (name, HISTOGRAMS[name].total))
+        lines.append('bitmeter_duration_seconds_count{name="%s"} %d' % (name, count))
+    return '\n'.join(lines) + '\n'
+
+def WriteFile(path):
+    WriteAtomically(path, Format())
+
+class Profiler:
+  # Runs cProfile on the thread that calls Start (the UI thread), until Stop is called
+    def __init__(self):
+        self.profile = None
+
+    def IsRunning(self):
+        return self.profile != None
+
+    def Start(self):
+        import cProfile
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def Stop(self, path):
+      # Stop profiling and save the results to 'path', which can be read with the pstats module
+        self.profile.disable()
+        self.profile.dump_stats(path)
+        self.profile = None
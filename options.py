@@ -6,6 +6,7 @@ This module manages the Options dialog window of the BitMeter OS desktop client
 
 import wx
 import gettext
+from stats import LABELS
 
 _=gettext.gettext
 
@@ -27,6 +28,13 @@ class OptionsDialog(wx.Dialog):
         scaleBoxSizer.Add(self.scaleTxt, 0)
         scaleBoxSizer.Add((10,0),0)
         scaleBoxSizer.Add(kbpsLabel, 0, wx.ALIGN_CENTER_VERTICAL)
+        
+      # Auto Scale checkbox, when this is ticked the scale is chosen to fit the data on the graph
+        autoScaleLabel = wx.StaticText(self, -1, _("Auto Scale:"))
+        self.autoScaleChk = wx.CheckBox(self, -1, "")
+        self.autoScaleChk.SetValue(prefs.Get('autoscale'))
+        self.autoScaleChk.Bind(wx.EVT_CHECKBOX, self.OnAutoScaleClick)
+        self.scaleTxt.Enable(not prefs.Get('autoscale'))
 
       # The Opacity slider
         if self.capabilities['opacity']:
@@ -34,19 +42,49 @@ class OptionsDialog(wx.Dialog):
             self.opacitySlider = wx.Slider(self, size=(150,-1), style=wx.SL_HORIZONTAL | wx.SL_AUTOTICKS | wx.SL_LABELS)
             self.opacitySlider.SetMin(10)
             self.opacitySlider.SetMax(100)
-            self.opacitySlider.SetValue(self.prefs.GetNum('opacity'))
+            self.opacitySlider.SetValue(self.prefs.Get('opacity'))
             self.opacitySlider.SetTickFreq(5,1)
         
       # Float checkbox
         floatLabel = wx.StaticText(self, -1, _("Float:"))
         self.floatChk = wx.CheckBox(self, -1, "")
-        self.floatChk.SetValue(prefs.GetObj('float'))
+        self.floatChk.SetValue(prefs.Get('float'))
 
       # Click-Through checkbox
         if self.capabilities['clickthru']:
             clickThruLabel = wx.StaticText(self, -1, _("Click Through:"))
             self.clickThruChk = wx.CheckBox(self, -1, "")
-            self.clickThruChk.SetValue(prefs.GetObj('clickthru'))
+            self.clickThruChk.SetValue(prefs.Get('clickthru'))
+
+      # Stack Hosts checkbox, only relevant when there are several databases
+        if self.capabilities['multihost']:
+            stackedLabel = wx.StaticText(self, -1, _("Stack Hosts:"))
+            self.stackedChk = wx.CheckBox(self, -1, "")
+            self.stackedChk.SetValue(prefs.Get('stacked'))
+
+      # The statistic shown in the caption below the graph, and those shown in its tooltip
+        captionLabel = wx.StaticText(self, -1, _("Caption:"))
+        self.captionChoice = wx.Choice(self, -1, choices=[_(label) for name, label, tag in LABELS])
+        names = [name for name, label, tag in LABELS]
+        if prefs.Get('caption') in names:
+            self.captionChoice.SetSelection(names.index(prefs.Get('caption')))
+        else:
+            self.captionChoice.SetSelection(0)
+            
+        tooltipLabel = wx.StaticText(self, -1, _("Tooltip:"))
+        self.tooltipList = wx.CheckListBox(self, -1, choices=[_(label) for name, label, tag in LABELS])
+        for i, name in enumerate(names):
+            self.tooltipList.Check(i, name in prefs.Get('tooltip'))
+
+      # Monthly quota, in MB for downloads and uploads together. A warning is shown when it is nearly used up.
+        quotaLabel = wx.StaticText(self, -1, _("Monthly Quota:"))
+        self.quotaTxt = wx.TextCtrl(self, -1, str(prefs.Get('quota')), size=(100, -1))
+        self.quotaTxt.Bind(wx.EVT_CHAR, self.onScaleChar)
+        
+        quotaBoxSizer = wx.BoxSizer(wx.HORIZONTAL)
+        quotaBoxSizer.Add(self.quotaTxt, 0)
+        quotaBoxSizer.Add((10,0),0)
+        quotaBoxSizer.Add(wx.StaticText(self, -1, _("MB (0 for none)")), 0, wx.ALIGN_CENTER_VERTICAL)
 
       # Colour picker buttons
         dlColLabel = wx.StaticText(self, -1, _("Download Colour:"))
@@ -82,11 +120,19 @@ class OptionsDialog(wx.Dialog):
         
         gridSizer.AddMany(vPadRow)
         gridSizer.AddMany([(lPad, 0), scaleLabel, scaleBoxSizer, (rPad,0)])
+        gridSizer.AddMany([(lPad, 0), autoScaleLabel, self.autoScaleChk, (rPad,0)])
         if self.capabilities['opacity']:
             gridSizer.AddMany([(lPad,0), opacityLabel, self.opacitySlider, (rPad,0)])
         gridSizer.AddMany([(lPad,0), floatLabel, self.floatChk, (rPad,0)])
         if self.capabilities['clickthru']:
             gridSizer.AddMany([(lPad,0), clickThruLabel, self.clickThruChk, (rPad, 0)])
+        if self.capabilities['multihost']:
+            gridSizer.AddMany([(lPad,0), stackedLabel, self.stackedChk, (rPad, 0)])
+        
+        gridSizer.AddMany(vPadRow)    
+        gridSizer.AddMany([(lPad,0), captionLabel, self.captionChoice, (rPad,0)])
+        gridSizer.AddMany([(lPad,0), tooltipLabel, self.tooltipList, (rPad,0)])
+        gridSizer.AddMany([(lPad,0), quotaLabel, quotaBoxSizer, (rPad,0)])
         
         gridSizer.AddMany(vPadRow)    
         gridSizer.AddMany([(lPad,0), dlColLabel, self.dlColBtn, (rPad,0)])
@@ -127,6 +173,9 @@ class OptionsDialog(wx.Dialog):
         else: 
             return False 
     
+    def OnAutoScaleClick(self, event):
+        self.scaleTxt.Enable(not self.autoScaleChk.GetValue())
+        
     def PromptForDlColour(self, event):
         self.PromptForColour('dlcolour')
 
@@ -142,26 +191,34 @@ class OptionsDialog(wx.Dialog):
     def PromptForColour(self, name):
       # Display the colour picker dialog
         colData = wx.ColourData()
-        colData.SetColour(self.prefs.GetCol(name))
+        colData.SetColour(self.prefs.Get(name))
         colData.SetChooseFull(False)
         dlg = wx.ColourDialog(self, colData)
         if dlg.ShowModal() == wx.ID_OK:
           # User picked a colur and clicked 'OK' so add the new colour to the prefs dictionary
-            self.prefs.SetObj(name, dlg.GetColourData().GetColour())
+            self.prefs.Set(name, dlg.GetColourData().GetColour())
         dlg.Destroy()
 
     def OnOkClick(self,event):
       # Update the prefs object with the values selected on the screen
         if (self.scaleTxt.GetValue() == '') or (int(self.scaleTxt.GetValue()) == 0):
-             self.scaleTxt.SetValue(str(self.prefs.GetNum('scale')))
+             self.scaleTxt.SetValue(str(self.prefs.Get('scale')))
              
-        self.prefs.SetObj('scale', self.scaleTxt.GetValue())
+        self.prefs.Set('scale', int(self.scaleTxt.GetValue()))
+        self.prefs.Set('autoscale', self.autoScaleChk.GetValue())
+        self.prefs.Set('quota', int(self.quotaTxt.GetValue() or '0'))
         if self.capabilities['opacity']:
-            self.prefs.SetObj('opacity', self.opacitySlider.GetValue())
+            self.prefs.Set('opacity', self.opacitySlider.GetValue())
             
-        self.prefs.SetObj('float', self.floatChk.GetValue())
+        self.prefs.Set('float', self.floatChk.GetValue())
         if self.capabilities['clickthru']:
-            self.prefs.SetObj('clickthru', self.clickThruChk.GetValue())
+            self.prefs.Set('clickthru', self.clickThruChk.GetValue())
+        if self.capabilities['multihost']:
+            self.prefs.Set('stacked', self.stackedChk.GetValue())
+            
+        names = [name for name, label, tag in LABELS]
+        self.prefs.Set('caption', names[self.captionChoice.GetSelection()])
+        self.prefs.Set('tooltip', [name for i, name in enumerate(names) if self.tooltipList.IsChecked(i)])
             
         self.prefs.Save()
       # Notify the main window of the new prefs
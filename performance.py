@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""
+This module manages the Performance dialog window of the BitMeter OS desktop client, which shows
+how long the work done each second is taking (see metrics.py)
+"""
+
+import wx
+import gettext
+import metrics
+
+_=gettext.gettext
+
+COLUMNS = [_('Name'), _('Count'), _('Mean ms'), _('p50 ms'), _('p95 ms'), _('p99 ms'), _('Max ms')]
+
+class PerformanceDialog(wx.Dialog):
+    def __init__(self):
+        wx.Dialog.__init__(self, None, -1, _("Performance"), style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+
+        self.list = wx.ListCtrl(self, -1, size=(520, 200), style=wx.LC_REPORT | wx.LC_SINGLE_SEL)
+        for i, title in enumerate(COLUMNS):
+            self.list.InsertColumn(i, title, wx.LIST_FORMAT_LEFT if i == 0 else wx.LIST_FORMAT_RIGHT)
+        self.list.SetColumnWidth(0, 150)
+
+        refreshBtn = wx.Button(self, -1, _("Refresh"))
+        refreshBtn.Bind(wx.EVT_BUTTON, self.OnRefreshClick)
+        saveBtn = wx.Button(self, -1, _("Save Metrics..."))
+        saveBtn.Bind(wx.EVT_BUTTON, self.OnSaveClick)
+        closeBtn = wx.Button(self, -1, _("Close"))
+        closeBtn.Bind(wx.EVT_BUTTON, self.OnCloseClick)
+
+        boxSizer = wx.BoxSizer(wx.HORIZONTAL)
+        boxSizer.Add(refreshBtn, 0)
+        boxSizer.Add((10, 0), 0)
+        boxSizer.Add(saveBtn, 0)
+        boxSizer.Add((10, 0), 1, wx.EXPAND)
+        boxSizer.Add(closeBtn, 0)
+
+        boxMain = wx.BoxSizer(wx.VERTICAL)
+        boxMain.Add(self.list, 1, wx.EXPAND | wx.ALL, 10)
+        boxMain.Add(boxSizer, 0, wx.EXPAND | wx.LEFT | wx.RIGHT | wx.BOTTOM, 10)
+
+        self.SetSizer(boxMain)
+        self.Fit()
+        self.ShowMetrics()
+
+    def ShowMetrics(self):
+        self.list.DeleteAllItems()
+        for row in metrics.GetSummary():
+            i = self.list.InsertStringItem(self.list.GetItemCount(), row[0])
+            self.list.SetStringItem(i, 1, str(row[1]))
+            for col, seconds in enumerate(row[2:]):
+                self.list.SetStringItem(i, col + 2, "%.2f" % (seconds * 1000))
+
+    def OnRefreshClick(self, event):
+        self.ShowMetrics()
+
+    def OnSaveClick(self, event):
+      # Save the measurements in the Prometheus text format
+        dlg = wx.FileDialog(self, _("Save Metrics"), defaultFile="bitmeter-metrics.prom", style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT)
+        if dlg.ShowModal() == wx.ID_OK:
+            metrics.WriteFile(dlg.GetPath())
+        dlg.Destroy()
+
+    def OnCloseClick(self, event):
+        self.Close()
@@ -2,58 +2,151 @@
 
 """
 The Prefs class is used to contain the users preferences, such as colour selection, and the size
-and position of the graph. Prefs 
+and position of the graph. Each preference has a type and a default value, given in the schema
+passed to the constructor. Values are read from the database and parsed once, the first time one
+is needed, and only the values that have been changed are written back when Save is called.
+wx is only imported when a colour is needed, so the other types can be used without a display.
 """
 
-import wx
+from stats import NOW, AVG_1M, AVG_5M, PEAK, P95, TOTAL, TODAY, MONTH
+
+PREFS_PREFIX = 'client.py.' # the names of our values in the 'config' table start with this
+
+class IntPref(object):
+    def Parse(self, text):
+        return int(text)
+
+    def Format(self, value):
+        return str(value)
+
+    def Coerce(self, value):
+        return int(value)
+
+class BoolPref(object):
+    def Parse(self, text):
+        return text.strip() == 'True'
+
+    def Format(self, value):
+        return str(value)
+
+    def Coerce(self, value):
+        return bool(value)
+
+class TuplePref(object):
+  # A tuple of integers, such as a size or position, stored as '(x,y)'
+    def Parse(self, text):
+        value = tuple([int(part) for part in text.strip().strip('()').split(',') if part.strip()])
+        if not value:
+            raise ValueError('Empty tuple')
+        return value
+
+    def Format(self, value):
+        return '(' + ','.join([str(part) for part in value]) + ')'
+
+    def Coerce(self, value):
+        return tuple([int(part) for part in value])
+
+class ColourPref(TuplePref):
+  # A colour, stored as '(r,g,b)' and returned as a wx.Colour
+    def Parse(self, text):
+        return self.Coerce(TuplePref.Parse(self, text))
+
+    def Format(self, value):
+        return TuplePref.Format(self, (value.Red(), value.Green(), value.Blue()))
+
+    def Coerce(self, value):
+        import wx
+        if isinstance(value, wx.Colour):
+            return wx.Colour(value.Red(), value.Green(), value.Blue())
+        else:
+            return wx.Colour(value[0], value[1], value[2])
+
+class TextPref(object):
+    def Parse(self, text):
+        return text.strip()
+
+    def Format(self, value):
+        return value
+
+    def Coerce(self, value):
+        return str(value)
+
+class NamesPref(object):
+  # A tuple of names, stored separated by commas
+    def Parse(self, text):
+        return tuple([name.strip() for name in text.split(',') if name.strip()])
+
+    def Format(self, value):
+        return ','.join(value)
+
+    def Coerce(self, value):
+        return tuple([str(name) for name in value])
+
+INT    = IntPref()
+BOOL   = BoolPref()
+TUPLE  = TuplePref()
+COLOUR = ColourPref()
+TEXT   = TextPref()
+NAMES  = NamesPref()
+
+def GetSchema():
+  # Return the type and initial value of each of the user preferences
+    schema = {}
+    schema['dlcolour']  = (COLOUR, (255,0,0))
+    schema['ulcolour']  = (COLOUR, (0,255,0))
+    schema['olcolour']  = (COLOUR, (255,255,0))
+    schema['bgcolour']  = (COLOUR, (255,255,255))
+    schema['size']      = (TUPLE,  (150,85))
+    schema['position']  = (TUPLE,  (100,100))
+    schema['scale']     = (INT,    1000)
+    schema['autoscale'] = (BOOL,   False)
+    schema['opacity']   = (INT,    70)
+    schema['float']     = (BOOL,   True)
+    schema['clickthru'] = (BOOL,   False)
+    schema['stacked']   = (BOOL,   True)
+    schema['caption']   = (TEXT,   NOW)
+    schema['tooltip']   = (NAMES,  (AVG_1M, AVG_5M, PEAK, P95, TOTAL, TODAY, MONTH))
+    schema['quota']     = (INT,    0)
+    return schema
 
 class Prefs():
-    def __init__(self, db, defaults):
-        self.db       = db
-        self.defaults = defaults
-        self.prefs    = None
+    def __init__(self, db, schema):
+        self.db     = db
+        self.schema = schema # name -> (type, default value)
+        self.prefs  = None
+        self.dirty  = set()
+
+    def Load(self):
+      # Read and parse all the stored values, anything that is missing or can't be parsed gets its default value
+        stored = self.db.GetPrefs()
+        self.prefs = {}
+        for name, (prefType, default) in self.schema.items():
+            text = stored.get(name)
+            try:
+                self.prefs[name] = prefType.Parse(text) if text != None else prefType.Coerce(default)
+            except (ValueError, IndexError):
+                self.prefs[name] = prefType.Coerce(default)
 
     def Save(self):
-      # Save the current set of prefs to the database
-        self.db.SavePrefs(self.prefs)
+      # Save any values that have changed to the database
+        if not self.dirty:
+            return
+        vals = {}
+        for name in self.dirty:
+            vals[name] = self.schema[name][0].Format(self.prefs[name])
+        self.db.SavePrefs(vals)
+        self.dirty.clear()
 
     def Get(self, name):
         if self.prefs == None:
           # This is the first time we have accessed a value, so read from the database
-            self.prefs = self.db.GetPrefs()
-        
-        val = self.prefs.get(name)
-        if val == None:
-            val = self.defaults.get(name)
-            
-        return val
-        
-    def GetNum(self, name):
-      # Convert the named value into a number and return
-        val = self.Get(name)
-        if val != None:
-            return int(val)
-        else:
-            return None
-        
-    def GetCol(self, name):
-      # Convert the named value into a colour and return
-        val = self.GetObj(name)
-        if val != None:
-            col = wx.Colour()
-            col.Set(val[0],val[1],val[2])
-            return col
-        else:
-            return None    
-            
-    def GetObj(self, name):
-      # Eval the named value and return the result
-        val = self.Get(name)
-        if val != None:
-            return eval(val)
-        else:
-            return None    
-                
-    def SetObj(self, name, value):
-      # Store the name/value pair
-        self.prefs[name] = str(value)
\ No newline at end of file
+            self.Load()
+        return self.prefs[name]
+
+    def Set(self, name, value):
+      # Store a new value, it will be written to the database by the next call to Save if it is different from the old one
+        prefType = self.schema[name][0]
+        value = prefType.Coerce(value)
+        if prefType.Format(value) != prefType.Format(self.Get(name)):
+            self.prefs[name] = value
+            self.dirty.add(name)
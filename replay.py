@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+"""
+Data sources for stress testing the graph: part of a recorded database replayed at any speed, or
+made-up traffic with a given pattern. The data goes through the hub and the graph window in the
+usual way, with the time coming from a ReplayClock. Run with one of:
+
+    python main.py replay --db bitmeter.db --from "2024-01-01 00:00" --to "2024-01-02 00:00" --speed 60 --fps 30
+    python main.py synthetic --pattern bursts --speed 10 --fps 60 --width 1000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import gettext
+from sources import MakeBuckets
+from db import Db, GetDefaultPath
+from export import ParseTime
+
+_=gettext.gettext
+
+REPORT_INTERVAL = 5 # seconds between reports of the frame rate
+PATTERNS = ['bursts', 'saturation', 'gaps']
+
+class ReplayClock:
+  # Starts at time 'start' and runs 'speed' times faster than real time. If there is an 'end' then it goes back
+  # to 'start' on reaching it, which the hub treats as the clock having gone backwards and reads everything again.
+    def __init__(self, start, end=None, speed=1.0):
+        self.start     = start
+        self.end       = end
+        self.speed     = speed
+        self.realStart = time.time()
+
+    def Now(self):
+        elapsed = (time.time() - self.realStart) * self.speed
+        if self.end != None and self.end > self.start:
+            elapsed %= self.end - self.start
+        return self.start + elapsed
+
+class ClockedSource:
+  # A data source (see sources.py) that never returns anything newer than the current time on its clock. Subclasses provide
+  # GetRows(start, end), which returns the (ts,dl,ul) rows with timestamps from 'start' up to (but not including) 'end'.
+    def __init__(self, clock):
+        self.clock  = clock
+        self.lastTs = None
+
+    def Close(self):
+        pass
+
+    def ResetDelta(self):
+        self.lastTs = None
+
+    def GetDelta(self):
+        return self.lastTs
+
+    def SetDelta(self, delta):
+        self.lastTs = delta
+
+    def GetNewData(self, t):
+        if self.lastTs == None or self.lastTs < t:
+            start = t
+        else:
+            start = self.lastTs + 1
+
+      # Nothing more can turn up for the seconds up to 'now', so we carry on from there even if some had no data
+        now = int(self.clock.Now())
+        rows = self.GetRows(start, now + 1)
+        if now >= start:
+            self.lastTs = now
+        return rows
+
+    def GetNewBuckets(self, t, bucket):
+      # As HttpSource, the newest bucket is fetched again each time because it is still filling up
+        start = t // bucket * bucket
+        if self.lastTs != None and self.lastTs >= start:
+            start = self.lastTs
+
+        buckets = MakeBuckets(self.GetRows(start, int(self.clock.Now()) + 1), bucket)
+        if buckets:
+            self.lastTs = buckets[-1][0]
+        return buckets
+
+    def GetRange(self, t0, t1, bucket=None):
+        rows = self.GetRows(t0, min(t1, int(self.clock.Now()) + 1))
+        return MakeBuckets(rows, bucket) if bucket else rows
+
+class ReplaySource(ClockedSource):
+  # Replays the data in a BitMeter OS database, the clock gives the (recorded) time that has been reached
+    def __init__(self, dbPath, clock):
+        ClockedSource.__init__(self, clock)
+        self.db = Db(dbPath, '', readOnly=True)
+
+    def Close(self):
+        self.db.Close()
+
+    def GetRows(self, start, end):
+        return list(self.db.IterData(start, end))
+
+class SyntheticSource(ClockedSource):
+  # Makes up the traffic for each second from the pattern, the seed and the time, so reading the same second
+  # twice gives the same values. 'peak' is the highest rate in bytes/sec.
+    def __init__(self, pattern, peak, seed, clock):
+        ClockedSource.__init__(self, clock)
+        self.pattern = pattern
+        self.peak    = peak
+        self.seed    = seed
+
+    def GetRows(self, start, end):
+        rows = []
+        for ts in range(start, end):
+            row = self.GetRow(ts)
+            if row:
+                rows.append(row)
+        return rows
+
+    def GetRow(self, ts):
+        r = random.Random(self.seed * 1000003 + ts)
+        if self.pattern == 'bursts':
+          # One burst at full speed at a random point in each minute, with very little traffic in between
+            period = random.Random(self.seed * 1000003 + ts // 60 * 60 + 1)
+            burstStart = period.randint(0, 50)
+            burstLength = period.randint(3, 20)
+            if burstStart <= ts % 60 < burstStart + burstLength:
+                level = r.uniform(0.7, 1.0)
+            else:
+                level = r.uniform(0, 0.05)
+            return (ts, int(self.peak * level), int(self.peak * level * r.uniform(0.05, 0.2)))
+
+        elif self.pattern == 'saturation':
+          # The download speed stays close to the peak, with a steady upload for the acknowledgements
+            return (ts, int(self.peak * r.uniform(0.95, 1.0)), int(self.peak * r.uniform(0.3, 0.35)))
+
+        else:
+          # Most half-minutes have no data at all, and the rest have scattered values
+            if random.Random(self.seed * 1000003 + ts // 30 * 30 + 1).random() < 0.7 or r.random() < 0.5:
+                return None
+            return (ts, int(self.peak * r.uniform(0, 0.6)), int(self.peak * r.uniform(0, 0.2)))
+
+class Feed:
+  # Everything the graph window needs to know about the replay: how to open the data source, the clock, how often
+  # to poll, and the size of the window. It also keeps count of the frames drawn and reports the frame rate.
+    def __init__(self, location, openSource, clock, fps, size):
+        self.location   = location
+        self.openSource = openSource
+        self.clock      = clock
+        self.interval   = 1.0 / fps
+        self.size       = size
+        self.frames     = 0
+        self.reported   = (time.time(), 0, 0, 0)
+        self.started    = self.reported
+
+    def OpenSource(self):
+      # Called on the hub thread
+        return self.openSource()
+
+    def CountFrame(self):
+        self.frames += 1
+
+    def Report(self, view, width, final=False):
+      # Write the frames/sec since the last report (or since the start, if this is the final one) to stderr, with the ticks
+      # that the window fell too far behind to draw (see HubView.dropped) and those the hub missed (see TickScheduler)
+        now = time.time()
+        lastTime, lastFrames, lastTicks, lastDropped = self.started if final else self.reported
+        if now - lastTime < REPORT_INTERVAL and not final:
+            return
+        elapsed = max(now - lastTime, 0.001)
+        ticks, dropped = view.ticks, view.dropped
+        sys.stderr.write(_('%s%.1f frames/sec, %.1f ticks/sec, %d dropped ticks, %d missed ticks, %d columns, %gx speed') % (
+            _('Overall: ') if final else '', (self.frames - lastFrames) / elapsed, (ticks - lastTicks) / elapsed,
+            dropped - lastDropped, view.hub.scheduler.missed, width, self.clock.speed) + '\n')
+        self.reported = (now, self.frames, ticks, dropped)
+
+def ParseArgs(args):
+  # Return a Feed for the 'replay' or 'synthetic' command line, exits with a message if the arguments are wrong
+    mode = args[0]
+    parser = argparse.ArgumentParser(prog='main.py ' + mode, description=_('Stress test the BitMeter OS graph'))
+    if mode == 'replay':
+        parser.add_argument('--db', default=GetDefaultPath(), help=_('path of the BitMeter OS database to replay'))
+        parser.add_argument('--from', dest='start', type=ParseTime, default=None, help=_('start of the data to replay (default: one hour before the end)'))
+        parser.add_argument('--to', dest='end', type=ParseTime, default=None, help=_('end of the data to replay (default: the newest data)'))
+    else:
+        parser.add_argument('--pattern', choices=PATTERNS, default=PATTERNS[0])
+        parser.add_argument('--peak', type=int, default=1000, help=_('highest rate in kB/s'))
+        parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--speed', type=float, default=1.0, help=_('how many times faster than real time the data arrives'))
+    parser.add_argument('--fps', type=float, default=1.0, help=_('number of times a second to read new data'))
+    parser.add_argument('--width', type=int, default=None, help=_('width of the graph window'))
+    parser.add_argument('--height', type=int, default=None, help=_('height of the graph window'))
+    opts = parser.parse_args(args[1:])
+
+    if opts.speed <= 0 or opts.fps <= 0:
+        parser.error(_('--speed and --fps must be more than 0'))
+    size = (opts.width or -1, opts.height or -1) if opts.width or opts.height else None
+
+    if mode == 'replay':
+        if not opts.db or not os.path.exists(opts.db):
+            parser.error(_('Database file not found') + ': ' + str(opts.db))
+        db = Db(opts.db, '', readOnly=True)
+        first, last = db.cn.execute('select min(ts), max(ts) from data').fetchone()
+        db.Close()
+        if first == None:
+            parser.error(_('The database has no data to replay'))
+        end = opts.end if opts.end != None else last
+        start = opts.start if opts.start != None else max(first, end - 3600)
+        if start >= end:
+            parser.error(_('--from must be before --to'))
+        clock = ReplayClock(start, end, opts.speed)
+        openSource = lambda: ReplaySource(opts.db, clock)
+        return Feed('replay:' + opts.db, openSource, clock, opts.fps, size)
+    else:
+        clock = ReplayClock(int(time.time()), None, opts.speed)
+        openSource = lambda: SyntheticSource(opts.pattern, opts.peak * 1024, opts.seed, clock)
+        return Feed('synthetic:' + opts.pattern, openSource, clock, opts.fps, size)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+"""
+Keeps a database of our own containing the total amounts downloaded and uploaded in each minute,
+hour, day and month, so that questions like 'how much has been transferred this month' can be
+answered by reading a single row rather than adding up millions of rows from the BitMeter OS
+'data' table. The totals are built up a chunk at a time on a background thread, starting from
+the last minute that was added to them, so the first run over a large database catches up
+gradually and later runs only have the last few minutes to add. Days and months are in local time.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from db import Db, BUSY_TIMEOUT
+
+ROLLUP_INTERVAL = 10    # seconds between updates once we have caught up
+BACKFILL_CHUNK  = 86400 # seconds of data added in each transaction while catching up
+BACKFILL_PAUSE  = 0.05  # seconds to wait between chunks, so catching up doesn't keep the BitMeter OS database busy
+LATE_SECONDS    = 5     # a minute is only added once it ended this long ago, in case some of its data arrives late
+
+TABLES = ['minute', 'hour', 'day', 'month']
+
+def MinuteStart(ts):
+    return ts // 60 * 60
+
+def HourStart(ts):
+    return ts // 3600 * 3600
+
+def DayStart(ts):
+    t = time.localtime(ts)
+    return int(time.mktime((t.tm_year, t.tm_mon, t.tm_mday, 0, 0, 0, 0, 0, -1)))
+
+def MonthStart(ts):
+    t = time.localtime(ts)
+    return int(time.mktime((t.tm_year, t.tm_mon, 1, 0, 0, 0, 0, 0, -1)))
+
+class Rollups:
+    def __init__(self, path):
+        self.cn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        with self.cn:
+            for table in TABLES:
+                self.cn.execute('create table if not exists %s (source text, ts integer, dl integer, ul integer, primary key (source, ts))' % table)
+            self.cn.execute('create table if not exists progress (source text primary key, ts integer)')
+
+    def Close(self):
+        self.cn.close()
+
+    def GetProgress(self, source):
+      # Return the time up to which the data from 'source' has been added, or None if we haven't started on it
+        row = self.cn.execute('select ts from progress where source=?', (source,)).fetchone()
+        return row[0] if row else None
+
+    def Add(self, source, minutes, endTs):
+      # Add the (minute start,dl,ul) totals to all the tables, and record that everything before 'endTs' is done.
+      # This all happens in one transaction, so if we are stopped part way through nothing is counted twice.
+        totals = dict([(table, {}) for table in TABLES[1:]])
+        for ts, dl, ul in minutes:
+            for table, start in (('hour', HourStart(ts)), ('day', DayStart(ts)), ('month', MonthStart(ts))):
+                prev = totals[table].get(start, (0, 0))
+                totals[table][start] = (prev[0] + dl, prev[1] + ul)
+
+        with self.cn:
+            self.cn.executemany('insert or replace into minute (source,ts,dl,ul) values (?,?,?,?)',
+                                [(source, ts, dl, ul) for ts, dl, ul in minutes])
+            for table in TABLES[1:]:
+                rows = [(source, start, dl, ul) for start, (dl, ul) in totals[table].items()]
+                self.cn.executemany('insert or ignore into %s (source,ts,dl,ul) values (?,?,0,0)' % table, [row[:2] for row in rows])
+                self.cn.executemany('update %s set dl=dl+?, ul=ul+? where source=? and ts=?' % table,
+                                    [(dl, ul, source, start) for source, start, dl, ul in rows])
+            self.cn.execute('insert or replace into progress (source,ts) values (?,?)', (source, endTs))
+
+    def GetTotal(self, table, ts):
+      # Return the (dl,ul) totals for the hour/day/month starting at 'ts', for all the sources added together
+        row = self.cn.execute('select sum(dl),sum(ul) from %s where ts=?' % table, (ts,)).fetchone()
+        return (row[0] or 0, row[1] or 0)
+
+class RollupThread(threading.Thread):
+  # Keeps the rollups up to date with the BitMeter OS databases listed in 'dbPaths', and calls 'notify'
+  # whenever there are new totals to be collected with Take.
+    def __init__(self, rollupsPath, dbPaths, notify):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.rollupsPath = rollupsPath
+        self.dbPaths     = dbPaths
+        self.notify      = notify
+        self.lock        = threading.Lock()
+        self.stopEvent   = threading.Event()
+        self.totals      = None
+
+    def Take(self):
+      # Return the latest {'today' : (dl,ul), 'month' : (dl,ul)} totals, or None if there aren't any yet
+        with self.lock:
+            return self.totals
+
+    def Stop(self):
+        self.stopEvent.set()
+        self.join(ROLLUP_INTERVAL)
+
+    def run(self):
+        rollups = Rollups(self.rollupsPath)
+        sources = [(os.path.abspath(dbPath), Db(dbPath, '', readOnly=True)) for dbPath in self.dbPaths]
+
+        while not self.stopEvent.is_set():
+            try:
+                for name, db in sources:
+                    self.CatchUp(rollups, name, db)
+                totals = self.GetTotals(rollups, sources, int(time.time()))
+            except sqlite3.Error:
+              # One of the databases is busy, we'll try again next time
+                totals = None
+
+            if totals != None and not self.stopEvent.is_set():
+                with self.lock:
+                    self.totals = totals
+                self.notify()
+            self.stopEvent.wait(ROLLUP_INTERVAL)
+
+        for name, db in sources:
+            db.Close()
+        rollups.Close()
+
+    def CatchUp(self, rollups, name, db):
+      # Add the data for all the complete minutes that haven't been added yet, a chunk at a time
+        end = MinuteStart(int(time.time()) - LATE_SECONDS)
+        start = rollups.GetProgress(name)
+        if start == None:
+            row = db.cn.execute('select min(ts) from data').fetchone()
+            if row[0] == None:
+                return
+            start = MinuteStart(row[0])
+
+        while start < end and not self.stopEvent.is_set():
+            chunkEnd = min(end, start + BACKFILL_CHUNK)
+            minutes = [(ts, dl, ul) for ts, dl, ul, dlMax, ulMax in db.IterData(start, chunkEnd, 60)]
+            rollups.Add(name, minutes, chunkEnd)
+            start = chunkEnd
+            if start < end:
+                self.stopEvent.wait(BACKFILL_PAUSE)
+
+    def GetTotals(self, rollups, sources, now):
+      # The day and month totals include everything up to the last minute we have added, the rest comes from the BitMeter
+      # OS databases (which is no more than a few minutes of data).
+        progress = [rollups.GetProgress(name) for name, db in sources]
+        if None in progress:
+            return None
+
+        totals = {}
+        for key, table, start in (('today', 'day', DayStart(now)), ('month', 'month', MonthStart(now))):
+            dl, ul = rollups.GetTotal(table, start)
+            for (name, db), t in zip(sources, progress):
+                for ts, rowDl, rowUl in db.IterData(max(t, start), now + 1):
+                    dl += rowDl
+                    ul += rowUl
+            totals[key] = (dl, ul)
+        return totals
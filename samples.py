@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+"""
+The SampleBuffer class holds the bandwidth values currently visible on the graph. Values are
+kept in fixed-size parallel arrays of integers that are used as a ring buffer, so adding a new
+value and discarding an old one are both cheap, and nothing is allocated on each timer tick.
+"""
+
+from array import array
+
+try:
+    array('q')
+    TYPECODE = 'q'
+except ValueError:
+  # Older versions of Python don't have a 64-bit typecode, 'l' is big enough for our values
+    TYPECODE = 'l'
+
+class SampleBuffer(object):
+    __slots__ = ('ts', 'dl', 'ul', 'capacity', 'start', 'count')
+
+    def __init__(self, capacity):
+        self.capacity = max(1, capacity)
+        self.ts       = array(TYPECODE, [0]) * self.capacity
+        self.dl       = array(TYPECODE, [0]) * self.capacity
+        self.ul       = array(TYPECODE, [0]) * self.capacity
+        self.start    = 0
+        self.count    = 0
+
+    def __len__(self):
+        return self.count
+
+    def Clear(self):
+        self.start = 0
+        self.count = 0
+
+    def Append(self, ts, dl, ul):
+      # Add a new value to the end of the buffer, if the buffer is full then the oldest value is lost
+        if self.count == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+            self.count -= 1
+
+        i = (self.start + self.count) % self.capacity
+        self.ts[i] = ts
+        self.dl[i] = dl
+        self.ul[i] = ul
+        self.count += 1
+
+    def Put(self, ts, dl, ul):
+      # As Append, but if 'ts' is the same as the newest timestamp then that value is replaced instead
+        if self.count and self.Newest() == ts:
+            i = (self.start + self.count - 1) % self.capacity
+            self.dl[i] = dl
+            self.ul[i] = ul
+        else:
+            self.Append(ts, dl, ul)
+
+    def Extend(self, rows):
+      # Add a sequence of (ts,dl,ul) rows, which must be in timestamp order
+        for row in rows:
+            self.Append(row[0], row[1], row[2])
+
+    def DropBefore(self, ts):
+      # Discard all values with timestamps earlier than 'ts'
+        while self.count and self.ts[self.start] < ts:
+            self.start = (self.start + 1) % self.capacity
+            self.count -= 1
+
+    def Resize(self, capacity):
+      # Change the number of values that the buffer can hold, keeping as many of the newest values as will fit
+        capacity = max(1, capacity)
+        if capacity == self.capacity:
+            return
+
+        keep = min(self.count, capacity)
+        ts = array(TYPECODE, [0]) * capacity
+        dl = array(TYPECODE, [0]) * capacity
+        ul = array(TYPECODE, [0]) * capacity
+
+        j = 0
+        for start, end in self.Spans(self.count - keep):
+            ts[j:j + end - start] = self.ts[start:end]
+            dl[j:j + end - start] = self.dl[start:end]
+            ul[j:j + end - start] = self.ul[start:end]
+            j += end - start
+
+        self.ts, self.dl, self.ul = ts, dl, ul
+        self.capacity = capacity
+        self.start    = 0
+        self.count    = keep
+
+    def Spans(self, skip=0):
+      # Return the (start,end) index ranges of the arrays that contain values, oldest first. The buffer
+      # wraps around so there may be 2 ranges. Optionally 'skip' some of the oldest values.
+        if skip >= self.count:
+            return []
+
+        first = (self.start + skip) % self.capacity
+        last  = self.start + self.count
+        if last <= self.capacity:
+            return [(first, last)]
+        elif first >= self.start:
+            return [(first, self.capacity), (0, last - self.capacity)]
+        else:
+            return [(first, last - self.capacity)]
+
+    def SpansSince(self, ts):
+      # As for Spans, but only covering values with timestamps on or after 'ts'. We search backwards from
+      # the newest value, so this is cheap when only a few recent values are wanted.
+        n = 0
+        while n < self.count and self.ts[(self.start + self.count - 1 - n) % self.capacity] >= ts:
+            n += 1
+        return self.Spans(self.count - n)
+
+    def Newest(self):
+      # Return the timestamp of the most recent value, or None if the buffer is empty
+        if self.count:
+            return self.ts[(self.start + self.count - 1) % self.capacity]
+        else:
+            return None
+
+    def Find(self, ts):
+      # Return the dl/ul pair stored for the given timestamp, searching backwards from the newest value
+        for n in range(self.count - 1, -1, -1):
+            i = (self.start + n) % self.capacity
+            if self.ts[i] == ts:
+                return self.dl[i], self.ul[i]
+            elif self.ts[i] < ts:
+                break
+        return None
+
+class Series(object):
+  # The values shown on one graph. When the graph is zoomed out 'data' holds the average value for each column
+  # and 'peaks' the maximum, the two buffers are always changed together so their index ranges match.
+    __slots__ = ('data', 'peaks')
+
+    def __init__(self, capacity=1):
+        self.data  = SampleBuffer(capacity)
+        self.peaks = SampleBuffer(capacity)
+
+    def Clear(self):
+        self.data.Clear()
+        self.peaks.Clear()
+
+    def Resize(self, capacity):
+        self.data.Resize(capacity)
+        self.peaks.Resize(capacity)
+
+    def DropBefore(self, ts):
+        self.data.DropBefore(ts)
+        self.peaks.DropBefore(ts)
+
+    def AddBuckets(self, rows, now, bucket):
+      # Store the average and peak for each (start,dl total,ul total,dl max,ul max) row. The newest bucket is
+      # still filling up, so its average is only over the seconds that have finished so far.
+        for row in rows:
+            ts = row[0]
+            seconds = max(1, min(bucket, now - ts))
+            self.data.Put(ts, row[1] // seconds, row[2] // seconds)
+            self.peaks.Put(ts, row[3], row[4])
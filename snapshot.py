@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+"""
+Saves the per-second data held by the Hub to a small binary file, so that the next time the client
+starts the graph can be drawn straight away, before anything has been read from the database. The
+file also records how far the data sources had got, so the hub can carry on from there with a
+single query for whatever has arrived since.
+
+The file starts with a fixed-size header: the MAGIC bytes, the format VERSION, a CRC32 checksum
+and the length of the rest of the file. Then comes a JSON description (the data sources, the time
+of the snapshot, and the number of values for each host), followed by the timestamps, download
+values and upload values for each host as little-endian 64-bit integers. The file is
+memory-mapped when it is read, and ignored if the checksum or anything else doesn't match.
+"""
+
+import os
+import mmap
+import json
+import zlib
+import struct
+from files import WriteAtomically
+
+MAGIC   = b'BMSNAP'
+VERSION = 2
+HEADER  = struct.Struct('<6sHIQ') # magic, version, crc32 of everything after the header, length of everything after the header
+LENGTH  = struct.Struct('<I')
+
+class Snapshot:
+    def __init__(self, locations, now, start, delta, columns):
+        self.locations = locations # the data sources, the snapshot is only used if these haven't changed
+        self.now       = now       # the time of the last poll
+        self.start     = start     # the snapshot holds every value on or after this time
+        self.delta     = delta     # the position the data sources had reached, see sources.py
+        self.columns   = columns   # a (ts list, dl list, ul list) tuple for each host
+
+def Save(path, snapshot):
+    meta = {'locations' : snapshot.locations, 'now' : snapshot.now, 'start' : snapshot.start,
+            'delta' : snapshot.delta, 'counts' : [len(ts) for ts, dl, ul in snapshot.columns]}
+    metaBytes = json.dumps(meta).encode('utf-8')
+
+    parts = [LENGTH.pack(len(metaBytes)), metaBytes]
+    for column in snapshot.columns:
+        for values in column:
+            parts.append(struct.pack('<%dq' % len(values), *values))
+    payload = b''.join(parts)
+    WriteAtomically(path, HEADER.pack(MAGIC, VERSION, zlib.crc32(payload) & 0xffffffff, len(payload)) + payload)
+
+def Load(path):
+  # Return the Snapshot saved in the file, or None if there isn't one or it can't be used
+    try:
+        f = open(path, 'rb')
+    except IOError:
+        return None
+
+    try:
+        size = os.fstat(f.fileno()).st_size
+        if size < HEADER.size:
+            return None
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return Parse(mm, size)
+        finally:
+            mm.close()
+    except (EnvironmentError, ValueError, KeyError, TypeError, struct.error):
+        return None
+    finally:
+        f.close()
+
+def Parse(mm, size):
+    magic, version, crc, length = HEADER.unpack_from(mm, 0)
+    if magic != MAGIC or version != VERSION or HEADER.size + length != size:
+        return None
+    if zlib.crc32(mm[HEADER.size:]) & 0xffffffff != crc:
+      # The file has been damaged
+        return None
+
+    offset = HEADER.size
+    metaLength, = LENGTH.unpack_from(mm, offset)
+    offset += LENGTH.size
+    meta = json.loads(mm[offset:offset + metaLength].decode('utf-8'))
+    offset += metaLength
+
+    columns = []
+    for count in meta['counts']:
+        column = []
+        for i in range(3):
+            column.append(struct.unpack_from('<%dq' % count, mm, offset))
+            offset += count * 8
+        columns.append(tuple(column))
+    if offset != size:
+        return None
+
+    return Snapshot(meta['locations'], meta['now'], meta['start'], meta['delta'], columns)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+"""
+Data sources used by the Hub, so it doesn't need to know where the data is coming from. Every data
+source (including db.Db) has the same methods: GetNewData(t) and GetNewBuckets(t, bucket) return the
+rows that have arrived since the last call (or all those on or after time 't'), GetDelta/SetDelta/
+ResetDelta save, restore or forget how far they have got, GetRange(t0, t1, bucket) reads older rows
+without moving that position, and Close.
+"""
+
+import os
+import time
+import heapq
+import json
+import socket
+from db import Db
+
+HTTP_TIMEOUT = 5 # seconds
+
+def GetSourceUrls():
+  # Return the BitMeter OS web interface addresses listed in the BITMETER_URL environment variable
+    return os.getenv('BITMETER_URL', '').replace(',', ' ').split()
+
+def ImportHttpClient():
+  # Return the httplib (http.client) module and the urlparse function. They are only imported when a web interface
+  # is being read, because importing them slows down startup.
+    try:
+        import httplib as client
+        from urlparse import urlparse
+    except ImportError:
+        import http.client as client
+        from urllib.parse import urlparse
+    return client, urlparse
+
+def IsUrl(location):
+    return location.startswith('http://') or location.startswith('https://')
+
+def OpenSource(location, prefsPrefix):
+    if IsUrl(location):
+        return HttpSource(location)
+    else:
+        return Db(location, prefsPrefix, readOnly=True)
+
+def OpenSources(locations, prefsPrefix, combine=True):
+  # Open a data source for the given list of database files/web interface addresses, this is called on the hub thread
+    if len(locations) == 1:
+        return OpenSource(locations[0], prefsPrefix)
+    else:
+        return MultiSource([OpenSource(location, prefsPrefix) for location in locations], combine)
+
+def MakeBuckets(rows, bucket):
+  # Group (ts,dl,ul) rows into (bucket start,dl total,ul total,dl max,ul max) rows, as Db.GetNewBuckets does in sqlite
+    buckets = []
+    for ts, dl, ul in rows:
+        start = ts // bucket * bucket
+        if buckets and buckets[-1][0] == start:
+            prev = buckets[-1]
+            buckets[-1] = (start, prev[1] + dl, prev[2] + ul, max(prev[3], dl), max(prev[4], ul))
+        else:
+            buckets.append((start, dl, ul, dl, ul))
+    return buckets
+
+def AddRows(row1, row2):
+  # Add together two rows for the same time. For buckets this adds the maximum values as well, which
+  # gives the highest that the combined peak could have been.
+    return (row1[0],) + tuple([a + b for a, b in zip(row1[1:], row2[1:])])
+
+class HttpSource:
+  # Reads '/monitor?ts=<seconds>' from the BitMeter OS web interface, which answers with a JSON list of the values recorded in
+  # the last 'ts' seconds, each one either an object with ts/dl/ul fields or a [ts,dl,ul] list, where 'ts' is relative to now.
+  # A single keep-alive connection is used, and we only ask for data newer than what we already have.
+    def __init__(self, url, timeout=HTTP_TIMEOUT):
+        self.client, urlparse = ImportHttpClient()
+        parsed = urlparse(url)
+        self.connectionClass = self.client.HTTPSConnection if parsed.scheme == 'https' else self.client.HTTPConnection
+        self.netloc  = parsed.netloc
+        self.path    = parsed.path.rstrip('/')
+        self.timeout = timeout
+        self.cn      = None
+        self.lastTs  = None
+
+    def Close(self):
+        if self.cn:
+            self.cn.close()
+            self.cn = None
+
+    def Request(self, path):
+      # Make a GET request on our keep-alive connection and return the decoded JSON. If the server has closed
+      # the connection since we last used it then reconnect and try once more.
+        for attempt in range(2):
+            if self.cn == None:
+                self.cn = self.connectionClass(self.netloc, timeout=self.timeout)
+            try:
+                self.cn.request('GET', self.path + path)
+                response = self.cn.getresponse()
+                body = response.read()
+            except (self.client.HTTPException, socket.error) as e:
+                self.Close()
+                if attempt == 1:
+                    raise IOError('Unable to read from ' + self.netloc + ': ' + str(e))
+                continue
+
+            if response.status != 200:
+                raise IOError('Unexpected response from ' + self.netloc + ': ' + str(response.status))
+            try:
+                return json.loads(body.decode('utf-8'))
+            except ValueError:
+                raise IOError('Invalid data from ' + self.netloc)
+
+    def Fetch(self, since):
+      # Return the (ts,dl,ul) rows on or after time 'since', oldest first. The times in the reply are a number of seconds
+      # before the server's current time (whichever sign they are given with), so they are turned back into timestamps
+      # using our own clock, which also means it doesn't matter if the two clocks disagree.
+        now = int(time.time())
+        rows = []
+        for item in self.Request('/monitor?ts=%d' % max(0, now - since)):
+            try:
+                if isinstance(item, dict):
+                    row = (now - abs(int(item['ts'])), int(item['dl']), int(item['ul']))
+                else:
+                    row = (now - abs(int(item[0])), int(item[1]), int(item[2]))
+            except (KeyError, IndexError, TypeError, ValueError):
+                raise IOError('Invalid data from ' + self.netloc)
+            if row[0] >= since:
+                rows.append(row)
+        rows.sort()
+        return rows
+
+    def ResetDelta(self):
+        self.lastTs = None
+
+    def GetDelta(self):
+        return self.lastTs
+
+    def SetDelta(self, delta):
+        self.lastTs = delta
+
+    def GetNewData(self, t):
+        if self.lastTs == None or self.lastTs < t:
+            start = t
+        else:
+            start = self.lastTs + 1
+
+        rows = self.Fetch(start)
+        if rows:
+            self.lastTs = rows[-1][0]
+        return rows
+
+    def GetNewBuckets(self, t, bucket):
+      # The web interface doesn't group data into arbitrary buckets, so we do it here. The newest bucket
+      # is still filling up so we fetch all of it again each time.
+        start = t // bucket * bucket
+        if self.lastTs != None and self.lastTs >= start:
+            start = self.lastTs
+
+        buckets = MakeBuckets(self.Fetch(start), bucket)
+        if buckets:
+            self.lastTs = buckets[-1][0]
+        return buckets
+
+    def GetRange(self, t0, t1, bucket=None):
+      # The web interface only lets us say where to start, so everything after 't1' is thrown away
+        rows = [row for row in self.Fetch(t0) if row[0] < t1]
+        return MakeBuckets(rows, bucket) if bucket else rows
+
+class MultiSource:
+  # Reads from several databases (or web interfaces) at once, querying them in parallel on a pool of threads and merging the
+  # results into timestamp order. The rows for each second are either added together, to give a single stacked graph, or
+  # kept separate with the index of the source they came from added to the end of each row.
+    def __init__(self, sources, combine=True):
+        self.sources = sources
+        self.combine = combine
+      # Imported here, multiprocessing takes a while to import and is only needed when there are several sources
+        from multiprocessing.pool import ThreadPool
+        self.pool    = ThreadPool(len(sources))
+
+    def Close(self):
+        self.pool.close()
+        for source in self.sources:
+            source.Close()
+
+    def ResetDelta(self):
+        for source in self.sources:
+            source.ResetDelta()
+
+    def GetDelta(self):
+        return [source.GetDelta() for source in self.sources]
+
+    def SetDelta(self, delta):
+        for source, sourceDelta in zip(self.sources, delta):
+            source.SetDelta(sourceDelta)
+
+    def GetNewData(self, t):
+        return self.Merge(self.pool.map(lambda source: source.GetNewData(t), self.sources))
+
+    def GetNewBuckets(self, t, bucket):
+        return self.Merge(self.pool.map(lambda source: source.GetNewBuckets(t, bucket), self.sources))
+
+    def GetRange(self, t0, t1, bucket=None):
+        return self.Merge(self.pool.map(lambda source: source.GetRange(t0, t1, bucket), self.sources))
+
+    def Merge(self, results):
+      # Merge the lists of rows from each source, which are already in timestamp order
+        if not self.combine:
+            tagged = [[row + (host,) for row in rows] for host, rows in enumerate(results)]
+            return list(heapq.merge(*tagged))
+
+        merged = []
+        for row in heapq.merge(*results):
+            if merged and merged[-1][0] == row[0]:
+                merged[-1] = AddRows(merged[-1], row)
+            else:
+                merged.append(row)
+        return merged
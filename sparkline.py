@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+"""
+Renders PNG images of the bandwidth graph without opening a window, for example for status pages.
+Each image is drawn by the same code as the graph on the screen (see graph.DrawGraph), using the
+scale and colours from the user preferences. Images for several databases and/or end times are
+rendered in parallel with a pool of processes. Run with:
+
+    python main.py sparkline --db host1.db --db host2.db --at 2024-01-01 --width 150 --height 85 --zoom 60
+
+There are two ways of drawing: 'wx' draws on an off-screen wx.MemoryDC just like the graph window,
+and 'python' draws the same lines into a pixel array without needing wx or a display. The 'python'
+backend draws each line from its first point up to but not including its last, which is what wx
+normally does, but some wx ports may differ by a pixel at the top of each column.
+tests/test_sparkline.py compares the two backends when wx is installed.
+"""
+
+import os
+import sys
+import time
+import zlib
+import struct
+import argparse
+import gettext
+import multiprocessing
+
+from db import Db, GetDefaultPath
+from prefs import Prefs, GetSchema, TUPLE, PREFS_PREFIX
+from samples import Series
+from autoscale import AutoScale
+from export import ParseTime
+import graph
+
+_=gettext.gettext
+
+BYTES_PER_K=1024
+
+class RasterDC:
+  # Just enough of the wx.DC interface for graph.DrawGraph, drawing into an array of RGB pixels. Pens are (r,g,b) tuples.
+    def __init__(self, width, height, background):
+        self.width  = width
+        self.height = height
+        self.pixels = bytearray(bytes(bytearray(background)) * (width * height))
+        self.origin = (0, 0)
+
+    def SetDeviceOrigin(self, x, y):
+        self.origin = (x, y)
+
+    def DrawLineList(self, lines, pen):
+        colour = bytearray(pen)
+        ox, oy = self.origin
+        for x1, y1, x2, y2 in lines:
+            if x1 != x2:
+                raise ValueError('RasterDC only draws vertical lines')
+            x = x1 + ox
+            if not 0 <= x < self.width:
+                continue
+          # The line starts at y1 and stops just before y2, whichever direction it goes in
+            step = 1 if y2 >= y1 else -1
+            for y in range(y1 + oy, y2 + oy, step):
+                if 0 <= y < self.height:
+                    i = (y * self.width + x) * 3
+                    self.pixels[i:i + 3] = colour
+
+    def SaveFile(self, path):
+        WritePng(path, self.width, self.height, self.pixels)
+
+def WritePng(path, width, height, pixels):
+  # Write 8-bit RGB pixels (top row first) to a PNG file, each row is given filter type 0 (none)
+    def Chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    rowBytes = width * 3
+    raw = bytearray()
+    for y in range(height):
+        raw += b'\x00' + pixels[y * rowBytes:(y + 1) * rowBytes]
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(Chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(Chunk(b'IDAT', zlib.compress(bytes(raw), 9)))
+        f.write(Chunk(b'IEND', b''))
+
+def LoadSeries(db, end, width, zoom):
+  # Read the data shown on a graph 'width' columns wide with its left-hand edge at time 'end', in the same way that
+  # the hub and the graph window do. Returns the Series and the time at the left-hand edge of the graph.
+    series = Series(width + 1)
+    if zoom == 1:
+        graphEnd = end
+        series.data.Extend(db.IterData(end - width, end + 1))
+    else:
+        graphEnd = (end // zoom + 1) * zoom
+        start = (end - width * zoom) // zoom * zoom
+        series.AddBuckets(db.IterData(start, end + 1, zoom), end, zoom)
+    series.DropBefore(graphEnd - width * zoom)
+    return series, graphEnd
+
+def GetScale(prefs, series, graphEnd, width, zoom):
+  # Return the rate in bytes/sec at the top of the graph, chosen from the data if the user has turned on auto scaling
+    if not prefs.Get('autoscale'):
+        return prefs.Get('scale') * BYTES_PER_K
+
+    autoScale = AutoScale(BYTES_PER_K)
+    buf = series.data if zoom == 1 else series.peaks
+    for start, end in buf.Spans():
+        for i in range(start, end):
+            autoScale.Add(buf.ts[i], max(buf.dl[i], buf.ul[i]))
+    autoScale.Update(graphEnd - width * zoom)
+    return autoScale.scale * BYTES_PER_K
+
+def GetPrefs(prefsPath):
+  # The colours are read as (r,g,b) tuples, so that we don't need wx unless we are drawing with it
+    schema = GetSchema()
+    for name in ('dlcolour', 'ulcolour', 'olcolour', 'bgcolour'):
+        schema[name] = (TUPLE, schema[name][1])
+
+    if prefsPath and os.path.exists(prefsPath):
+        db = Db(prefsPath, PREFS_PREFIX, readOnly=True)
+    else:
+      # No preferences have been saved, so everything will have its default value
+        db = Db(':memory:', PREFS_PREFIX)
+        db.CreateConfigTable()
+    prefs = Prefs(db, schema)
+    prefs.Load()
+    db.Close()
+    return prefs
+
+wxApp = None
+
+def CreateDC(backend, width, height, background):
+    global wxApp
+    if backend == 'python':
+        return RasterDC(width, height, background)
+
+  # The same calls that MyFrame.InitBuffer makes
+    import wx
+    if wxApp == None:
+        wxApp = wx.App(False)
+    bitmap = wx.EmptyBitmap(width, height)
+    dc = wx.MemoryDC(bitmap)
+    dc.SetBackground(wx.Brush(wx.Colour(*background)))
+    dc.Clear()
+    dc.bitmap = bitmap
+    return dc
+
+def SaveDC(backend, dc, path):
+    if backend == 'python':
+        dc.SaveFile(path)
+    else:
+        import wx
+        dc.SelectObject(wx.NullBitmap)
+        dc.bitmap.SaveFile(path, wx.BITMAP_TYPE_PNG)
+
+def GetPens(backend, prefs):
+  # The (overlap, download, upload) pens for the averages and for the peaks
+    colours = [prefs.Get(name) for name in ('olcolour', 'dlcolour', 'ulcolour')]
+    bg = prefs.Get('bgcolour')
+    peakColours = [graph.GetPeakColour(colour, bg) for colour in colours]
+    if backend == 'python':
+        return tuple(colours), tuple(peakColours)
+
+    import wx
+    return (tuple([wx.Pen(wx.Colour(*colour), 1) for colour in colours]),
+            tuple([wx.Pen(wx.Colour(*colour), 1) for colour in peakColours]))
+
+def Render(job):
+  # Draw one image, this runs in one of the pool processes. Returns the path of the image and the time taken.
+    startTime = time.time()
+    dbPath, end, path, opts = job
+    prefs = GetPrefs(opts['prefs'])
+
+    db = Db(dbPath, PREFS_PREFIX, readOnly=True)
+    series, graphEnd = LoadSeries(db, end, opts['width'], opts['zoom'])
+    db.Close()
+
+    dc = CreateDC(opts['backend'], opts['width'], opts['height'], prefs.Get('bgcolour'))
+    pens, peakPens = GetPens(opts['backend'], prefs)
+    maxBytes = GetScale(prefs, series, graphEnd, opts['width'], opts['zoom'])
+    graph.DrawGraph(dc, [series], graphEnd, opts['height'], maxBytes, opts['zoom'], pens, peakPens)
+    SaveDC(opts['backend'], dc, path)
+    return path, time.time() - startTime
+
+def GetDefaultBackend():
+    try:
+        import wx
+        return 'wx'
+    except ImportError:
+        return 'python'
+
+def GetJobs(opts):
+  # One image for each database at each of the end times, named after the database file and the time
+    jobs = []
+    for dbPath in opts.db:
+        name = os.path.splitext(os.path.basename(dbPath))[0]
+        for end in opts.at:
+            path = os.path.join(opts.output_dir, '%s-%d.png' % (name, end))
+            jobs.append((dbPath, end, path, {'width' : opts.width, 'height' : opts.height, 'zoom' : opts.zoom,
+                                            'backend' : opts.backend, 'prefs' : opts.prefs}))
+    return jobs
+
+def Main(args):
+    parser = argparse.ArgumentParser(prog='main.py sparkline', description=_('Render images of the BitMeter OS bandwidth graph'))
+    parser.add_argument('--db', action='append', default=None, help=_('path of a BitMeter OS database, can be given several times'))
+    parser.add_argument('--at', type=ParseTime, action='append', default=None, help=_('time at the right-hand end of the graph, can be given several times (default: now)'))
+    parser.add_argument('--width', type=int, default=150)
+    parser.add_argument('--height', type=int, default=85)
+    parser.add_argument('--zoom', type=int, default=1, help=_('number of seconds covered by each column of the graph'))
+    parser.add_argument('--prefs', default=GetDefaultPath(), help=_('database containing the preferences (scale and colours) to use'))
+    parser.add_argument('--backend', choices=['wx', 'python'], default=None, help=_('how to draw the images (default: wx if it is installed)'))
+    parser.add_argument('--processes', type=int, default=None, help=_('number of images to draw at once (default: one per CPU)'))
+    parser.add_argument('--output-dir', default='.', help=_('directory to write the images to'))
+    parser.add_argument('--stats', action='store_true', help=_('report how long the images took to draw'))
+    opts = parser.parse_args(args)
+
+    if opts.db == None:
+        opts.db = [GetDefaultPath()]
+    if opts.at == None:
+        opts.at = [int(time.time())]
+    if opts.backend == None:
+        opts.backend = GetDefaultBackend()
+    if opts.width < 1 or opts.height < 1 or opts.zoom < 1:
+        parser.error(_('--width, --height and --zoom must be at least 1'))
+    for dbPath in opts.db:
+        if not dbPath or not os.path.exists(dbPath):
+            parser.error(_('Database file not found') + ': ' + str(dbPath))
+
+    jobs = GetJobs(opts)
+    startTime = time.time()
+    pool = multiprocessing.Pool(opts.processes)
+    try:
+        for path, elapsed in pool.imap_unordered(Render, jobs):
+            if opts.stats:
+                sys.stderr.write('%s %.3f\n' % (path, elapsed))
+    finally:
+        pool.close()
+        pool.join()
+
+    if opts.stats:
+        elapsed = time.time() - startTime
+        sys.stderr.write(_('%d images in %.2f seconds') % (len(jobs), elapsed) + '\n')
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(Main(sys.argv[1:]))
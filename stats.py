@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+
+"""
+Keeps running statistics about the bandwidth data, for display in the caption and tooltip. Each
+new (ts,dl,ul) sample is added to a Stats object, which updates averages, peaks, totals and
+percentiles over several rolling windows without looking at the older samples again. Peaks are
+found with a SlidingMax (a deque of the values that could still become the maximum), and
+percentiles with a RateSketch, a histogram of logarithmically sized buckets that gives answers
+within about 1% of the true value using a fixed amount of memory.
+"""
+
+import math
+from collections import deque
+
+# The statistics that can be shown, with a label for the tooltip and Options dialog and a shorter one for the caption.
+# These are translated where they are displayed.
+NOW, AVG_1M, AVG_5M, AVG_WINDOW, PEAK, P95, TOTAL = 'now', 'avg1m', 'avg5m', 'avgwindow', 'peak', 'p95', 'total'
+TODAY, MONTH = 'today', 'month' # these two come from the rollups (see rollups.py) rather than from Stats
+LABELS = [(NOW,        'Now',                     ''),
+          (AVG_1M,     'Average (1 min)',         'avg 1m'),
+          (AVG_5M,     'Average (5 min)',         'avg 5m'),
+          (AVG_WINDOW, 'Average (graph)',         'avg'),
+          (PEAK,       'Peak (graph)',            'peak'),
+          (P95,        '95th percentile (graph)', 'p95'),
+          (TOTAL,      'Total (graph)',           'total'),
+          (TODAY,      'Total (today)',           'today'),
+          (MONTH,      'Total (this month)',      'month')]
+TAGS = dict([(name, tag) for name, label, tag in LABELS])
+
+SKETCH_GAMMA   = 1.02 # each bucket of the sketch covers values up to this many times bigger than the previous one
+SKETCH_BUCKETS = 1500 # enough for rates up to about 8TB/sec, anything bigger goes in the last bucket
+
+class SlidingMax:
+  # The maximum of the values added since a given time. The deque holds (ts,value) pairs in timestamp
+  # order with decreasing values, anything smaller than a newer value can never be the maximum so it is dropped.
+    def __init__(self):
+        self.items = deque()
+        self.newestTs = None
+
+    def Clear(self):
+        self.items.clear()
+        self.newestTs = None
+
+    def Add(self, ts, value):
+      # A value that arrives after newer ones is treated as if it was for the newest time, so it stays a little too long
+        if self.newestTs != None and ts < self.newestTs:
+            ts = self.newestTs
+        self.newestTs = ts
+        items = self.items
+        while items and items[-1][1] <= value:
+            items.pop()
+        items.append((ts, value))
+
+    def DropBefore(self, ts):
+        items = self.items
+        while items and items[0][0] < ts:
+            items.popleft()
+
+    def Max(self):
+        return self.items[0][1] if self.items else 0
+
+class RateSketch:
+  # Counts values in buckets whose boundaries are powers of SKETCH_GAMMA, so a value can be found to within about 1%
+    def __init__(self):
+        self.counts = [0] * (SKETCH_BUCKETS + 1)
+        self.total  = 0
+        self.logGamma = math.log(SKETCH_GAMMA)
+
+    def Clear(self):
+        self.counts = [0] * (SKETCH_BUCKETS + 1)
+        self.total  = 0
+
+    def GetBucket(self, value):
+      # Bucket 0 holds zero (and anything below 1), bucket i holds values up to SKETCH_GAMMA**i
+        if value < 1:
+            return 0
+        return min(SKETCH_BUCKETS, 1 + int(math.log(value) / self.logGamma))
+
+    def Add(self, value):
+        self.counts[self.GetBucket(value)] += 1
+        self.total += 1
+
+    def Remove(self, value):
+        self.counts[self.GetBucket(value)] -= 1
+        self.total -= 1
+
+    def Percentile(self, p):
+      # Return an estimate of the value that 'p' percent of the values are less than or equal to
+        if self.total == 0:
+            return 0
+        rank = int(math.ceil(self.total * p / 100.0))
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                break
+        if i == 0:
+            return 0
+      # The middle of the bucket, in the sense that it is the same relative distance from both ends
+        return int(2 * SKETCH_GAMMA ** i / (SKETCH_GAMMA + 1))
+
+class Window:
+  # Statistics for the samples in the last 'seconds' seconds. Samples for a second we already have (from
+  # another host) are added onto it. Samples that arrive after newer ones update the totals but not the peaks.
+    def __init__(self, seconds, percentiles=False):
+        self.seconds = seconds
+        self.samples = deque()
+        self.dlMax   = SlidingMax()
+        self.ulMax   = SlidingMax()
+        self.sketches = (RateSketch(), RateSketch()) if percentiles else None
+        self.Clear()
+
+    def Clear(self):
+        self.samples.clear()
+        self.dlMax.Clear()
+        self.ulMax.Clear()
+        if self.sketches:
+            for sketch in self.sketches:
+                sketch.Clear()
+        self.dlTotal = 0
+        self.ulTotal = 0
+        self.firstTs = None
+
+    def SetSeconds(self, seconds):
+        self.seconds = seconds
+        if self.samples:
+            self.Expire(self.samples[-1][0])
+
+    def Add(self, ts, dl, ul):
+        if self.firstTs == None or ts < self.firstTs:
+            self.firstTs = ts
+        if self.samples and ts <= self.samples[-1][0]:
+            self.AddLate(ts, dl, ul)
+            return
+
+        self.samples.append((ts, dl, ul))
+        self.Update(dl, ul, 1)
+        self.dlMax.Add(ts, dl)
+        self.ulMax.Add(ts, ul)
+        self.Expire(ts)
+
+    def AddLate(self, ts, dl, ul):
+      # Normally this is a sample from another host for the newest second, but we search back in case it arrived late
+        samples = self.samples
+        newestTs = samples[-1][0]
+        if ts <= newestTs - self.seconds:
+            return
+
+        i = len(samples) - 1
+        while i >= 0 and samples[i][0] > ts:
+            i -= 1
+
+        if i >= 0 and samples[i][0] == ts:
+            oldTs, oldDl, oldUl = samples[i]
+            samples[i] = (ts, oldDl + dl, oldUl + ul)
+            self.Update(oldDl, oldUl, -1)
+            self.Update(oldDl + dl, oldUl + ul, 1)
+            if ts == newestTs:
+                self.dlMax.Add(ts, oldDl + dl)
+                self.ulMax.Add(ts, oldUl + ul)
+        else:
+          # Insert it after sample 'i', deques can only be added to at the ends so rotate it there and back again
+            samples.rotate(-(i + 1))
+            samples.appendleft((ts, dl, ul))
+            samples.rotate(i + 1)
+            self.Update(dl, ul, 1)
+
+    def Update(self, dl, ul, sign):
+      # Add a sample to the totals (sign=1), or take one away (sign=-1)
+        self.dlTotal += sign * dl
+        self.ulTotal += sign * ul
+        if self.sketches:
+            if sign > 0:
+                self.sketches[0].Add(dl)
+                self.sketches[1].Add(ul)
+            else:
+                self.sketches[0].Remove(dl)
+                self.sketches[1].Remove(ul)
+
+    def Expire(self, newestTs):
+        oldest = newestTs - self.seconds + 1
+        samples = self.samples
+        while samples and samples[0][0] < oldest:
+            ts, dl, ul = samples.popleft()
+            self.Update(dl, ul, -1)
+        self.dlMax.DropBefore(oldest)
+        self.ulMax.DropBefore(oldest)
+
+    def Average(self):
+      # Seconds without a sample count as zero, but we don't count the time before the first sample we saw
+        if not self.samples:
+            return (0, 0)
+        seconds = max(1, min(self.seconds, self.samples[-1][0] - self.firstTs + 1))
+        return (self.dlTotal // seconds, self.ulTotal // seconds)
+
+    def Peak(self):
+        return (self.dlMax.Max(), self.ulMax.Max())
+
+    def Total(self):
+        return (self.dlTotal, self.ulTotal)
+
+    def Percentile(self, p):
+        return (self.sketches[0].Percentile(p), self.sketches[1].Percentile(p))
+
+class Stats:
+  # Statistics for the last minute, the last 5 minutes and the whole width of the graph
+    def __init__(self, windowSeconds):
+        self.minute = Window(60)
+        self.fiveMinutes = Window(300)
+        self.graph  = Window(windowSeconds, percentiles=True)
+        self.windows = (self.minute, self.fiveMinutes, self.graph)
+
+    def Clear(self):
+        for window in self.windows:
+            window.Clear()
+
+    def SetWindow(self, seconds):
+        self.graph.SetSeconds(seconds)
+
+    def Extend(self, rows):
+      # Add a sequence of rows, only the ts,dl,ul values are used so rows tagged with a host index are fine
+        for row in rows:
+            for window in self.windows:
+                window.Add(row[0], row[1], row[2])
+
+    def Get(self, name, now):
+      # Return the (dl,ul) pair for one of the statistics named at the top of this module. Rates are in bytes/sec
+      # and the total is in bytes. 'Now' is the last complete second, as shown by the caption.
+        if name == NOW:
+            for ts, dl, ul in reversed(self.minute.samples):
+                if ts == now - 1:
+                    return (dl, ul)
+                if ts < now - 1:
+                    break
+            return (0, 0)
+        elif name == AVG_1M:
+            return self.minute.Average()
+        elif name == AVG_5M:
+            return self.fiveMinutes.Average()
+        elif name == AVG_WINDOW:
+            return self.graph.Average()
+        elif name == PEAK:
+            return self.graph.Peak()
+        elif name == P95:
+            return self.graph.Percentile(95)
+        elif name == TOTAL:
+            return self.graph.Total()
+        raise KeyError(name)
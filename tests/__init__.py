@@ -0,0 +1,3 @@
+"""
+Unit tests, run with 'python -m unittest discover tests' (or pytest) from the top-level directory.
+"""
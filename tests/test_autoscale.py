@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+"""
+Tests for autoscale.py.
+"""
+
+import unittest
+
+from autoscale import AutoScale, RoundScale, MIN_SCALE
+
+class AutoScaleTest(unittest.TestCase):
+    def testRoundScale(self):
+        for kb, scale in [(0, MIN_SCALE), (10, 10), (10.5, 20), (20, 20), (21, 50), (50, 50), (51, 100), (999, 1000), (1001, 2000)]:
+            self.assertEqual(RoundScale(kb), scale)
+
+    def testUpdate(self):
+        auto = AutoScale(1000)
+        self.assertTrue(auto.Update(0))
+        self.assertEqual(auto.scale, MIN_SCALE)
+
+      # The scale goes up as soon as a bigger value arrives
+        auto.Add(10, 150000)
+        self.assertTrue(auto.Update(0))
+        self.assertEqual(auto.scale, 200)
+        self.assertFalse(auto.Update(0))
+
+      # ...but only comes down once the biggest value is well below it
+        auto.Add(20, 70000)
+        self.assertFalse(auto.Update(11))
+        self.assertEqual(auto.scale, 200)
+        auto.Add(30, 50000)
+        self.assertTrue(auto.Update(21))
+        self.assertEqual(auto.scale, 50)
+
+    def testClear(self):
+      # The scale is kept after the values are forgotten, until new ones arrive
+        auto = AutoScale(1000)
+        auto.Add(10, 900000)
+        auto.Update(0)
+        auto.Clear()
+        self.assertEqual(auto.scale, 1000)
+        auto.Add(5, 3000)
+        self.assertTrue(auto.Update(0))
+        self.assertEqual(auto.scale, 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+"""
+Tests for db.py.
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import db
+from db import Db
+from benchmarks import gendb
+
+class ReadOnlyTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'bench.db')
+        gendb.Generate(self.path, 60, end=1000060)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testMissing(self):
+      # Opening a database that isn't there fails, without leaving an empty one behind
+        missing = os.path.join(self.dir, 'missing.db')
+        self.assertRaises(sqlite3.Error, Db, missing, '', readOnly=True)
+        self.assertFalse(os.path.exists(missing))
+
+    def testWithoutUris(self):
+      # As testMissing, but with a version of sqlite3 that doesn't accept uri=True (as on Python 2)
+        connect = sqlite3.connect
+        def ConnectWithoutUris(path, **kwargs):
+            if 'uri' in kwargs:
+                raise TypeError("'uri' is an invalid keyword argument for this function")
+            return connect(path, **kwargs)
+
+        db.sqlite3.connect = ConnectWithoutUris
+        try:
+            missing = os.path.join(self.dir, 'missing.db')
+            self.assertRaises(sqlite3.Error, Db, missing, '', readOnly=True)
+            self.assertFalse(os.path.exists(missing))
+
+            reader = Db(self.path, '', readOnly=True)
+            self.assertEqual(len(reader.GetRange(1000000, 1000060)), 60)
+            self.assertRaises(sqlite3.Error, reader.cn.execute, 'delete from data')
+            reader.Close()
+        finally:
+            db.sqlite3.connect = connect
+
+    def testReadOnly(self):
+        reader = Db(self.path, '', readOnly=True)
+        self.assertEqual(len(reader.GetRange(1000000, 1000060)), 60)
+        self.assertRaises(sqlite3.Error, reader.cn.execute, 'delete from data')
+        reader.Close()
+
+if __name__ == '__main__':
+    unittest.main()
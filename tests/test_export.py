@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+"""
+Tests for export.py, exporting a generated database to files.
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import export
+from benchmarks import gendb
+
+class ExportTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.dbPath = os.path.join(self.dir, 'bench.db')
+        gendb.Generate(self.dbPath, 120, end=1000080)
+        self.outPath = os.path.join(self.dir, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def Export(self, *args):
+        export.Main(['--db', self.dbPath, '--output', self.outPath] + list(args))
+        with open(self.outPath, 'rb') as f:
+            return f.read()
+
+    def testCsv(self):
+      # Every line ends with a single '\r\n', as csv writes it
+        data = self.Export('--from', '999960', '--to', '1000020')
+        lines = data.split(b'\r\n')
+        self.assertEqual(lines[0], b'ts,dl,ul')
+        self.assertEqual(lines[-1], b'')
+        self.assertEqual(len(lines), 62)
+        self.assertNotIn(b'\r\r', data)
+        self.assertEqual(lines[1].split(b',')[0], b'999960')
+
+    def testCsvBuckets(self):
+        lines = self.Export('--from', '999960', '--to', '1000080', '--bucket', '60').split(b'\r\n')
+        self.assertEqual(lines[0], b'ts,dl,ul,dl_max,ul_max')
+        self.assertEqual([line.split(b',')[0] for line in lines[1:-1]], [b'999960', b'1000020'])
+
+    def testJsonLines(self):
+        lines = self.Export('--from', '999960', '--to', '999970', '--format', 'jsonl').decode('utf-8').split('\n')
+        self.assertEqual(lines[-1], '')
+        self.assertEqual([json.loads(line)['ts'] for line in lines[:-1]], list(range(999960, 999970)))
+
+    def testMissingDb(self):
+      # A mistyped path is reported, rather than creating an empty database there
+        missing = os.path.join(self.dir, 'missing.db')
+        savedStderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            self.assertRaises(SystemExit, export.Main, ['--db', missing, '--output', self.outPath])
+            output = sys.stderr.getvalue()
+        finally:
+            sys.stderr = savedStderr
+        self.assertIn('Database file not found', output)
+        self.assertFalse(os.path.exists(missing))
+        self.assertFalse(os.path.exists(self.outPath))
+
+if __name__ == '__main__':
+    unittest.main()
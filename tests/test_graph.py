@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+"""
+Tests that the NumPy and plain Python versions of graph.GetLines produce the same lines.
+"""
+
+import random
+import unittest
+from array import array
+
+import graph
+from samples import SampleBuffer
+
+def ToTuples(lines):
+    return [tuple(line) for line in lines]
+
+class GetLinesTest(unittest.TestCase):
+    def Check(self, buf, now, height, maxBytes, bucket=1):
+        expected = graph.GetLinesPython(buf, buf.Spans(), now, height, maxBytes, bucket)
+        actual = graph.GetLinesNumpy(buf, buf.Spans(), now, height, maxBytes, bucket)
+        for expectedLines, actualLines in zip(expected, actual):
+            self.assertEqual(ToTuples(actualLines), ToTuples(expectedLines))
+
+    @unittest.skipIf(graph.GetNumpy() == None, 'NumPy is not installed')
+    def testRandom(self):
+        rnd = random.Random(0)
+        buf = SampleBuffer(100)
+        for ts in range(1000, 1150):
+            buf.Append(ts, rnd.randint(0, 200000), rnd.randint(0, 200000))
+        self.Check(buf, 1150, 85, 100000)
+        self.Check(buf, 1160, 85, 100000, 10)
+
+    @unittest.skipIf(graph.GetNumpy() == None, 'NumPy is not installed')
+    def testLargeValues32Bit(self):
+      # On Windows with Python 2 the buffers hold 32-bit values, and dl * height doesn't fit in 32 bits
+        buf = SampleBuffer(10)
+        buf.ts, buf.dl, buf.ul = array('i', [0] * 10), array('i', [0] * 10), array('i', [0] * 10)
+        for ts in range(100, 105):
+            buf.Append(ts, 30 * 1024 * 1024, 1000)
+        self.Check(buf, 105, 85, 50 * 1024 * 1024)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""
+Tests for history.py: the LRU caches, reading tiles on the loader thread, and deciding which tiles
+need reading again or drawing again. The bitmaps are stood in for by strings, so wx isn't needed.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from history import LruCache, History, TILE_WIDTH, LATE_SECONDS, REFRESH_INTERVAL
+from db import Db
+from benchmarks import gendb
+
+START = gendb.END_TS // TILE_WIDTH * TILE_WIDTH - 10 * TILE_WIDTH # the first second of a tile
+
+class LruCacheTest(unittest.TestCase):
+    def testEviction(self):
+      # When the cache is full the item used least recently is dropped, and using one (with Get or Put) makes it the newest
+        cache = LruCache(3)
+        for key in 'abc':
+            cache.Put(key, key.upper())
+        self.assertEqual(cache.Get('a'), 'A')
+        cache.Put('d', 'D')
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.Get('b'), None)
+        cache.Put('c', 'C2')
+        cache.Put('e', 'E')
+        self.assertEqual(list(cache.items.keys()), ['d', 'c', 'e'])
+        self.assertEqual(cache.Get('c'), 'C2')
+
+        for i in range(100):
+            cache.Put(i, i)
+            self.assertTrue(len(cache) <= 3)
+        self.assertEqual(list(cache.items.keys()), [97, 98, 99])
+
+    def testDiscard(self):
+        cache = LruCache(10)
+        for i in range(6):
+            cache.Put((i, i % 2), i)
+        cache.Discard(lambda key: key[1] == 1)
+        self.assertEqual(list(cache.items.keys()), [(0, 0), (2, 0), (4, 0)])
+        cache.Discard(lambda key: False)
+        self.assertEqual(len(cache), 3)
+
+class HistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.dbPath = os.path.join(self.dir, 'bench.db')
+        gendb.Generate(self.dbPath, 20 * TILE_WIDTH)
+        self.now = gendb.END_TS
+        self.loaded = threading.Event()
+        self.history = History(lambda: Db(self.dbPath, '', readOnly=True), 1, lambda: self.now, self.loaded.set)
+        self.history.SetStyle(1000, ((0, 0, 0),), True, None, None)
+
+    def tearDown(self):
+        self.history.Stop()
+        self.history.loader.join(5)
+        shutil.rmtree(self.dir)
+
+    def Load(self, keys):
+      # Read the tiles on the loader thread, and collect them as the window would
+        while keys:
+            self.loaded.clear()
+            self.history.loader.Request(keys)
+            self.assertTrue(self.loaded.wait(5))
+            self.history.Collect()
+            keys = [key for key in keys if self.history.rows.Get(key) == None]
+
+    def testLoad(self):
+        self.Load([(START, 1), (START, 60)])
+        db = Db(self.dbPath, '', readOnly=True)
+        self.assertEqual(self.history.rows.Get((START, 1)), (db.GetRange(START, START + TILE_WIDTH), self.now))
+        self.assertEqual(self.history.rows.Get((START, 60)), (db.GetRange(START, START + TILE_WIDTH * 60, 60), self.now))
+        db.Close()
+
+    def testNeedsRead(self):
+        self.assertTrue(self.history.NeedsRead((START, 1), self.now))
+
+      # A tile that was read once it had finished (plus a little for late data) is never read again
+        self.history.rows.Put((START, 1), ([], START + TILE_WIDTH + LATE_SECONDS))
+        self.assertFalse(self.history.NeedsRead((START, 1), START + TILE_WIDTH + 10 ** 6))
+
+      # One that was read before it had finished is read again, but not more often than every REFRESH_INTERVAL seconds
+        fetched = START + TILE_WIDTH + LATE_SECONDS - 1
+        self.history.rows.Put((START, 1), ([], fetched))
+        self.assertFalse(self.history.NeedsRead((START, 1), fetched + REFRESH_INTERVAL - 1))
+        self.assertTrue(self.history.NeedsRead((START, 1), fetched + REFRESH_INTERVAL))
+
+    def testInvalidation(self):
+      # Changing the style only throws away the bitmaps drawn in the old style, and new rows for a tile only throw away its bitmaps
+        history = self.history
+        oldStyle = history.style
+        history.tiles.Put((START, 1, 85, oldStyle), 'old')
+        history.tiles.Put((START + TILE_WIDTH, 1, 85, oldStyle), 'old')
+
+        history.SetStyle(1000, ((0, 0, 0),), True, None, None)
+        self.assertEqual(len(history.tiles), 2)
+
+        history.SetStyle(2000, ((0, 0, 0),), True, None, None)
+        self.assertEqual(len(history.tiles), 0)
+        newStyle = history.style
+        for start in (START, START + TILE_WIDTH):
+            for height in (85, 170):
+                history.tiles.Put((start, 1, height, newStyle), 'new')
+        history.tiles.Put((START, 60, 85, newStyle), 'new')
+
+        self.Load([(START, 1)])
+        self.assertEqual(sorted(history.tiles.items.keys()), [(START, 60, 85, newStyle),
+                                                             (START + TILE_WIDTH, 1, 85, newStyle),
+                                                             (START + TILE_WIDTH, 1, 170, newStyle)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+
+"""
+Tests for hub.py. The hub is driven one tick at a time (by calling Poll, rather than starting its
+thread) against temporary databases, and what each view has received is compared with what the
+database holds for the graph it is showing.
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from hub import Hub, TickScheduler, STORE_SLACK
+from db import Db
+from sources import OpenSources
+from benchmarks import gendb
+
+START = 1700000000
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return float(self.now)
+
+class Client:
+  # Stands in for a graph window: collects what the hub sends and keeps the rows that it would be showing
+    def __init__(self, hub, width, zoom=1, stacked=False):
+        self.notified = 0
+        self.view = hub.Subscribe(self.Notify)
+        self.view.SetStacked(stacked)
+        self.view.SetView(width, zoom)
+        self.rows = {}
+        self.reloads = 0
+
+    def Notify(self):
+        self.notified += 1
+
+    def Collect(self):
+        result = self.view.Take()
+        if result == None:
+            return None
+        now, zoom, rows, reloaded = result
+        if reloaded:
+            self.rows = {}
+            self.reloads += 1
+      # The newest bucket is sent again as it fills up, so later rows replace earlier ones for the same time (and host)
+        for row in rows:
+            key = (row[0], row[-1]) if len(row) in (4, 6) else row[0]
+            self.rows[key] = row
+        return now
+
+    def GetRows(self, start, end):
+        return sorted([row for row in self.rows.values() if start <= row[0] < end])
+
+class HubTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.rnd = random.Random(0)
+        self.clock = Clock(START)
+        self.paths = []
+        self.written = START - 5000
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def CreateDbs(self, count):
+        for i in range(count):
+            path = os.path.join(self.dir, 'host%d.db' % i)
+            gendb.Generate(path, 0)
+            self.paths.append(path)
+        self.Write(self.clock.now)
+
+    def Write(self, end):
+      # Add rows up to (but not including) time 'end' to each database, with some seconds missing
+        for path in self.paths:
+            cn = sqlite3.connect(path)
+            rows = [(ts, 1, self.rnd.randint(0, 100000), self.rnd.randint(0, 10000), 'eth0')
+                    for ts in range(self.written, end) if self.rnd.random() < 0.9]
+            cn.executemany('insert into data (ts,dr,dl,ul,ad) values (?,?,?,?,?)', rows)
+            cn.commit()
+            cn.close()
+        self.written = max(self.written, end)
+
+    def Tick(self, hub, seconds=1):
+        self.clock.now += seconds
+        self.Write(self.clock.now)
+        hub.Poll()
+
+    def CreateHub(self, hosts=1):
+        self.CreateDbs(hosts)
+        if hosts == 1:
+            openSource = lambda: Db(self.paths[0], '', readOnly=True)
+        else:
+            openSource = lambda: OpenSources(self.paths, '', False)
+        hub = Hub(openSource, hosts, clock=self.clock)
+        self.addCleanup(hub.CloseSources)
+        return hub
+
+    def GetTruth(self, width, zoom, stacked, hosts):
+      # The rows that a graph 'width' columns wide should be showing now, read straight from the databases
+        now = int(self.clock.now)
+        if zoom == 1:
+            start, bucket = now - width, None
+        else:
+            start, bucket = (now - width * zoom) // zoom * zoom, zoom
+        results = []
+        for host, path in enumerate(self.paths):
+            db = Db(path, '', readOnly=True)
+            rows = db.GetRange(start, now, bucket)
+            db.Close()
+            if hosts > 1 and not stacked:
+                rows = [row + (host,) for row in rows]
+            results.append(rows)
+
+        if hosts > 1 and stacked:
+            totals = {}
+            for rows in results:
+                for row in rows:
+                    prev = totals.get(row[0])
+                    totals[row[0]] = row if prev == None else (row[0],) + tuple([a + b for a, b in zip(prev[1:], row[1:])])
+            return start, sorted(totals.values())
+        return start, sorted(sum(results, []))
+
+    def Check(self, client, width, zoom=1, stacked=False, hosts=1):
+        client.Collect()
+        start, truth = self.GetTruth(width, zoom, stacked, hosts)
+        self.assertEqual(client.GetRows(start, self.clock.now), truth)
+
+    def testSeconds(self):
+        hub = self.CreateHub()
+        client = Client(hub, 100)
+        for i in range(200):
+            self.Tick(hub)
+            self.Check(client, 100)
+        self.assertEqual(client.reloads, 1)
+        self.assertEqual(client.notified, 200)
+
+    def testZoomedOut(self):
+        hub = self.CreateHub()
+        clients = [(Client(hub, 50, zoom), zoom) for zoom in (10, 60, 3600)]
+        for i in range(300):
+            self.Tick(hub, 7)
+            for client, zoom in clients:
+                self.Check(client, 50, zoom)
+        for client, zoom in clients:
+            self.assertEqual(client.reloads, 1)
+
+    def testStoreIsTrimmed(self):
+      # The store only holds what the graph showing seconds needs, plus a little slack, while the zoomed out graph gets the
+      # older buckets that were made from the rows dropped from the store
+        hub = self.CreateHub()
+        seconds = Client(hub, 100)
+        minutes = Client(hub, 30, 60)
+        for i in range(600):
+            if i % 100 == 99:
+              # Everything is sent again when the graph is shown, including the buckets kept from the trimmed rows
+                minutes.view.SetActive(False)
+                minutes.view.SetActive(True)
+            self.Tick(hub, 3)
+            self.Check(seconds, 100)
+            self.Check(minutes, 30, 60)
+            self.assertTrue(hub.storeStart >= self.clock.now - 100 - 60 - STORE_SLACK - 3)
+        self.assertEqual(seconds.reloads, 1)
+        self.assertEqual(minutes.reloads, 7)
+
+    def testSeveralHosts(self):
+        hub = self.CreateHub(2)
+        clients = [(Client(hub, 80, zoom, stacked), zoom, stacked) for zoom in (1, 60) for stacked in (False, True)]
+        for i in range(150):
+            self.Tick(hub, 2)
+            for client, zoom, stacked in clients:
+                self.Check(client, 80, zoom, stacked, 2)
+
+    def testReload(self):
+        hub = self.CreateHub()
+        client = Client(hub, 100)
+        for i in range(5):
+            self.Tick(hub)
+        self.Check(client, 100)
+
+      # A gap smaller than the graph is caught up with, without starting again
+        self.Tick(hub, 50)
+        self.Check(client, 100)
+        self.assertEqual(client.reloads, 1)
+
+      # ...but a bigger gap, a wider graph, a new zoom level or the clock going backwards means everything is sent again
+        self.Tick(hub, 500)
+        self.Check(client, 100)
+        self.assertEqual(client.reloads, 2)
+
+        client.view.SetView(200)
+        self.Tick(hub)
+        self.Check(client, 200)
+        self.assertEqual(client.reloads, 3)
+
+        client.view.SetView(200, 10)
+        self.Tick(hub)
+        self.Check(client, 200, 10)
+        self.assertEqual(client.reloads, 4)
+
+      # (the rows after the new time are still in the database, but they're off the right-hand side of the graph)
+        client.view.SetView(200)
+        self.Tick(hub)
+        self.Check(client, 200)
+        self.clock.now -= 30
+        hub.Poll()
+        self.Check(client, 200)
+        self.assertEqual(client.reloads, 6)
+
+    def testFallingBehind(self):
+      # If the window doesn't collect the rows in time, the next lot are added to them without another notification
+        hub = self.CreateHub()
+        client = Client(hub, 100)
+        self.Tick(hub)
+        self.Check(client, 100)
+        for i in range(3):
+            self.Tick(hub)
+        self.assertEqual(client.notified, 2)
+        self.assertEqual(client.view.dropped, 2)
+        self.Check(client, 100)
+
+    def testHidden(self):
+      # Nothing is sent while the graph is hidden, and everything is sent again when it is shown
+        hub = self.CreateHub()
+        client = Client(hub, 100)
+        self.Tick(hub)
+        self.Check(client, 100)
+        client.view.SetActive(False)
+        self.Tick(hub, 10)
+        self.assertEqual(client.view.Take(), None)
+        client.view.SetActive(True)
+        self.Tick(hub)
+        self.Check(client, 100)
+        self.assertEqual(client.reloads, 2)
+
+    def testSnapshot(self):
+      # A hub restored from another's snapshot delivers straight away, and then carries on from where the other one got to
+        hub = self.CreateHub()
+        client = Client(hub, 100)
+        for i in range(120):
+            self.Tick(hub)
+        now, start, delta, columns = hub.GetSnapshot()
+
+        restored = Hub(lambda: Db(self.paths[0], '', readOnly=True), 1, clock=self.clock)
+        self.addCleanup(restored.CloseSources)
+        restored.Restore(now, start, delta, columns)
+        client = Client(restored, 100)
+        self.Check(client, 100)
+        self.Tick(restored, 5)
+        self.Check(client, 100)
+        self.assertEqual(client.reloads, 1)
+
+    def testUnexpectedError(self):
+      # An error the hub doesn't expect is reported, and the next tick starts again with new data sources
+        hub = self.CreateHub()
+        client = Client(hub, 100)
+        self.Tick(hub)
+        hub.source.GetNewData = lambda t: 1 / 0
+        hub.interval = 0.01
+        hub.scheduler = TickScheduler(0.01, 0)
+
+        savedStderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            hub.start()
+            deadline = time.time() + 5
+            while client.reloads < 2 and time.time() < deadline:
+                client.Collect()
+                time.sleep(0.01)
+            hub.Stop()
+            output = sys.stderr.getvalue()
+        finally:
+            sys.stderr = savedStderr
+        self.assertEqual(client.reloads, 2)
+        self.assertEqual(output.count('ZeroDivisionError'), 1)
+
+class TickSchedulerTest(unittest.TestCase):
+    def testGetNext(self):
+        scheduler = TickScheduler(1.0, 0.25)
+        self.assertEqual(scheduler.GetNext(100.1), 100.25)
+        self.assertEqual(scheduler.GetNext(100.25), 101.25)
+        self.assertEqual(scheduler.GetNext(100.9), 101.25)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+"""
+Tests for metrics.py, comparing the histogram percentiles with the durations that were recorded and
+checking the Prometheus text output.
+"""
+
+import os
+import re
+import math
+import random
+import shutil
+import tempfile
+import unittest
+
+import metrics
+from metrics import Histogram, BUCKETS_PER_OCTAVE
+
+BUCKET_RATIO = 2 ** (1.0 / BUCKETS_PER_OCTAVE)
+
+def GetPercentile(values, p):
+    values = sorted(values)
+    return values[int(math.ceil(len(values) * p / 100.0)) - 1]
+
+class HistogramTest(unittest.TestCase):
+    def testAccuracy(self):
+      # The estimate is the top of the bucket that the true value is in, so it is never less than it and at most one bucket more
+        rnd = random.Random(0)
+        histogram = Histogram('test')
+        values = [rnd.expovariate(1.0) * 0.01 for i in range(10000)]
+        for value in values:
+            histogram.Record(value)
+        for p in (1, 50, 95, 99, 100):
+            expected = GetPercentile(values, p)
+            actual = histogram.Percentile(p)
+            self.assertTrue(expected * 0.999999 <= actual <= expected * BUCKET_RATIO, (p, expected, actual))
+
+        self.assertEqual(histogram.count, 10000)
+        self.assertAlmostEqual(histogram.Mean(), sum(values) / len(values))
+        self.assertEqual(histogram.max, max(values))
+
+    def testKnownDurations(self):
+        histogram = Histogram('test')
+        self.assertEqual(histogram.Percentile(50), 0.0)
+        self.assertEqual(histogram.Mean(), 0.0)
+        for i in range(90):
+            histogram.Record(0.001)
+        for i in range(10):
+            histogram.Record(0.5)
+        self.assertTrue(0.001 <= histogram.Percentile(50) <= 0.001 * BUCKET_RATIO)
+        self.assertTrue(0.001 <= histogram.Percentile(90) <= 0.001 * BUCKET_RATIO)
+      # ...and the estimate is never more than the longest duration recorded
+        self.assertEqual(histogram.Percentile(95), 0.5)
+        self.assertEqual(histogram.Percentile(100), 0.5)
+
+    def testTiny(self):
+      # Anything under a microsecond counts as zero, and enormous durations go in the last bucket
+        histogram = Histogram('test')
+        histogram.Record(0.0000001)
+        self.assertEqual(histogram.Percentile(100), 0.0)
+        histogram.Record(10 ** 6)
+        self.assertEqual(histogram.counts[-1], 1)
+
+class FormatTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = dict(metrics.HISTOGRAMS)
+        metrics.HISTOGRAMS.clear()
+
+    def tearDown(self):
+        metrics.HISTOGRAMS.clear()
+        metrics.HISTOGRAMS.update(self.saved)
+
+    def testFormat(self):
+        with metrics.Timer('b.timer'):
+            pass
+        metrics.Record('a.record', 0.25)
+        metrics.Record('a.record', 0.5)
+
+        lines = metrics.Format().split('\n')
+        self.assertEqual(lines[0], '# TYPE bitmeter_duration_seconds summary')
+        self.assertEqual(lines[-1], '')
+        sample = re.compile(r'^bitmeter_duration_seconds(_sum|_count)?\{name="([a-z.]+)"(,quantile="0\.(50|95|99)")?\} [0-9]+(\.[0-9]{6})?$')
+        for line in lines[1:-1]:
+            self.assertTrue(sample.match(line), line)
+
+      # Five lines for each measurement, in name order. The median is the top of the bucket that 0.25 is in, 2**18 microseconds.
+        self.assertEqual(len(lines), 2 + 5 * 2)
+        self.assertEqual(lines[1:6], ['bitmeter_duration_seconds{name="a.record",quantile="0.50"} 0.262144',
+                                      'bitmeter_duration_seconds{name="a.record",quantile="0.95"} 0.500000',
+                                      'bitmeter_duration_seconds{name="a.record",quantile="0.99"} 0.500000',
+                                      'bitmeter_duration_seconds_sum{name="a.record"} 0.750000',
+                                      'bitmeter_duration_seconds_count{name="a.record"} 2'])
+        self.assertEqual(lines[10], 'bitmeter_duration_seconds_count{name="b.timer"} 1')
+
+    def testWriteFile(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'metrics.prom')
+
+        @metrics.Timed('c.timed')
+        def Double(x):
+            return x * 2
+        self.assertEqual(Double(2), 4)
+        metrics.WriteFile(path)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read().decode('utf-8'), metrics.Format())
+        self.assertEqual(os.listdir(directory), ['metrics.prom'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+"""
+Tests for prefs.py, reading the values that older versions of the client stored (with str() and
+eval()) and saving changes back. The colours are read as tuples, as sparkline.GetPrefs does, so
+wx isn't needed.
+"""
+
+import unittest
+
+from db import Db
+from prefs import Prefs, GetSchema, INT, TUPLE, PREFS_PREFIX
+
+def GetSchemaWithoutWx():
+    schema = GetSchema()
+    for name in ('dlcolour', 'ulcolour', 'olcolour', 'bgcolour'):
+        schema[name] = (TUPLE, schema[name][1])
+    return schema
+
+class PrefsTest(unittest.TestCase):
+    def setUp(self):
+        self.db = Db(':memory:', PREFS_PREFIX)
+        self.db.CreateConfigTable()
+        self.addCleanup(self.db.Close)
+
+    def Store(self, vals):
+        with self.db.cn:
+            self.db.cn.executemany('insert into config (key,value) values (?,?)', [(PREFS_PREFIX + k, v) for k, v in vals.items()])
+
+    def GetRows(self):
+        return sorted(self.db.cn.execute('select key,value from config').fetchall())
+
+    def testLegacyValues(self):
+      # The old client stored str() of wx.Colour, wx.Size and the values from the Options dialog
+        self.Store({'dlcolour' : '(255, 0, 0, 255)', 'size' : '(150, 85)', 'position' : '(-3, 20)',
+                    'scale' : u'1000', 'opacity' : '55', 'float' : 'True', 'clickthru' : 'False'})
+        prefs = Prefs(self.db, GetSchemaWithoutWx())
+        self.assertEqual(prefs.Get('dlcolour')[:3], (255, 0, 0))
+        self.assertEqual(prefs.Get('size'), (150, 85))
+        self.assertEqual(prefs.Get('position'), (-3, 20))
+        self.assertEqual(prefs.Get('scale'), 1000)
+        self.assertEqual(prefs.Get('opacity'), 55)
+        self.assertEqual(prefs.Get('float'), True)
+        self.assertEqual(prefs.Get('clickthru'), False)
+
+      # ...and anything that wasn't stored gets its default
+        self.assertEqual(prefs.Get('ulcolour'), (0, 255, 0))
+        self.assertEqual(prefs.Get('autoscale'), False)
+
+    def testUnparsable(self):
+        self.Store({'scale' : 'lots', 'size' : '(150, wide)', 'position' : '', 'opacity' : '7.5'})
+        prefs = Prefs(self.db, GetSchemaWithoutWx())
+        self.assertEqual(prefs.Get('scale'), 1000)
+        self.assertEqual(prefs.Get('size'), (150, 85))
+        self.assertEqual(prefs.Get('opacity'), 70)
+        self.assertEqual(prefs.Get('position'), (100, 100))
+
+    def testSet(self):
+      # A key is only saved if its value has really changed, the legacy '(150, 85)' is the same as (150,85)
+        self.Store({'size' : '(150, 85)', 'scale' : '1000'})
+        prefs = Prefs(self.db, GetSchemaWithoutWx())
+        prefs.Set('size', [150, 85])
+        prefs.Set('scale', '1000')
+        prefs.Set('opacity', 70)
+        self.assertEqual(prefs.dirty, set())
+
+        prefs.Set('scale', u'2000')
+        prefs.Set('size', (200, 85))
+        self.assertEqual(prefs.Get('scale'), 2000)
+        self.assertEqual(prefs.dirty, set(['scale', 'size']))
+
+      # Setting it back doesn't undo the change, the old value has gone
+        prefs.Set('scale', 1000)
+        self.assertEqual(prefs.dirty, set(['scale', 'size']))
+
+    def testSave(self):
+      # Only the changed keys are written, existing rows are updated and missing ones added, and nothing is duplicated
+        self.Store({'size' : '(150, 85)', 'scale' : '1000', 'dlcolour' : '(255, 0, 0, 255)'})
+        with self.db.cn:
+            self.db.cn.execute("insert into config (key,value) values ('web.port','2605')")
+        prefs = Prefs(self.db, GetSchemaWithoutWx())
+        prefs.Set('scale', 500)
+        prefs.Set('opacity', 40)
+        prefs.Save()
+        self.assertEqual(prefs.dirty, set())
+        self.assertEqual(self.GetRows(), [(PREFS_PREFIX + 'dlcolour', '(255, 0, 0, 255)'),
+                                          (PREFS_PREFIX + 'opacity', '40'),
+                                          (PREFS_PREFIX + 'scale', '500'),
+                                          (PREFS_PREFIX + 'size', '(150, 85)'),
+                                          ('web.port', '2605')])
+
+        prefs.Set('opacity', 45)
+        prefs.Save()
+        prefs.Save()
+        self.assertEqual(len(self.GetRows()), 5)
+
+      # A new Prefs reads back what was saved
+        prefs = Prefs(self.db, GetSchemaWithoutWx())
+        self.assertEqual((prefs.Get('scale'), prefs.Get('opacity'), prefs.Get('size')), (500, 45, (150, 85)))
+
+    def testFormat(self):
+      # Saved values are in the same form that the old client wrote, so it can still read them
+        self.assertEqual(TUPLE.Format((150, 85)), '(150,85)')
+        self.assertEqual(TUPLE.Parse(TUPLE.Format((1, 2, 3))), (1, 2, 3))
+        self.assertEqual(INT.Format(1000), '1000')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+"""
+Tests for rollups.py, comparing the daily and monthly totals with sums over the 'data' table. The
+generated databases run from before the start of a month to just after midnight two days later, in
+local time, so the totals have to be split at both.
+"""
+
+import os
+import time
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import rollups
+from rollups import Rollups, RollupThread, DayStart, MonthStart
+from db import Db
+from benchmarks import gendb
+
+MONTH = MonthStart(1700000000)
+NOW = DayStart(MONTH + 36 * 3600) + 2 * 3600 + 1234 # just after 2am on the second day of the month
+
+class FakeTime:
+  # Stands in for the 'time' module, so the totals are for a time when we know where the data starts and ends
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return float(self.now)
+
+    def localtime(self, ts):
+        return time.localtime(ts)
+
+    def mktime(self, t):
+        return time.mktime(t)
+
+class RollupsTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.rollupsPath = os.path.join(self.dir, 'rollups.db')
+        self.dbPaths = [os.path.join(self.dir, 'host%d.db' % i) for i in range(2)]
+        for seed, dbPath in enumerate(self.dbPaths):
+            gendb.Generate(dbPath, NOW - MONTH + 3 * 3600, end=NOW, seed=seed)
+
+        self.clock = FakeTime(NOW)
+        self.saved = (rollups.time, rollups.BACKFILL_PAUSE, rollups.BACKFILL_CHUNK)
+        rollups.time = self.clock
+        rollups.BACKFILL_PAUSE = 0
+
+    def tearDown(self):
+        rollups.time, rollups.BACKFILL_PAUSE, rollups.BACKFILL_CHUNK = self.saved
+        shutil.rmtree(self.dir)
+
+    def GetSum(self, start, end):
+      # The (dl,ul) totals for all the databases from 'start' up to (but not including) 'end', read straight from them
+        dl = ul = 0
+        for dbPath in self.dbPaths:
+            cn = sqlite3.connect(dbPath)
+            row = cn.execute('select sum(dl),sum(ul) from data where ts >= ? and ts < ?', (start, end)).fetchone()
+            cn.close()
+            dl += row[0] or 0
+            ul += row[1] or 0
+        return (dl, ul)
+
+    def GetExpectedTotals(self):
+        now = int(self.clock.now)
+        return {'today' : self.GetSum(DayStart(now), now + 1), 'month' : self.GetSum(MonthStart(now), now + 1)}
+
+    def CatchUp(self, thread):
+      # Run what the thread does on each update, here rather than on the thread
+        r = Rollups(self.rollupsPath)
+        sources = [(os.path.abspath(dbPath), Db(dbPath, '', readOnly=True)) for dbPath in self.dbPaths]
+        for name, db in sources:
+            thread.CatchUp(r, name, db)
+        totals = thread.GetTotals(r, sources, int(self.clock.now))
+        for name, db in sources:
+            db.Close()
+        r.Close()
+        return totals
+
+    def testThread(self):
+        taken = threading.Event()
+        thread = RollupThread(self.rollupsPath, self.dbPaths, taken.set)
+        thread.start()
+        self.assertTrue(taken.wait(30))
+        totals = thread.Take()
+        thread.Stop()
+        self.assertEqual(totals, self.GetExpectedTotals())
+
+      # The hours and days were split in the right places too
+        r = Rollups(self.rollupsPath)
+        today = DayStart(NOW)
+        yesterday = DayStart(today - 3600)
+        self.assertEqual(r.GetTotal('day', yesterday), self.GetSum(yesterday, today))
+        self.assertEqual(r.GetTotal('month', MONTH), self.GetSum(MONTH, rollups.MinuteStart(NOW - rollups.LATE_SECONDS)))
+        hour = (NOW // 3600 - 1) * 3600
+        self.assertEqual(r.GetTotal('hour', hour), self.GetSum(hour, hour + 3600))
+        self.assertEqual(r.GetTotal('day', today - 86400 * 10), (0, 0))
+        r.Close()
+
+    def testResume(self):
+      # The thread is stopped part way through catching up, the next one carries on from where it got to
+        rollups.BACKFILL_CHUNK = 3600
+        thread = RollupThread(self.rollupsPath, self.dbPaths, lambda: None)
+        add = Rollups.Add
+        calls = []
+        def AddThenStop(self, source, minutes, endTs):
+            add(self, source, minutes, endTs)
+            calls.append(endTs)
+            if len(calls) == 5:
+                thread.stopEvent.set()
+        Rollups.Add = AddThenStop
+        try:
+            self.CatchUp(thread)
+        finally:
+            Rollups.Add = add
+        self.assertEqual(len(calls), 5)
+
+        r = Rollups(self.rollupsPath)
+        self.assertEqual(r.GetProgress(os.path.abspath(self.dbPaths[0])), calls[-1])
+        self.assertEqual(r.GetProgress(os.path.abspath(self.dbPaths[1])), None)
+        r.Close()
+
+        thread = RollupThread(self.rollupsPath, self.dbPaths, lambda: None)
+        self.assertEqual(self.CatchUp(thread), self.GetExpectedTotals())
+
+      # Catching up again adds nothing more, and later data is added as it arrives
+        self.assertEqual(self.CatchUp(thread), self.GetExpectedTotals())
+        for seed, dbPath in enumerate(self.dbPaths):
+            cn = sqlite3.connect(dbPath)
+            cn.executemany('insert into data (ts,dr,dl,ul,ad) values (?,1,?,?,?)',
+                           [(ts, 1000 + seed, 10, 'eth0') for ts in range(NOW, NOW + 600)])
+            cn.commit()
+            cn.close()
+        self.clock.now = NOW + 600
+        self.assertEqual(self.CatchUp(thread), self.GetExpectedTotals())
+
+    def testNoData(self):
+      # Until there is some data for every source there are no totals
+        gendb.Generate(self.dbPaths[1], 0)
+        thread = RollupThread(self.rollupsPath, self.dbPaths, lambda: None)
+        self.assertEqual(self.CatchUp(thread), None)
+
+if __name__ == '__main__':
+    unittest.main()
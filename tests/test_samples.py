@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""
+Tests for samples.py, comparing a SampleBuffer with a plain list of the values it should hold.
+"""
+
+import random
+import unittest
+
+from samples import SampleBuffer, Series
+
+def GetValues(buf, spans):
+    values = []
+    for start, end in spans:
+        values.extend(zip(buf.ts[start:end], buf.dl[start:end], buf.ul[start:end]))
+    return values
+
+class SampleBufferTest(unittest.TestCase):
+    def Check(self, buf, expected):
+        self.assertEqual(len(buf), len(expected))
+        self.assertEqual(GetValues(buf, buf.Spans()), expected)
+        self.assertEqual(buf.Newest(), expected[-1][0] if expected else None)
+        for skip in range(len(expected) + 1):
+            self.assertEqual(GetValues(buf, buf.Spans(skip)), expected[skip:])
+        for ts, dl, ul in expected:
+            self.assertEqual(buf.Find(ts), (dl, ul))
+            self.assertEqual(GetValues(buf, buf.SpansSince(ts)), [value for value in expected if value[0] >= ts])
+
+    def testWrap(self):
+        buf = SampleBuffer(5)
+        expected = []
+        for ts in range(12):
+            buf.Append(ts, ts * 10, ts * 100)
+            expected = (expected + [(ts, ts * 10, ts * 100)])[-5:]
+            self.Check(buf, expected)
+      # After wrapping around the values are in two spans, the older ones at the end of the arrays
+        self.assertEqual(buf.Spans(), [(2, 5), (0, 2)])
+        self.assertEqual(buf.Spans(3), [(0, 2)])
+        self.assertEqual(buf.SpansSince(100), [])
+        self.assertEqual(buf.Find(3), None)
+
+    def testPut(self):
+        buf = SampleBuffer(3)
+        buf.Put(1, 10, 100)
+        buf.Put(2, 20, 200)
+        buf.Put(2, 25, 250)
+        self.Check(buf, [(1, 10, 100), (2, 25, 250)])
+
+    def testRandom(self):
+      # Every operation in a random order, with the buffer wrapped around at all sorts of places
+        rnd = random.Random(0)
+        buf = SampleBuffer(10)
+        capacity = 10
+        expected = []
+        ts = 0
+        for i in range(3000):
+            op = rnd.random()
+            if op < 0.6:
+                ts += rnd.randint(1, 3)
+                value = (ts, rnd.randint(0, 1000), rnd.randint(0, 1000))
+                buf.Append(*value)
+                expected = (expected + [value])[-capacity:]
+            elif op < 0.7 and expected:
+                dl, ul = rnd.randint(0, 1000), rnd.randint(0, 1000)
+                buf.Put(ts, dl, ul)
+                expected[-1] = (ts, dl, ul)
+            elif op < 0.8:
+                cutoff = ts - rnd.randint(0, 30)
+                buf.DropBefore(cutoff)
+                expected = [value for value in expected if value[0] >= cutoff]
+            elif op < 0.9:
+                capacity = rnd.randint(1, 20)
+                buf.Resize(capacity)
+                expected = expected[-capacity:]
+            elif op < 0.92:
+                buf.Clear()
+                expected = []
+            self.Check(buf, expected)
+
+    def testResize(self):
+        buf = SampleBuffer(4)
+        buf.Extend([(ts, ts, ts) for ts in range(6)])
+        buf.Resize(8)
+        self.Check(buf, [(ts, ts, ts) for ts in range(2, 6)])
+        buf.Extend([(ts, ts, ts) for ts in range(6, 10)])
+        self.Check(buf, [(ts, ts, ts) for ts in range(2, 10)])
+        buf.Resize(3)
+        self.Check(buf, [(ts, ts, ts) for ts in range(7, 10)])
+        buf.Resize(0)
+        self.assertEqual(buf.capacity, 1)
+        self.Check(buf, [(9, 9, 9)])
+
+    def testLargeValues(self):
+      # Totals for long buckets don't fit in 32 bits
+        buf = SampleBuffer(2)
+        buf.Append(1700000000, 2 ** 40, 2 ** 33)
+        self.assertEqual(buf.Find(1700000000), (2 ** 40, 2 ** 33))
+
+class SeriesTest(unittest.TestCase):
+    def testAddBuckets(self):
+        series = Series(10)
+        series.AddBuckets([(0, 600, 60, 50, 5), (60, 1200, 120, 80, 8)], 90, 60)
+      # The newest bucket only has 30 seconds in it so far
+        self.assertEqual(GetValues(series.data, series.data.Spans()), [(0, 10, 1), (60, 40, 4)])
+        self.assertEqual(GetValues(series.peaks, series.peaks.Spans()), [(0, 50, 5), (60, 80, 8)])
+
+      # ...and it is replaced when it is sent again
+        series.AddBuckets([(60, 2400, 240, 90, 9)], 120, 60)
+        self.assertEqual(GetValues(series.data, series.data.Spans()), [(0, 10, 1), (60, 40, 4)])
+        self.assertEqual(GetValues(series.peaks, series.peaks.Spans()), [(0, 50, 5), (60, 90, 9)])
+
+        series.DropBefore(60)
+        self.assertEqual(len(series.data), 1)
+        self.assertEqual(len(series.peaks), 1)
+
+if __name__ == '__main__':
+    unittest.main()
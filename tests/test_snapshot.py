@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""
+Tests for snapshot.py: a saved snapshot loads again unchanged, and a damaged one is ignored.
+"""
+
+import os
+import shutil
+import zlib
+import tempfile
+import unittest
+
+import snapshot
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'snapshot')
+        self.columns = [(list(range(1000, 1100)), [i * 1000 for i in range(100)], [2 ** 40 + i for i in range(100)]),
+                        ([1050, 1099], [7, 8], [9, 10])]
+        snapshot.Save(self.path, snapshot.Snapshot(['a.db', 'http://host:2605'], 1100, 1000, [1099, 1099], self.columns))
+        with open(self.path, 'rb') as f:
+            self.data = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def Write(self, data):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+
+    def testRoundTrip(self):
+        snap = snapshot.Load(self.path)
+        self.assertEqual(snap.locations, ['a.db', 'http://host:2605'])
+        self.assertEqual((snap.now, snap.start, snap.delta), (1100, 1000, [1099, 1099]))
+        self.assertEqual([tuple([list(values) for values in column]) for column in snap.columns], self.columns)
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def testEmpty(self):
+        snapshot.Save(self.path, snapshot.Snapshot([], 5, 5, None, [([], [], [])]))
+        snap = snapshot.Load(self.path)
+        self.assertEqual(snap.delta, None)
+        self.assertEqual([tuple([list(values) for values in column]) for column in snap.columns], [([], [], [])])
+
+    def testMissing(self):
+        self.assertEqual(snapshot.Load(os.path.join(self.dir, 'missing')), None)
+
+    def testDamaged(self):
+      # Changing any single byte, whether in the header or the data, means the file is ignored
+        for i in range(0, len(self.data), 7):
+            data = bytearray(self.data)
+            data[i] ^= 0x55
+            self.Write(bytes(data))
+            self.assertEqual(snapshot.Load(self.path), None, 'byte %d' % i)
+
+    def testTruncated(self):
+        for length in (0, 5, snapshot.HEADER.size, len(self.data) - 1):
+            self.Write(self.data[:length])
+            self.assertEqual(snapshot.Load(self.path), None)
+        self.Write(self.data + b'\0')
+        self.assertEqual(snapshot.Load(self.path), None)
+
+    def testVersion(self):
+      # A file written by another version, even with a good checksum, is ignored
+        magic, version, crc, length = snapshot.HEADER.unpack_from(self.data, 0)
+        self.Write(snapshot.HEADER.pack(magic, version + 1, crc, length) + self.data[snapshot.HEADER.size:])
+        self.assertEqual(snapshot.Load(self.path), None)
+
+    def testBadCounts(self):
+      # The counts in the description must match the amount of data that follows it
+        payload = self.data[snapshot.HEADER.size:]
+        metaLength, = snapshot.LENGTH.unpack_from(payload, 0)
+        meta = payload[snapshot.LENGTH.size:snapshot.LENGTH.size + metaLength].replace(b'[100, 2]', b'[100, 3]')
+        self.assertTrue(b'[100, 3]' in meta)
+        payload = snapshot.LENGTH.pack(len(meta)) + meta + payload[snapshot.LENGTH.size + metaLength:]
+        self.Write(snapshot.HEADER.pack(snapshot.MAGIC, snapshot.VERSION, zlib.crc32(payload) & 0xffffffff, len(payload)) + payload)
+        self.assertEqual(snapshot.Load(self.path), None)
+
+if __name__ == '__main__':
+    unittest.main()
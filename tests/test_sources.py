@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+"""
+Tests for sources.py, reading from the stand-in BitMeter OS web interface in benchmarks/webserver.py.
+"""
+
+import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import sources
+from sources import HttpSource, MultiSource, MakeBuckets
+from benchmarks import gendb, webserver
+
+NOW = 1800000000
+
+class FakeTime:
+  # Stands in for the 'time' module, so the server and the client agree on the time and it only moves when we say so
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return float(self.now)
+
+class HttpSourceTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.dbPath = os.path.join(self.dir, 'bench.db')
+        gendb.Generate(self.dbPath, 3600)
+
+        self.clock = FakeTime(NOW)
+        self.savedTime = (sources.time, webserver.time)
+        sources.time = webserver.time = self.clock
+
+        self.server = webserver.MonitorServer(('localhost', 0), self.dbPath)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://localhost:%d' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        sources.time, webserver.time = self.savedTime
+        shutil.rmtree(self.dir)
+
+    def GetRows(self, start, end):
+      # The rows that the server should return between 'start' and 'end', with the timestamps it gives them
+        cn = sqlite3.connect(self.dbPath)
+        offset = self.server.offset
+        rows = cn.execute('select ts,dl,ul from data where ts >= ? and ts < ? order by ts', (start - offset, end - offset)).fetchall()
+        cn.close()
+        return [(ts + offset, dl, ul) for ts, dl, ul in rows]
+
+    def testGetNewData(self):
+        source = HttpSource(self.url)
+        self.assertEqual(source.GetNewData(NOW - 600), self.GetRows(NOW - 600, NOW))
+
+      # Only the rows that have arrived since then are returned by the next call
+        self.clock.now += 5
+        self.assertEqual(source.GetNewData(NOW - 600), self.GetRows(NOW, NOW + 5))
+        self.assertEqual(source.GetNewData(NOW - 600), [])
+
+      # ...unless we start again
+        source.ResetDelta()
+        self.assertEqual(source.GetNewData(NOW - 100), self.GetRows(NOW - 100, NOW + 5))
+        source.Close()
+
+    def testGetNewBuckets(self):
+        source = HttpSource(self.url)
+        self.assertEqual(source.GetNewBuckets(NOW - 600, 60), MakeBuckets(self.GetRows(NOW // 60 * 60 - 600, NOW), 60))
+
+      # The newest bucket is returned again, with the rows that have been added to it
+        self.clock.now += 30
+        start = (NOW - 1) // 60 * 60
+        self.assertEqual(source.GetNewBuckets(NOW - 600, 60), MakeBuckets(self.GetRows(start, NOW + 30), 60))
+        source.Close()
+
+    def testGetRange(self):
+        source = HttpSource(self.url)
+        self.assertEqual(source.GetRange(NOW - 500, NOW - 200), self.GetRows(NOW - 500, NOW - 200))
+        self.assertEqual(source.GetRange(NOW - 500, NOW - 200, 10), MakeBuckets(self.GetRows(NOW - 500, NOW - 200), 10))
+        source.Close()
+
+    def testMultiSource(self):
+        source = MultiSource([HttpSource(self.url), HttpSource(self.url)], combine=False)
+        rows = self.GetRows(NOW - 60, NOW)
+        self.assertEqual(source.GetNewData(NOW - 60), sorted([row + (0,) for row in rows] + [row + (1,) for row in rows]))
+        source.Close()
+
+        source = MultiSource([HttpSource(self.url), HttpSource(self.url)])
+        self.assertEqual(source.GetNewData(NOW - 60), [(ts, dl * 2, ul * 2) for ts, dl, ul in rows])
+        source.Close()
+
+    def testInvalidData(self):
+        source = HttpSource(self.url)
+        for reply in ([{'ts_' : 3}], [[1, 2]], [{'ts' : 'x', 'dl' : 1, 'ul' : 2}], {'ts' : 1}):
+            source.Request = lambda path: reply
+            self.assertRaises(IOError, source.Fetch, NOW - 60)
+
+    def testConnectionRefused(self):
+      # Nothing is listening on a port that has just been closed
+        sock = socket.socket()
+        sock.bind(('localhost', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        source = HttpSource('http://localhost:%d' % port, timeout=1)
+        self.assertRaises(IOError, source.GetNewData, NOW - 60)
+
+if __name__ == '__main__':
+    unittest.main()
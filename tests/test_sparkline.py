@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""
+Tests for sparkline.py: the 'python' backend is checked against pixels worked out by hand, and
+against the 'wx' backend when wx can be imported.
+"""
+
+import os
+import zlib
+import struct
+import shutil
+import tempfile
+import unittest
+
+import graph
+from sparkline import RasterDC, Render
+from samples import Series
+from db import Db
+from prefs import PREFS_PREFIX
+from benchmarks import gendb
+
+try:
+    import wx
+except ImportError:
+    wx = None
+
+WHITE = (255, 255, 255)
+OL, DL, UL = (1, 1, 1), (2, 2, 2), (3, 3, 3)
+
+def ReadPng(path):
+  # Decode the 8-bit RGB PNG files that WritePng makes (every row has filter type 0), returning (width, height, pixels)
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    offset = 8
+    chunks = {}
+    while offset < len(data):
+        length, = struct.unpack_from('>I', data, offset)
+        kind = data[offset + 4:offset + 8]
+        body = data[offset + 8:offset + 8 + length]
+        crc, = struct.unpack_from('>I', data, offset + 8 + length)
+        assert zlib.crc32(kind + body) & 0xffffffff == crc
+        chunks[kind] = chunks.get(kind, b'') + body
+        offset += 12 + length
+
+    width, height, depth, colourType, compression, filterType, interlace = struct.unpack('>IIBBBBB', chunks[b'IHDR'])
+    assert (depth, colourType, interlace) == (8, 2, 0)
+    raw = bytearray(zlib.decompress(chunks[b'IDAT']))
+    rowBytes = width * 3 + 1
+    pixels = bytearray()
+    for y in range(height):
+        row = raw[y * rowBytes:(y + 1) * rowBytes]
+        assert row[0] == 0
+        pixels += row[1:]
+    return width, height, pixels
+
+def GetColumn(dc, x):
+  # The colours of one column of pixels, top first
+    return [tuple(dc.pixels[(y * dc.width + x) * 3:(y * dc.width + x) * 3 + 3]) for y in range(dc.height)]
+
+class RasterDCTest(unittest.TestCase):
+    def testLines(self):
+      # Each line includes its first point but not its last, whichever direction it is drawn in
+        dc = RasterDC(4, 10, WHITE)
+        dc.DrawLineList([(1, 10, 1, 6)], OL)
+        dc.DrawLineList([(2, 2, 2, 5), (3, 4, 3, 4), (4, 0, 4, 10), (-1, 0, -1, 10)], DL)
+        self.assertEqual(GetColumn(dc, 0), [WHITE] * 10)
+        self.assertEqual(GetColumn(dc, 1), [WHITE] * 7 + [OL] * 3)
+        self.assertEqual(GetColumn(dc, 2), [WHITE] * 2 + [DL] * 3 + [WHITE] * 5)
+        self.assertEqual(GetColumn(dc, 3), [WHITE] * 10)
+        self.assertRaises(ValueError, dc.DrawLineList, [(0, 0, 1, 1)], OL)
+
+        dc.SetDeviceOrigin(0, 5)
+        dc.DrawLineList([(0, 0, 0, 2)], UL)
+        self.assertEqual(GetColumn(dc, 0), [WHITE] * 5 + [UL] * 2 + [WHITE] * 3)
+
+    def testGraph(self):
+      # Three seconds on a graph 10 pixels high with 100 bytes/sec at the top, the newest second is on the left
+        series = Series(4)
+        series.data.Extend([(100, 50, 20), (101, 10, 80), (102, 0, 0)])
+        dc = RasterDC(3, 10, WHITE)
+        graph.DrawGraph(dc, [series], 103, 10, 100, 1, (OL, DL, UL), None)
+
+      # The bottom of each column is the start of the overlap line, which is at y=10 and so just off the graph. In the
+      # second column the overlap is only 1 pixel high, so none of it is drawn and the upload reaches the bottom.
+        self.assertEqual(GetColumn(dc, 0), [WHITE] * 10)
+        self.assertEqual(GetColumn(dc, 1), [WHITE] * 3 + [UL] * 7)
+        self.assertEqual(GetColumn(dc, 2), [WHITE] * 6 + [DL] * 3 + [OL])
+
+    def testPng(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'graph.png')
+
+        dc = RasterDC(3, 10, WHITE)
+        dc.DrawLineList([(0, 10, 0, 0), (1, 10, 1, 5)], (10, 20, 30))
+        dc.SaveFile(path)
+        self.assertEqual(ReadPng(path), (3, 10, dc.pixels))
+
+class RenderTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.dbPath = os.path.join(self.dir, 'bench.db')
+        gendb.Generate(self.dbPath, 4 * 3600)
+
+      # With auto scaling the graph is filled whatever the rates are
+        self.prefsPath = os.path.join(self.dir, 'prefs.db')
+        prefsDb = Db(self.prefsPath, PREFS_PREFIX)
+        prefsDb.CreateConfigTable()
+        prefsDb.SavePrefs({'autoscale' : 'True'})
+        prefsDb.Close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def Render(self, backend, zoom):
+        path = os.path.join(self.dir, '%s-%d.png' % (backend, zoom))
+        opts = {'width' : 150, 'height' : 85, 'zoom' : zoom, 'backend' : backend, 'prefs' : self.prefsPath}
+        Render((self.dbPath, gendb.END_TS - 600, path, opts))
+        return path
+
+    def testPython(self):
+      # The default colours are a white background with download in red
+        for zoom in (1, 60):
+            width, height, pixels = ReadPng(self.Render('python', zoom))
+            self.assertEqual((width, height), (150, 85))
+            colours = set([tuple(pixels[i:i + 3]) for i in range(0, len(pixels), 3)])
+            self.assertTrue(WHITE in colours and (255, 0, 0) in colours)
+            if zoom > 1:
+                self.assertTrue(graph.GetPeakColour((255, 0, 0), WHITE) in colours)
+
+    @unittest.skipIf(wx == None, 'wx is not installed')
+    def testSameAsWx(self):
+      # The two backends make the same pixels, in particular wx doesn't draw the last point of each line either
+        for zoom in (1, 60):
+            pythonPath, wxPath = self.Render('python', zoom), self.Render('wx', zoom)
+            images = [wx.Image(path, wx.BITMAP_TYPE_PNG) for path in (pythonPath, wxPath)]
+            self.assertEqual(bytearray(images[0].GetData()), bytearray(images[1].GetData()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""
+Tests for stats.py, comparing the rolling statistics with the same values worked out the slow way.
+"""
+
+import math
+import random
+import unittest
+
+import stats
+from stats import SlidingMax, RateSketch, Window, Stats
+
+def GetPercentile(values, p):
+    values = sorted(values)
+    return values[int(math.ceil(len(values) * p / 100.0)) - 1]
+
+class SlidingMaxTest(unittest.TestCase):
+    def testRandom(self):
+        rnd = random.Random(0)
+        sliding = SlidingMax()
+        values = []
+        ts = 0
+        for i in range(5000):
+            ts += rnd.randint(0, 2)
+            value = rnd.randint(0, 1000)
+            sliding.Add(ts, value)
+            values.append((ts, value))
+            if rnd.random() < 0.3:
+                cutoff = ts - rnd.randint(0, 50)
+                sliding.DropBefore(cutoff)
+                values = [item for item in values if item[0] >= cutoff]
+            self.assertEqual(sliding.Max(), max([value for t, value in values] + [0]))
+
+    def testLate(self):
+      # A value that arrives after newer ones is kept until the newest one is dropped
+        sliding = SlidingMax()
+        sliding.Add(10, 5)
+        sliding.Add(8, 7)
+        sliding.DropBefore(10)
+        self.assertEqual(sliding.Max(), 7)
+        sliding.DropBefore(11)
+        self.assertEqual(sliding.Max(), 0)
+
+    def testClear(self):
+        sliding = SlidingMax()
+        sliding.Add(10, 5)
+        sliding.Clear()
+        sliding.Add(3, 1)
+        self.assertEqual(sliding.Max(), 1)
+
+class RateSketchTest(unittest.TestCase):
+    def testAccuracy(self):
+        rnd = random.Random(0)
+        sketch = RateSketch()
+        values = [int(rnd.expovariate(1.0) * 100000) for i in range(10000)]
+        for value in values:
+            sketch.Add(value)
+        for p in (1, 50, 90, 95, 99, 100):
+            expected = GetPercentile(values, p)
+            self.assertTrue(abs(sketch.Percentile(p) - expected) <= expected * 0.01 + 1, p)
+
+      # Taking values away gives the same answers as never having added them
+        for value in values[5000:]:
+            sketch.Remove(value)
+        expected = GetPercentile(values[:5000], 95)
+        self.assertTrue(abs(sketch.Percentile(95) - expected) <= expected * 0.01 + 1)
+
+    def testSmallValues(self):
+        sketch = RateSketch()
+        self.assertEqual(sketch.Percentile(95), 0)
+        for value in (0, 0, 0, 1, 2):
+            sketch.Add(value)
+        self.assertEqual(sketch.Percentile(50), 0)
+        self.assertEqual(sketch.Percentile(100), 2)
+
+class WindowTest(unittest.TestCase):
+    def testRandom(self):
+      # Samples in order with some seconds missing, and sometimes a second sample (from another host) for the newest second
+        rnd = random.Random(1)
+        window = Window(100, percentiles=True)
+        samples = {}
+        ts = 1000
+        for i in range(2000):
+            if rnd.random() < 0.8:
+                ts += rnd.randint(1, 3)
+            if i == 0:
+                firstTs = ts
+            dl, ul = rnd.randint(0, 100000), rnd.randint(0, 1000)
+            window.Add(ts, dl, ul)
+            prev = samples.get(ts, (0, 0))
+            samples[ts] = (prev[0] + dl, prev[1] + ul)
+
+            visible = [value for t, value in samples.items() if t > ts - 100]
+            dlTotal = sum([dl for dl, ul in visible])
+            ulTotal = sum([ul for dl, ul in visible])
+            seconds = min(100, ts - firstTs + 1)
+            self.assertEqual(window.Total(), (dlTotal, ulTotal))
+            self.assertEqual(window.Average(), (dlTotal // seconds, ulTotal // seconds))
+            self.assertEqual(window.Peak(), (max([dl for dl, ul in visible]), max([ul for dl, ul in visible])))
+            if i % 50 == 0:
+                for actual, values in zip(window.Percentile(95), zip(*visible)):
+                    expected = GetPercentile(values, 95)
+                    self.assertTrue(abs(actual - expected) <= expected * 0.01 + 1)
+
+    def testLate(self):
+      # Samples that arrive after newer ones are added to the totals, unless they are too old to be in the window
+        window = Window(10)
+        window.Add(100, 1, 2)
+        window.Add(105, 10, 20)
+        window.Add(103, 100, 200)
+        window.Add(100, 1000, 2000)
+        window.Add(95, 5, 5)
+        self.assertEqual(window.Total(), (1111, 2222))
+        self.assertEqual([ts for ts, dl, ul in window.samples], [100, 103, 105])
+        window.Add(110, 0, 0)
+        self.assertEqual(window.Total(), (110, 220))
+
+    def testSetSeconds(self):
+        window = Window(10)
+        for ts in range(100, 110):
+            window.Add(ts, ts, 1)
+        window.SetSeconds(3)
+        self.assertEqual(window.Total(), (107 + 108 + 109, 3))
+        self.assertEqual(window.Average(), (108, 1))
+        self.assertEqual(window.Peak(), (109, 1))
+
+class StatsTest(unittest.TestCase):
+    def testGet(self):
+        s = Stats(400)
+        s.Extend([(ts, 1000, 100) for ts in range(1000, 1600)] + [(1600, 61000, 100, 0)])
+        self.assertEqual(s.Get(stats.NOW, 1601), (61000, 100))
+        self.assertEqual(s.Get(stats.NOW, 1600), (1000, 100))
+        self.assertEqual(s.Get(stats.NOW, 1700), (0, 0))
+        self.assertEqual(s.Get(stats.AVG_1M, 1601), (2000, 100))
+        self.assertEqual(s.Get(stats.AVG_5M, 1601), (1200, 100))
+        self.assertEqual(s.Get(stats.AVG_WINDOW, 1601), (1150, 100))
+        self.assertEqual(s.Get(stats.TOTAL, 1601), (460000, 40000))
+        self.assertEqual(s.Get(stats.PEAK, 1601), (61000, 100))
+        self.assertTrue(abs(s.Get(stats.P95, 1601)[0] - 1000) <= 10)
+        self.assertRaises(KeyError, s.Get, 'median', 1601)
+
+    def testStart(self):
+      # Only the time since the first sample counts towards the averages, but the gaps after it count as zero
+        s = Stats(400)
+        s.Extend([(1000, 600, 60), (1009, 600, 60)])
+        self.assertEqual(s.Get(stats.AVG_1M, 1010), (120, 12))
+        s.SetWindow(5)
+        self.assertEqual(s.Get(stats.AVG_WINDOW, 1010), (120, 12))
+        s.Clear()
+        self.assertEqual(s.Get(stats.AVG_1M, 1010), (0, 0))
+
+if __name__ == '__main__':
+    unittest.main()